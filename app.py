@@ -1,129 +1,341 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, make_response, Response, stream_with_context
+from sqlalchemy.schema import CreateIndex
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from models import db, User
-from werkzeug.security import generate_password_hash, check_password_hash
 from os import environ
 from dotenv import load_dotenv
 import logging
-import boto3
 from botocore.exceptions import ClientError
 from datetime import datetime
 import watchtower
 import logging.handlers
 from email_service import EmailService
-from sqs_service import SQSService
-from cache_routes import cache_bp
-import json
+from email_dispatcher import EmailDispatcher, WELCOME_TEMPLATE, WELCOME_SUBJECT, WELCOME_TEXT, WELCOME_HTML
+from sqs_service import SQSService, SQSSendAggregator
+from payload_store import PayloadError, payload_codec_from_config
+from message_stream import MessageBroadcaster
+from cache_routes import cache_bp, mc, near_cache, namespaces as cache_namespaces
+from local_cache import LRUCache
+from user_cache import UserCache
+from user_queries import page_users, approximate_user_count, export_users_ndjson, export_users_csv
+from user_import import parse_upload, import_users
+from password_hashing import PasswordHasher, HashingOverloaded
+from db_pool import engine_options, install_pool_events, check_connection, pool_status, reset_pools_after_fork
+from db_routing import init_replicas, start_replica_router
+from message_handlers import process_message
+from config_loader import get_config
+from logging_setup import configure_logging, init_request_logging, stop_logging
+from metrics import init_metrics, instrument, registry as metrics_registry
+from fanout import fan_out, gevent_active, patch_psycopg
+from json_provider import init_json, raw_json
+from compression import init_compression
+from http_caching import init_page_cache, init_static_assets, init_template_cache, preload_templates, render_cached
+from rate_limit import limiter_from_env
+from aws_clients import aws_client, breaker_status, breaker_gauges
+from resources import resources
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Initialize email service
-email_service = EmailService()
+main_bp = Blueprint('main', __name__)
 
-# Initialize SQS service
-sqs_service = SQSService()
+# Network-backed services are created by create_app() and re-created in each
+# worker after fork (see resources.py and gunicorn.conf.py)
+log_listener = None
+email_service = None
+email_dispatcher = None
+sqs_service = None
+sqs_sender = None
+message_broadcaster = None
+db_settings = {}
 
-# Configure CloudWatch logging
-try:
-    cloudwatch_handler = watchtower.CloudWatchLogHandler(
-        log_group='/flask-app/application',
-        stream_name=datetime.now().strftime('%Y-%m-%d-%H-%M-%S'),
-        boto3_client=boto3.client('logs', region_name='us-east-1'),
-        create_log_group=True
-    )
-    logger.addHandler(cloudwatch_handler)
-    logger.info("CloudWatch logging configured successfully")
-except Exception as e:
-    logger.error(f"Failed to configure CloudWatch logging: {str(e)}")
-    cloudwatch_handler = None
-
-# Add CloudWatch logging to Flask
-app = Flask(__name__)
-if cloudwatch_handler:
-    app.logger.addHandler(cloudwatch_handler)
-
-def get_ssm_parameter(param_name, with_decryption=False):
+# Bounded executor for password hashing so login bursts can't starve other routes
+password_hasher = PasswordHasher()
+
+# Receives above 10 messages fan out into concurrent ReceiveMessage calls
+MAX_RECEIVE_MESSAGES = int(environ.get('MAX_RECEIVE_MESSAGES', 100))
+
+# Per-client rate limits shared through memcached, and per-worker load shedding (SHED_MAX_IN_FLIGHT)
+limiter = limiter_from_env(mc, shed_exempt={'main.stream_messages'})
+RATE_LIMIT_LOGIN = environ.get('RATE_LIMIT_LOGIN', '20/minute')
+RATE_LIMIT_LOGIN_USERNAME = environ.get('RATE_LIMIT_LOGIN_USERNAME', '5/minute')
+RATE_LIMIT_REGISTER = environ.get('RATE_LIMIT_REGISTER', '5/minute')
+RATE_LIMIT_MESSAGES = environ.get('RATE_LIMIT_MESSAGES', '600/minute')
+
+login_manager = LoginManager()
+login_manager.login_view = 'main.landing'
+
+# Identity cache so authenticated page views don't hit Postgres
+user_cache = UserCache(
+    LRUCache(
+        maxsize=int(environ.get('USER_CACHE_SIZE', 1024)),
+        ttl=float(environ.get('USER_CACHE_LOCAL_TTL', 2))
+    ),
+    mc,
+    remote_ttl=int(environ.get('USER_CACHE_TTL', 300)),
+    tombstone_ttl=int(environ.get('USER_CACHE_TOMBSTONE_TTL', 60))
+)
+
+def init_logging():
     """
-    Get a parameter from AWS Systems Manager Parameter Store
+    Configure logging: request threads only enqueue, a listener thread writes to stdout/CloudWatch.
+    Called again in each forked worker, since the listener thread does not survive the fork.
     """
+    global log_listener
     try:
-        ssm = boto3.client('ssm', region_name='us-east-1')
-        response = ssm.get_parameter(
-            Name=param_name,
-            WithDecryption=with_decryption
+        cloudwatch_handler = watchtower.CloudWatchLogHandler(
+            log_group='/flask-app/application',
+            stream_name=datetime.now().strftime('%Y-%m-%d-%H-%M-%S'),
+            boto3_client=aws_client('logs', region_name='us-east-1', breaker=False),
+            create_log_group=True
         )
-        return response['Parameter']['Value']
-    except ClientError as e:
-        logger.error(f"Failed to get parameter {param_name}: {str(e)}")
-        return None
-
-# Get database credentials from SSM
-db_user = get_ssm_parameter('/flask-app/db/username')
-db_pass = get_ssm_parameter('/flask-app/db/password', with_decryption=True)
-db_host = get_ssm_parameter('/flask-app/db/host')
-db_port = get_ssm_parameter('/flask-app/db/port')
-db_name = get_ssm_parameter('/flask-app/db/name')
-flask_secret = get_ssm_parameter('/flask-app/secret-key', with_decryption=True)
-
-# Load environment variables
-load_dotenv()
-
-app.secret_key = flask_secret or environ.get('FLASK_SECRET_KEY')
-
-# Database configuration
-db_host = db_host or environ.get('DB_HOST', 'localhost')
-db_port = db_port or environ.get('DB_PORT', '5432')
-db_name = db_name or environ.get('DB_NAME', 'flaskapp')
-db_user = db_user or environ.get('DB_USERNAME', 'postgres')
-db_pass = db_pass or environ.get('DB_PASSWORD', '')
-
-# Log database connection details (excluding password)
-logger.info(f"Connecting to database at {db_host}:{db_port}/{db_name} as {db_user}")
-
-# Test database connection
-try:
-    engine = db.create_engine(f"postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}")
-    connection = engine.connect()
-    connection.close()
-    logger.info("Database connection test successful")
-except Exception as e:
-    logger.error(f"Database connection test failed: {str(e)}", exc_info=True)
-    raise
-
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    f"postgresql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
-)
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        cloudwatch_error = None
+    except Exception as e:
+        cloudwatch_handler = None
+        cloudwatch_error = e
+
+    log_listener = configure_logging([cloudwatch_handler])
+    if cloudwatch_handler:
+        logger.info("CloudWatch logging configured successfully")
+    else:
+        logger.error(f"Failed to configure CloudWatch logging: {str(cloudwatch_error)}")
+
+def init_services():
+    """Create the AWS-backed services used by the routes"""
+    global email_service, email_dispatcher, sqs_service, sqs_sender, message_broadcaster
+
+    # Background email delivery so requests don't wait on SES
+    email_service = EmailService()
+    email_dispatcher = EmailDispatcher(email_service)
+    email_dispatcher.register_template(WELCOME_TEMPLATE, WELCOME_SUBJECT, WELCOME_TEXT, WELCOME_HTML)
+
+    # Large bodies are compressed, oversized ones offloaded to the payload store (claim check)
+    sqs_service = SQSService(payload_codec=payload_codec_from_config())
+
+    # One shared long-poll fetcher per worker feeding every open /api/messages/stream
+    message_broadcaster = MessageBroadcaster(
+        sqs_service,
+        queue_size=int(environ.get('SSE_QUEUE_SIZE', 100)),
+        heartbeat=float(environ.get('SSE_HEARTBEAT', 15)),
+        max_subscribers=int(environ.get('SSE_MAX_SUBSCRIBERS', 100))
+    )
 
-# Initialize extensions
-db.init_app(app)
+    # Optionally coalesce concurrent single sends into SendMessageBatch calls
+    sqs_send_linger_ms = int(environ.get('SQS_SEND_LINGER_MS', 0))
+    sqs_sender = SQSSendAggregator(sqs_service, linger_ms=sqs_send_linger_ms) if sqs_send_linger_ms > 0 else sqs_service
 
-# Register blueprints
-app.register_blueprint(cache_bp)
+def configure_database(app):
+    """Point SQLAlchemy at the primary and read replicas from the SSM config"""
+    # Shared SSM config: one batched fetch of /flask-app/, cached on disk
+    config = get_config()
 
-# Initialize Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'landing'
+    # Load environment variables
+    load_dotenv()
+
+    app.secret_key = config.get('/flask-app/secret-key') or environ.get('FLASK_SECRET_KEY')
+
+    # Database configuration
+    db_settings.update(
+        host=config.get('/flask-app/db/host') or environ.get('DB_HOST', 'localhost'),
+        port=config.get('/flask-app/db/port') or environ.get('DB_PORT', '5432'),
+        name=config.get('/flask-app/db/name') or environ.get('DB_NAME', 'flaskapp'),
+        user=config.get('/flask-app/db/username') or environ.get('DB_USERNAME', 'postgres')
+    )
+    db_pass = config.get('/flask-app/db/password') or environ.get('DB_PASSWORD', '')
+    credentials = f"{db_settings['user']}:{db_pass}"
+
+    # Read replicas: comma-separated host[:port] list, same credentials and database
+    db_replica_hosts = config.get('/flask-app/db/replica-hosts') or environ.get('DB_REPLICA_HOSTS', '')
+    db_replica_uris = []
+    for replica in filter(None, (item.strip() for item in db_replica_hosts.split(','))):
+        replica_host, _, replica_port = replica.partition(':')
+        db_replica_uris.append(
+            f"postgresql://{credentials}@{replica_host}:{replica_port or db_settings['port']}/{db_settings['name']}"
+        )
+
+    # Log database connection details (excluding password)
+    logger.info(f"Connecting to database at {db_settings['host']}:{db_settings['port']}/{db_settings['name']} "
+                f"as {db_settings['user']}")
+
+    # DATABASE_URL overrides the SSM settings, e.g. sqlite:///bench.db for local benchmarks
+    app.config['SQLALCHEMY_DATABASE_URI'] = environ.get('DATABASE_URL') or (
+        f"postgresql://{credentials}@{db_settings['host']}:{db_settings['port']}/{db_settings['name']}"
+    )
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    init_replicas(app, db, db_replica_uris, engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+def register_resources(app):
+    """
+    Everything holding sockets or threads, in the order a forked worker re-creates it
+    """
+    def reopen_database():
+        with app.app_context():
+            reset_pools_after_fork(db.engines.values())
+        db.replica_router.start()
+
+    def close_database():
+        db.replica_router.stop()
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    resources.register('logging', init_logging, close=stop_logging)
+    resources.register('config', get_config().reconnect, close=get_config().stop_refresher)
+    resources.register('ses', email_service.reconnect)
+    resources.register('sqs', sqs_service.reconnect)
+    resources.register('memcached', mc.reconnect, close=mc.close)
+    resources.register('database', reopen_database, close=close_database)
+    resources.register('email_dispatcher', email_dispatcher.reset_after_fork, close=email_dispatcher.shutdown)
+    resources.register('metrics', metrics_registry.after_fork, close=metrics_registry.stop)
+
+def create_app():
+    """
+    Build the application and its services.
+
+    Under gunicorn --preload (see gunicorn.conf.py) this runs once in the
+    master: imports, the SSM config and compiled templates are then shared
+    copy-on-write by every worker, and the post_fork hook re-creates each
+    registered resource so no socket, pool or thread is shared across processes.
+    """
+    init_logging()
+    init_services()
+
+    # Flask's app.logger propagates to the root queue handler
+    app = Flask(__name__)
+
+    # Fast JSON encoding; compression is registered first so it runs after every other after_request hook
+    init_json(app)
+    init_compression(app)
+
+    # Behind nginx, take the client address from X-Forwarded-For (TRUSTED_PROXIES hops)
+    trusted_proxies = int(environ.get('TRUSTED_PROXIES', 0))
+    if trusted_proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies, x_proto=trusted_proxies)
+
+    limiter.init_app(app)
+    configure_database(app)
+
+    # Under a gevent worker, let Postgres waits yield to other requests
+    patch_psycopg()
+
+    # Initialize extensions
+    db.init_app(app)
+    start_replica_router(
+        app, db,
+        check_interval=int(environ.get('DB_REPLICA_CHECK_INTERVAL', 10)),
+        max_lag=float(environ.get('DB_REPLICA_MAX_LAG', 30)),
+        read_after_write_window=float(environ.get('DB_READ_AFTER_WRITE_WINDOW', 5))
+    )
+
+    # Test database connection through the application's own pool
+    with app.app_context():
+        install_pool_events(db.engine)
+        try:
+            check_connection(db.engine)
+            logger.info("Database connection test successful")
+        except Exception as e:
+            logger.error(f"Database connection test failed: {str(e)}", exc_info=True)
+            raise
+
+    # Register blueprints
+    app.register_blueprint(cache_bp)
+    app.register_blueprint(main_bp)
+
+    # Conditional GETs for static-content pages, fingerprinted static URLs, compiled template cache
+    init_page_cache(app)
+    init_static_assets(app)
+    init_template_cache(app)
+    preload_templates(app)
+
+    # Initialize Flask-Login
+    login_manager.init_app(app)
+
+    # Add request logging middleware (sampled, structured)
+    init_request_logging(app, logger)
+
+    # Per-endpoint latency histograms, dependency timings, Server-Timing and /metrics
+    init_metrics(app)
+    instrument(sqs_service, 'sqs', ['send_message', 'send_entries', 'receive_messages', 'delete_message',
+                                    'delete_messages', 'change_visibility'])
+    instrument(email_service, 'ses', ['deliver', 'send_bulk_templated_email'])
+    instrument(mc, 'memcached', ['get', 'set', 'delete', 'add', 'incr', 'get_multi', 'set_multi', 'delete_multi'])
+    metrics_registry.register_gauges('flask_app_email', email_dispatcher.stats)
+    metrics_registry.register_gauges('flask_app_password_hashing', password_hasher.stats)
+    metrics_registry.register_gauges('flask_app_near_cache', near_cache.stats)
+    metrics_registry.register_gauges('flask_app_cache_namespaces', cache_namespaces.stats)
+    metrics_registry.register_gauges('flask_app_message_stream', message_broadcaster.stats)
+    metrics_registry.register_gauges('flask_app_rate_limit', limiter.stats)
+    metrics_registry.register_gauges('flask_app_aws_breaker', breaker_gauges)
+
+    register_resources(app)
+
+    # The deploy runs `flask --app app:create_app init-db` before gunicorn starts (terraform/user_data.sh)
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables and indexes"""
+        init_db(app)
+
+    return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), lambda uid: User.query.get(uid))
+
+def queue_welcome_email(username, email, created_by=None):
+    """
+    Queue the welcome email for background delivery.
+    Returns False if the email queue is full.
+    """
+    if created_by:
+        created = f"Your account has been created by {created_by}."
+    else:
+        created = "Your account has been successfully created."
+    welcome_text = f"""
+        Hi {username},
+
+        Welcome to Flask App! {created}
 
-@app.route('/')
+        Best regards,
+        Flask App Team
+    """
+    welcome_html = f"""
+        <h2>Welcome to Flask App!</h2>
+        <p>Hi {username},</p>
+        <p>Welcome to Flask App! {created}</p>
+        <p>Best regards,<br>Flask App Team</p>
+    """
+    return email_dispatcher.enqueue(
+        email, WELCOME_SUBJECT, welcome_text, welcome_html,
+        template=WELCOME_TEMPLATE,
+        template_data={'username': username, 'created_by': created_by or ''}
+    )
+
+def login_username():
+    return request.form.get('username', '').strip().lower()
+
+def form_rate_limited(template):
+    """on_limit handler re-rendering a form page with a flashed message"""
+    def on_limit(retry_after):
+        flash(f'Too many attempts, please try again in {retry_after} seconds.', 'warning')
+        return render_template(template), 429, {'Retry-After': str(retry_after)}
+    return on_limit
+
+@main_bp.route('/')
 def landing():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
-    return render_template('landing.html')
+        return redirect(url_for('main.home'))
+    return render_cached('landing.html')
 
-@app.route('/home')
+@main_bp.route('/home')
 @login_required
 def home():
-    return render_template('home.html')
+    return render_cached('home.html', variant=(current_user.id, current_user.username))
 
-@app.route('/login/', methods=['GET', 'POST'])
+@main_bp.route('/login/', methods=['GET', 'POST'])
+@limiter.limit(RATE_LIMIT_LOGIN, key='ip', methods=['POST'], on_limit=form_rate_limited('login.html'))
+@limiter.limit(RATE_LIMIT_LOGIN_USERNAME, key=login_username, scope='login-username', methods=['POST'],
+               on_limit=form_rate_limited('login.html'))
 def login():
     logger.debug("Login route accessed")
     if request.method == 'POST':
@@ -135,12 +347,22 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         try:
-            if user and check_password_hash(user.password, password):
+            if user and password_hasher.check(user.password, password):
                 logger.debug(f"Login successful for user: {username}")
+                new_hash = password_hasher.upgrade(user.password, password)
+                if new_hash:
+                    # The user cache never holds the password hash, so it needs no invalidation here
+                    user.password = new_hash
+                    db.session.commit()
+                    logger.info(f"Upgraded password hash for user: {username}")
                 login_user(user)
-                return redirect(url_for('home'))
+                return redirect(url_for('main.home'))
             logger.debug(f"Login failed for user: {username}")
             flash('Invalid username or password')
+        except HashingOverloaded as e:
+            logger.warning(f"Login for {username} rejected, password hashing overloaded")
+            flash('The server is busy, please try again in a moment.', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             logger.error(f"Error during login: {str(e)}", exc_info=True)
             db.session.rollback()
@@ -148,7 +370,8 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/register/', methods=['GET', 'POST'])
+@main_bp.route('/register/', methods=['GET', 'POST'])
+@limiter.limit(RATE_LIMIT_REGISTER, key='ip', methods=['POST'], on_limit=form_rate_limited('register.html'))
 def register():
     logger.debug(f"Register route accessed with method: {request.method}")
     if request.method == 'POST':
@@ -161,39 +384,27 @@ def register():
             if User.query.filter_by(username=username).first():
                 logger.debug(f"Username {username} already exists")
                 flash('Username already exists')
-                return redirect(url_for('register'))
+                return redirect(url_for('main.register'))
 
-            hashed_password = generate_password_hash(password)
+            hashed_password = password_hasher.generate(password)
             new_user = User(username=username, password=hashed_password, email=email)
             db.session.add(new_user)
             db.session.commit()
             logger.debug(f"User {username} registered successfully")
 
-            # Send welcome email
-            welcome_subject = "Welcome to Flask App!"
-            welcome_text = f"""
-                Hi {username},
-                
-                Welcome to Flask App! Your account has been successfully created.
-                
-                Best regards,
-                Flask App Team
-            """
-            welcome_html = f"""
-                <h2>Welcome to Flask App!</h2>
-                <p>Hi {username},</p>
-                <p>Welcome to Flask App! Your account has been successfully created.</p>
-                <p>Best regards,<br>Flask App Team</p>
-            """
-            
-            if email_service.send_email(email, welcome_subject, welcome_text, welcome_html):
-                logger.info(f"Welcome email sent to {email}")
+            # Queue welcome email
+            if queue_welcome_email(username, email):
+                logger.info(f"Welcome email queued for {email}")
             else:
                 flash("Account created successfully! However, we couldn't send the welcome email. "
                       "You can still proceed to login.", 'warning')
 
             flash('Registration successful! Please login.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
+        except HashingOverloaded as e:
+            logger.warning(f"Registration for {username} rejected, password hashing overloaded")
+            flash('The server is busy, please try again in a moment.', 'warning')
+            return render_template('register.html'), 503, {'Retry-After': str(e.retry_after)}
         except Exception as e:
             logger.error(f"Error during registration: {str(e)}", exc_info=True)
             db.session.rollback()
@@ -201,50 +412,145 @@ def register():
 
     return render_template('register.html')
 
-@app.route('/logout')
+@main_bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/test-ssm')
+@main_bp.route('/test-ssm')
 def test_ssm():
     if not current_user.is_authenticated:
         return {"error": "Unauthorized"}, 401
         
     return {
-        "db_host": db_host,
-        "db_port": db_port,
-        "db_name": db_name,
-        "db_user": db_user,
+        "db_host": db_settings['host'],
+        "db_port": db_settings['port'],
+        "db_name": db_settings['name'],
+        "db_user": db_settings['user'],
         "connected": db.session.is_active
     }
 
-@app.route('/users')
+USERS_PAGE_SIZE = int(environ.get('USERS_PAGE_SIZE', 50))
+USERS_MAX_PAGE_SIZE = int(environ.get('USERS_MAX_PAGE_SIZE', 500))
+
+def _users_page_args():
+    """Read keyset pagination and search arguments from the query string"""
+    per_page = request.args.get('per_page', default=USERS_PAGE_SIZE, type=int)
+    return {
+        'per_page': max(1, min(per_page, USERS_MAX_PAGE_SIZE)),
+        'after_id': request.args.get('after', type=int),
+        'before_id': request.args.get('before', type=int),
+        'q': request.args.get('q', default='').strip() or None
+    }
+
+@main_bp.route('/users')
 @login_required
 def list_users():
     try:
-        users = User.query.all()
-        logger.info(f"Users: {users}")
-        return render_template('users.html', users=users)
+        args = _users_page_args()
+        users, next_after, prev_before = page_users(**args)
+        total, total_is_estimate = approximate_user_count(args['q'])
+        logger.debug(f"Listed {len(users)} users")
+        return render_template(
+            'users.html',
+            users=users,
+            next_after=next_after,
+            prev_before=prev_before,
+            total=total,
+            total_is_estimate=total_is_estimate,
+            q=args['q'] or '',
+            per_page=args['per_page']
+        )
     except Exception as e:
         logger.error(f"Error fetching users: {str(e)}")
         flash('Error fetching users list')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
+
+@main_bp.route('/api/users')
+@login_required
+def api_list_users():
+    try:
+        args = _users_page_args()
+        users, next_after, prev_before = page_users(**args)
+        total, total_is_estimate = approximate_user_count(args['q'])
+        return jsonify({
+            'users': [
+                {'id': user.id, 'username': user.username, 'email': user.email}
+                for user in users
+            ],
+            'next_after': next_after,
+            'prev_before': prev_before,
+            'per_page': args['per_page'],
+            'total': total,
+            'total_is_estimate': total_is_estimate
+        }), 200
+    except Exception as e:
+        logger.error(f"Error in api_list_users: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main_bp.route('/users/export')
+@login_required
+def export_users():
+    export_format = request.args.get('format', default='ndjson').lower()
+    q = request.args.get('q', default='').strip() or None
+    if export_format == 'csv':
+        rows, mimetype = export_users_csv(q), 'text/csv'
+    elif export_format == 'ndjson':
+        rows, mimetype = export_users_ndjson(q), 'application/x-ndjson'
+    else:
+        return jsonify({'error': "format must be 'ndjson' or 'csv'"}), 400
+
+    logger.info(f"User export ({export_format}) started by {current_user.username}")
+    filename = f"users-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(rows),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@main_bp.route('/users/import', methods=['POST'])
+@login_required
+def import_users_route():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file provided'}), 400
+
+    try:
+        report, created = import_users(parse_upload(upload))
+    except HashingOverloaded as e:
+        logger.warning("User import rejected, another import is hashing passwords")
+        db.session.rollback()
+        return jsonify({'error': 'Another import is in progress, please retry shortly'}), 503, \
+            {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        logger.error(f"Error importing users: {str(e)}", exc_info=True)
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/users/delete/<int:user_id>', methods=['POST'])
+    logger.info(f"{report['created']} users imported by {current_user.username}")
+    if request.form.get('send_welcome', '').lower() in ('1', 'true', 'on', 'yes'):
+        queued = sum(
+            1 for user in created
+            if user['email'] and queue_welcome_email(user['username'], user['email'], created_by=current_user.username)
+        )
+        report['welcome_emails_queued'] = queued
+    return jsonify(report), 200
+
+@main_bp.route('/users/delete/<int:user_id>', methods=['POST'])
 @login_required
 def delete_user(user_id):
     try:
         # Prevent users from deleting themselves
         if current_user.id == user_id:
             flash('You cannot delete your own account.', 'error')
-            return redirect(url_for('list_users'))
+            return redirect(url_for('main.list_users'))
 
         user = User.query.get_or_404(user_id)
         username = user.username
         db.session.delete(user)
         db.session.commit()
+        user_cache.tombstone(user_id)
         
         logger.info(f"User {username} (ID: {user_id}) deleted by {current_user.username}")
         flash(f'User {username} has been deleted successfully.', 'success')
@@ -253,9 +559,9 @@ def delete_user(user_id):
         db.session.rollback()
         flash('An error occurred while deleting the user.', 'error')
     
-    return redirect(url_for('list_users'))
+    return redirect(url_for('main.list_users'))
 
-@app.route('/users/add', methods=['POST'])
+@main_bp.route('/users/add', methods=['POST'])
 @login_required
 def add_user():
     try:
@@ -266,108 +572,96 @@ def add_user():
         # Check if username already exists
         if User.query.filter_by(username=username).first():
             flash('Username already exists', 'error')
-            return redirect(url_for('list_users'))
+            return redirect(url_for('main.list_users'))
 
         # Create new user
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_hasher.generate(password)
         new_user = User(username=username, password=hashed_password, email=email)
         db.session.add(new_user)
         db.session.commit()
+        # Ids can be reused (e.g. SQLite rowids): drop a deleted user's tombstone or cached row
+        user_cache.invalidate(new_user.id)
         
         logger.info(f"New user {username} created by {current_user.username}")
         flash(f'User {username} has been created successfully.', 'success')
         
-        # Send welcome email
-        welcome_subject = "Welcome to Flask App!"
-        welcome_text = f"""
-            Hi {username},
-            
-            Welcome to Flask App! Your account has been created by {current_user.username}.
-            
-            Best regards,
-            Flask App Team
-        """
-        welcome_html = f"""
-            <h2>Welcome to Flask App!</h2>
-            <p>Hi {username},</p>
-            <p>Welcome to Flask App! Your account has been created by {current_user.username}.</p>
-            <p>Best regards,<br>Flask App Team</p>
-        """
-        
-        if email_service.send_email(email, welcome_subject, welcome_text, welcome_html):
-            logger.info(f"Welcome email sent to {email}")
+        # Queue welcome email
+        if queue_welcome_email(username, email, created_by=current_user.username):
+            logger.info(f"Welcome email queued for {email}")
         else:
             flash("User created successfully! However, we couldn't send the welcome email.", 'warning')
             
+    except HashingOverloaded as e:
+        logger.warning("Creating user rejected, password hashing overloaded")
+        flash('The server is busy, please try again in a moment.', 'warning')
+        # Render the users page in place so the 503 and Retry-After reach the client
+        response = make_response(list_users())
+        if response.status_code == 200:
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response
     except Exception as e:
         logger.error(f"Error creating user: {str(e)}")
         db.session.rollback()
         flash('An error occurred while creating the user.', 'error')
     
-    return redirect(url_for('list_users'))
+    return redirect(url_for('main.list_users'))
 
 # Create database tables
-def init_db():
+def init_db(app):
     with app.app_context():
         try:
             db.create_all()
+            # create_all skips existing tables, so add indexes introduced later explicitly.
+            # checkfirst can't see expression indexes on every backend, so let the database skip them
+            with db.engine.begin() as connection:
+                for index in User.__table__.indexes:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
             logger.info("Database tables created successfully")
         except Exception as e:
             logger.error(f"Error creating database tables: {str(e)}", exc_info=True)
             raise
 
-# Add request logging middleware
-@app.before_request
-def log_request_info():
-    logger.info('Request: %s %s', request.method, request.url)
-    logger.debug('Headers: %s', dict(request.headers))
-    if request.method in ['POST', 'PUT']:
-        logger.debug('Body: %s', request.get_data())
-
-@app.after_request
-def log_response_info(response):
-    logger.info('Response: %s %s - %s', request.method, request.url, response.status)
-    return response
-
-@app.errorhandler(Exception)
+@main_bp.app_errorhandler(Exception)
 def handle_error(error):
     logger.exception('An error occurred: %s', str(error))
     return 'Internal Server Error', 500
 
-@app.errorhandler(404)
+@main_bp.app_errorhandler(404)
 def not_found_error(error):
     logger.error(f"Page not found: {request.url}")
     error_message = f"The page '{request.url}' was not found on our server."
     return render_template('404.html', error_message=error_message), 404
 
-@app.errorhandler(500)
+@main_bp.app_errorhandler(500)
 def internal_error(error):
     logger.error(f"Server error: {error}")
     db.session.rollback()
-    error_details = str(error) if app.debug else "We're experiencing technical difficulties."
+    error_details = str(error) if current_app.debug else "We're experiencing technical difficulties."
     return render_template('500.html', error_details=error_details), 500
 
-@app.errorhandler(401)
+@main_bp.app_errorhandler(401)
 def unauthorized_error(error):
     logger.error(f"Unauthorized access attempt: {request.url}")
     flash('Please log in to access this page')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.errorhandler(403)
+@main_bp.app_errorhandler(403)
 def forbidden_error(error):
     logger.error(f"Forbidden access attempt: {request.url}")
     flash('You do not have permission to access this page')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/api/messages', methods=['POST'])
+@main_bp.route('/api/messages', methods=['POST'])
 @login_required
+@limiter.limit(RATE_LIMIT_MESSAGES, key='user', scope='messages')
 def send_message():
     try:
         data = request.get_json()
         if not data or 'message' not in data:
             return jsonify({'error': 'No message provided'}), 400
 
-        success, message_id = sqs_service.send_message(data)
+        success, message_id = sqs_sender.send_message(data)
         
         if success:
             logger.info(f"Message sent successfully with ID: {message_id}")
@@ -386,22 +680,70 @@ def send_message():
         logger.error(f"Error in send_message: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/messages', methods=['GET'])
+@main_bp.route('/api/messages/batch', methods=['POST'])
+@login_required
+@limiter.limit(RATE_LIMIT_MESSAGES, key='user', scope='messages')
+def send_message_batch():
+    try:
+        data = request.get_json()
+        messages = data.get('messages') if isinstance(data, dict) else None
+        if not isinstance(messages, list) or not messages:
+            return jsonify({'error': 'No messages provided'}), 400
+        if not all(isinstance(message, dict) and 'message' in message for message in messages):
+            return jsonify({'error': "Every entry needs a 'message' field"}), 400
+
+        results = sqs_service.send_messages(messages)
+        failed = sum(1 for result in results if result['status'] != 'success')
+        logger.info(f"Batch send: {len(results) - failed} sent, {failed} failed")
+
+        if failed == 0:
+            status, code = 'success', 200
+        elif failed < len(results):
+            status, code = 'partial', 207
+        else:
+            status, code = 'error', 500
+        return jsonify({
+            'status': status,
+            'sent': len(results) - failed,
+            'failed': failed,
+            'results': results
+        }), code
+
+    except Exception as e:
+        logger.error(f"Error in send_message_batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main_bp.route('/api/messages', methods=['GET'])
 @login_required
+@limiter.limit(RATE_LIMIT_MESSAGES, key='user', scope='messages')
 def receive_messages():
     try:
-        max_messages = request.args.get('max_messages', default=10, type=int)
-        success, messages = sqs_service.receive_messages(max_messages=max_messages)
+        max_messages = min(max(request.args.get('max_messages', default=10, type=int), 1), MAX_RECEIVE_MESSAGES)
+        wait_time = min(max(request.args.get('wait_time', default=0, type=int), 0), 20)
+        # Offloaded payloads are only fetched on request; otherwise clients get the reference
+        resolve_payloads = request.args.get('resolve_payloads', '').lower() in ('1', 'true', 'yes')
+        success, messages = sqs_service.receive_messages(max_messages=max_messages, wait_time=wait_time)
         
         if success:
-            # Convert messages to more readable format
-            formatted_messages = []
-            for msg in messages:
-                formatted_messages.append({
+            def format_message(msg):
+                formatted = {
                     'message_id': msg['MessageId'],
-                    'body': json.loads(msg['Body']),
                     'receipt_handle': msg['ReceiptHandle']
-                })
+                }
+                payload_ref = sqs_service.payload_ref(msg)
+                if payload_ref:
+                    formatted['payload_ref'] = payload_ref
+                if payload_ref and not resolve_payloads:
+                    formatted['body'] = None
+                else:
+                    # Bodies written by SQSService are embedded as-is; only foreign bodies are validated
+                    formatted['body'] = raw_json(sqs_service.message_body(msg), trusted=sqs_service.body_is_json(msg))
+                return formatted
+
+            # Convert messages to more readable format
+            formatted_messages = fan_out(format_message, messages) if resolve_payloads else [
+                format_message(msg) for msg in messages
+            ]
                 
             return jsonify({
                 'status': 'success',
@@ -417,13 +759,44 @@ def receive_messages():
         logger.error(f"Error in receive_messages: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/messages/<receipt_handle>', methods=['DELETE'])
+@main_bp.route('/api/messages/stream', methods=['GET'])
+@login_required
+def stream_messages():
+    if not gevent_active():
+        # A sync worker would be pinned by each open page; 204 tells EventSource not to reconnect
+        return '', 204
+    subscriber = message_broadcaster.subscribe()
+    if subscriber is None:
+        return jsonify({'error': 'Too many open message streams'}), 503, {'Retry-After': '5'}
+    return Response(
+        message_broadcaster.stream(subscriber),
+        mimetype='text/event-stream',
+        # Stop nginx from buffering events
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@main_bp.route('/api/messages/payload', methods=['GET'])
+@login_required
+def get_message_payload():
+    payload_ref = request.args.get('ref')
+    if not payload_ref:
+        return jsonify({'error': 'No payload reference provided'}), 400
+    try:
+        body = sqs_service.payload_codec.fetch_text(payload_ref)
+    except PayloadError as e:
+        logger.error(f"Error fetching message payload: {str(e)}")
+        return jsonify({'status': 'error', 'error': str(e)}), 404
+    # Only SQSService offloads payloads, and it only sends JSON
+    return jsonify({'status': 'success', 'payload_ref': payload_ref, 'body': raw_json(body, trusted=True)}), 200
+
+@main_bp.route('/api/messages/<receipt_handle>', methods=['DELETE'])
 @login_required
 def delete_message(receipt_handle):
     try:
-        success, result = sqs_service.delete_message(receipt_handle)
+        success, result = sqs_service.delete_message(receipt_handle, request.args.get('payload_ref'))
         
         if success:
+            message_broadcaster.forget([receipt_handle])
             return jsonify({
                 'status': 'success',
                 'message': result
@@ -438,19 +811,37 @@ def delete_message(receipt_handle):
         logger.error(f"Error in delete_message: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# Example message processor function
-def process_message(message_body):
-    """
-    Process received messages (customize this based on your needs)
-    """
-    logger.info(f"Processing message: {message_body}")
-    # Add your message processing logic here
-    
-@app.route('/api/process-messages', methods=['POST'])
+@main_bp.route('/api/messages', methods=['DELETE'])
+@login_required
+def delete_messages():
+    try:
+        data = request.get_json()
+        receipt_handles = data.get('receipt_handles') if isinstance(data, dict) else None
+        if not isinstance(receipt_handles, list) or not receipt_handles:
+            return jsonify({'error': 'No receipt handles provided'}), 400
+        if len(receipt_handles) > MAX_RECEIVE_MESSAGES:
+            return jsonify({'error': f'At most {MAX_RECEIVE_MESSAGES} receipt handles per request'}), 400
+
+        payload_refs = data.get('payload_refs') if isinstance(data.get('payload_refs'), dict) else None
+        success, failed = sqs_service.delete_messages(receipt_handles, payload_refs)
+        message_broadcaster.forget(set(receipt_handles) - set(failed))
+        if success:
+            return jsonify({'status': 'success', 'deleted': len(receipt_handles)}), 200
+        return jsonify({
+            'status': 'partial' if len(failed) < len(receipt_handles) else 'error',
+            'deleted': len(receipt_handles) - len(failed),
+            'failed': failed
+        }), 207 if len(failed) < len(receipt_handles) else 500
+
+    except Exception as e:
+        logger.error(f"Error in delete_messages: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main_bp.route('/api/process-messages', methods=['POST'])
 @login_required
 def process_messages():
     try:
-        max_messages = request.args.get('max_messages', default=10, type=int)
+        max_messages = min(max(request.args.get('max_messages', default=10, type=int), 1), MAX_RECEIVE_MESSAGES)
         success, result = sqs_service.process_messages(
             handler_function=process_message,
             max_messages=max_messages
@@ -471,11 +862,48 @@ def process_messages():
         logger.error(f"Error in process_messages: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/messages')
+@main_bp.route('/internal/db-pool')
+@login_required
+def db_pool_status():
+    return jsonify({
+        'primary': pool_status(db.engine),
+        'replicas': {
+            key: {**pool_status(db.engines[key]), **db.replica_router.status().get(key, {})}
+            for key in db.replica_keys
+        }
+    })
+
+@main_bp.route('/internal/password-hashing')
+@login_required
+def password_hashing_stats():
+    return jsonify(password_hasher.stats())
+
+@main_bp.route('/internal/email-queue')
+@login_required
+def email_queue_stats():
+    return jsonify(email_dispatcher.stats())
+
+@main_bp.route('/internal/aws-breakers')
+@login_required
+def aws_breaker_status():
+    return jsonify(breaker_status())
+
+@main_bp.route('/internal/resources')
+@login_required
+def resource_status():
+    return jsonify(resources.status())
+
+@main_bp.route('/internal/rate-limits')
+@login_required
+def rate_limit_stats():
+    return jsonify(limiter.stats())
+
+@main_bp.route('/messages')
 @login_required
 def messages_page():
-    return render_template('messages.html')
+    return render_cached('messages.html', variant='authenticated')
 
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True) 
\ No newline at end of file
+    app = create_app()
+    init_db(app)
+    app.run(debug=True)
@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+from os import environ
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# Read timeouts must outlast the longest server-side wait: SQS long polls take up to 20s
+DEFAULT_READ_TIMEOUTS = {'sqs': 25}
+
+# Error codes that mean the dependency is unhealthy rather than the request being wrong
+UNHEALTHY_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled',
+    'RequestLimitExceeded', 'TooManyRequestsException', 'SlowDown', 'ServiceUnavailable',
+    'InternalError', 'InternalFailure', 'RequestTimeout', 'RequestTimeoutException'
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(ClientError):
+    """
+    Raised instead of calling an AWS dependency whose circuit is open.
+
+    Subclasses ClientError so every existing 'except ClientError' path treats a
+    fast failure like any other failed call.
+    """
+
+    def __init__(self, service_name, operation_name, retry_after):
+        super().__init__(
+            {'Error': {'Code': 'CircuitOpen',
+                       'Message': f"{service_name} circuit is open, retry in {retry_after:.0f}s"}},
+            operation_name
+        )
+        self.service_name = service_name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Per-dependency circuit breaker.
+
+    After failure_threshold consecutive failures (timeouts, connection errors,
+    throttling, 5xx) the circuit opens and calls fail immediately with
+    CircuitOpenError. After reset_timeout seconds it half-opens and lets one
+    trial call through: success closes the circuit, failure opens it again.
+    Client errors such as a missing queue or rejected email count as successes,
+    since the dependency answered.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def before_call(self, operation_name):
+        """Raise CircuitOpenError unless a call may go through now"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_started = 0.0
+                logger.info(f"AWS {self.name} circuit half-open, sending a trial call")
+            if self.state == HALF_OPEN:
+                # One trial at a time; a trial that never reports back is abandoned after reset_timeout
+                if not self._trial_started or now - self._trial_started >= self.reset_timeout:
+                    self._trial_started = now
+                    self._counters['calls'] += 1
+                    return
+            elif self.state == CLOSED:
+                self._counters['calls'] += 1
+                return
+            self._counters['rejected'] += 1
+            retry_after = max(0.0, self.reset_timeout - (now - self._opened_at))
+        raise CircuitOpenError(self.name, operation_name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"AWS {self.name} circuit closed")
+            self.state = CLOSED
+            self._failures = 0
+
+    def record_failure(self, reason):
+        with self._lock:
+            self._counters['failures'] += 1
+            self._failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._counters['opened'] += 1
+                logger.warning(f"AWS {self.name} circuit opened after {self._failures} failure(s): {reason}")
+
+    def status(self):
+        with self._lock:
+            status = {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                **self._counters
+            }
+            if self.state != CLOSED:
+                status['retry_in'] = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return status
+
+    # botocore event handlers
+
+    def _before_call(self, model, **kwargs):
+        self.before_call(model.name)
+
+    def _after_call(self, http_response, parsed, **kwargs):
+        status_code = http_response.status_code
+        error_code = (parsed or {}).get('Error', {}).get('Code')
+        if status_code >= 500 or status_code == 429 or error_code in UNHEALTHY_ERROR_CODES:
+            self.record_failure(f"HTTP {status_code} {error_code or ''}".strip())
+        else:
+            self.record_success()
+
+    def _after_call_error(self, exception, **kwargs):
+        self.record_failure(f"{type(exception).__name__}: {str(exception)}")
+
+    def attach(self, client):
+        """Hook the breaker into a boto3 client's request lifecycle"""
+        events = getattr(getattr(client, 'meta', None), 'events', None)
+        if events is None:
+            # Stand-in clients (e.g. the benchmark fakes) have no event system
+            return client
+        service_id = client.meta.service_model.service_id.hyphenize()
+        events.register(f"before-call.{service_id}", self._before_call)
+        events.register(f"after-call.{service_id}", self._after_call)
+        events.register(f"after-call-error.{service_id}", self._after_call_error)
+        return client
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(service_name):
+    """The process-wide breaker for one AWS dependency"""
+    with _breakers_lock:
+        breaker = _breakers.get(service_name)
+        if breaker is None:
+            breaker = _breakers[service_name] = CircuitBreaker(
+                service_name,
+                failure_threshold=int(environ.get('AWS_BREAKER_FAILURES', 5)),
+                reset_timeout=float(environ.get('AWS_BREAKER_RESET_TIMEOUT', 30))
+            )
+        return breaker
+
+
+def client_config(service_name):
+    """
+    botocore Config from the environment; AWS_<SERVICE>_READ_TIMEOUT and
+    friends override the AWS_* defaults for a single service
+    """
+    prefix = f"AWS_{service_name.upper().replace('-', '_')}_"
+
+    def setting(name, default):
+        return environ.get(prefix + name, environ.get(f"AWS_{name}", default))
+
+    return Config(
+        connect_timeout=float(setting('CONNECT_TIMEOUT', 1)),
+        read_timeout=float(setting('READ_TIMEOUT', DEFAULT_READ_TIMEOUTS.get(service_name, 3))),
+        retries={
+            'mode': setting('RETRY_MODE', 'adaptive'),
+            'max_attempts': int(setting('MAX_ATTEMPTS', 3))
+        },
+        max_pool_connections=int(setting('MAX_POOL_CONNECTIONS', 50))
+    )
+
+
+def aws_client(service_name, region_name='us-east-1', breaker=True):
+    """
+    Create a boto3 client with tight timeouts, adaptive retries and, unless
+    breaker is False, the dependency's circuit breaker attached
+    """
+    client = boto3.client(service_name, region_name=region_name, config=client_config(service_name))
+    if breaker:
+        get_breaker(service_name).attach(client)
+    return client
+
+
+def breaker_status():
+    """State of every breaker created in this process, keyed by service"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in breakers}
+
+
+def breaker_gauges():
+    """Flat numeric view for the metrics registry: 0 closed, 1 half-open, 2 open"""
+    levels = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    gauges = {}
+    for name, status in breaker_status().items():
+        name = name.replace('-', '_')
+        gauges[f"{name}_state"] = levels[status['state']]
+        gauges[f"{name}_rejected"] = status['rejected']
+        gauges[f"{name}_failures"] = status['failures']
+        gauges[f"{name}_opened"] = status['opened']
+    return gauges
@@ -0,0 +1,5 @@
+"""
+Local load/benchmark harness: runs the app against in-process AWS and memcached
+stand-ins and SQLite (or a local Postgres) so throughput can be measured without
+an AWS account. See bench/run.py.
+"""
@@ -0,0 +1,281 @@
+"""
+In-process stand-ins for the AWS services and memcached used by the app.
+
+install_fakes() must run before app.py (or anything that creates clients) is
+imported. The fakes only implement the calls this app makes.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+import cache_client
+
+# Simulated network round trip for every fake AWS call, in seconds
+AWS_LATENCY = 0.0
+
+
+def _client_error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class _FakeClient:
+    def _call(self):
+        if AWS_LATENCY:
+            time.sleep(AWS_LATENCY)
+
+
+class _Paginator:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self._pages)
+
+
+class FakeSSM(_FakeClient):
+    def __init__(self, parameters=None):
+        self.parameters = dict(parameters or {})
+
+    def get_parameter(self, Name, WithDecryption=False):
+        self._call()
+        if Name not in self.parameters:
+            raise _client_error('ParameterNotFound', Name, 'GetParameter')
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name]}}
+
+    def get_paginator(self, operation_name):
+        self._call()
+        return _Paginator([{
+            'Parameters': [{'Name': name, 'Value': value} for name, value in self.parameters.items()]
+        }])
+
+
+class FakeSQS(_FakeClient):
+    """Single in-memory queue with visibility timeouts and long polling"""
+
+    def __init__(self, visibility_timeout=30):
+        self.visibility_timeout = visibility_timeout
+        self._messages = {}
+        self._receipts = {}
+        self._cond = threading.Condition()
+
+    def get_queue_url(self, QueueName):
+        self._call()
+        return {'QueueUrl': f"https://sqs.local/000000000000/{QueueName}"}
+
+    def _put(self, body, attributes):
+        message_id = str(uuid.uuid4())
+        self._messages[message_id] = {
+            'MessageId': message_id,
+            'Body': body,
+            'MD5OfBody': hashlib.md5(body.encode('utf-8')).hexdigest(),
+            'MessageAttributes': attributes or {},
+            'Attributes': {'SentTimestamp': str(int(time.time() * 1000))},
+            'visible_at': 0.0
+        }
+        return message_id
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None):
+        self._call()
+        with self._cond:
+            message_id = self._put(MessageBody, MessageAttributes)
+            self._cond.notify_all()
+        return {'MessageId': message_id}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self._call()
+        successful = []
+        with self._cond:
+            for entry in Entries:
+                message_id = self._put(entry['MessageBody'], entry.get('MessageAttributes'))
+                successful.append({'Id': entry['Id'], 'MessageId': message_id})
+            self._cond.notify_all()
+        return {'Successful': successful, 'Failed': []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0,
+                        VisibilityTimeout=None, **kwargs):
+        self._call()
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                visible = [m for m in self._messages.values() if m['visible_at'] <= now][:MaxNumberOfMessages]
+                if visible or now >= deadline:
+                    break
+                self._cond.wait(deadline - now)
+            messages = []
+            for message in visible:
+                # VisibilityTimeout=0 peeks: the message stays visible
+                message['visible_at'] = now + (self.visibility_timeout if VisibilityTimeout is None else VisibilityTimeout)
+                receipt = uuid.uuid4().hex
+                self._receipts[receipt] = message['MessageId']
+                messages.append({
+                    **{key: value for key, value in message.items() if key != 'visible_at'},
+                    'ReceiptHandle': receipt
+                })
+        return {'Messages': messages} if messages else {}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self._call()
+        with self._cond:
+            message_id = self._receipts.pop(ReceiptHandle, None)
+            self._messages.pop(message_id, None)
+        return {}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self._call()
+        with self._cond:
+            for entry in Entries:
+                message_id = self._receipts.pop(entry['ReceiptHandle'], None)
+                self._messages.pop(message_id, None)
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        self._call()
+        with self._cond:
+            for entry in Entries:
+                message = self._messages.get(self._receipts.get(entry['ReceiptHandle']))
+                if message:
+                    message['visible_at'] = time.monotonic() + entry['VisibilityTimeout']
+            self._cond.notify_all()
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+
+class FakeSES(_FakeClient):
+    def __init__(self):
+        self.sent = 0
+        self.templates = {}
+
+    def send_email(self, Source, Destination, Message):
+        self._call()
+        self.sent += 1
+        return {'MessageId': uuid.uuid4().hex}
+
+    def create_template(self, Template):
+        self._call()
+        if Template['TemplateName'] in self.templates:
+            raise _client_error('AlreadyExists', Template['TemplateName'], 'CreateTemplate')
+        self.templates[Template['TemplateName']] = Template
+        return {}
+
+    def update_template(self, Template):
+        self._call()
+        self.templates[Template['TemplateName']] = Template
+        return {}
+
+    def send_bulk_templated_email(self, Source, Template, Destinations, **kwargs):
+        self._call()
+        self.sent += len(Destinations)
+        return {'Status': [{'Status': 'Success', 'MessageId': uuid.uuid4().hex} for _ in Destinations]}
+
+
+class FakePooledClient:
+    """Dict-backed replacement for pymemcache's PooledClient, shared per server address"""
+
+    _stores = {}
+    _lock = threading.Lock()
+
+    def __init__(self, server, serde=None, **kwargs):
+        self.serde = serde
+        with self._lock:
+            self._store = self._stores.setdefault(server, {})
+
+    def _live(self, key):
+        entry = self._store.get(key)
+        if entry and entry[2] and entry[2] < time.time():
+            del self._store[key]
+            return None
+        return entry
+
+    def _expiry(self, expire):
+        return time.time() + expire if expire else 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live(key)
+        if entry is None:
+            return default
+        return self.serde.deserialize(key, entry[0], entry[1])
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value, expire=0, noreply=None, flags=None):
+        data, value_flags = self.serde.serialize(key, value)
+        with self._lock:
+            self._store[key] = (data, value_flags, self._expiry(expire))
+        return True
+
+    def set_many(self, values, expire=0, noreply=None, flags=None):
+        for key, value in values.items():
+            self.set(key, value, expire)
+        return []
+
+    def add(self, key, value, expire=0, noreply=None, flags=None):
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+        return self.set(key, value, expire)
+
+    def delete(self, key, noreply=None):
+        with self._lock:
+            return self._store.pop(key, None) is not None
+
+    def delete_many(self, keys, noreply=None):
+        for key in keys:
+            self.delete(key)
+        return True
+
+    def incr(self, key, value, noreply=False):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            new_value = int(entry[0]) + value
+            self._store[key] = (str(new_value).encode('ascii'), entry[1], entry[2])
+            return new_value
+
+    def decr(self, key, value, noreply=False):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            new_value = max(0, int(entry[0]) - value)
+            self._store[key] = (str(new_value).encode('ascii'), entry[1], entry[2])
+            return new_value
+
+    def close(self):
+        pass
+
+
+def install_fakes(aws_latency_ms=0, fake_memcached=True, ssm_parameters=None):
+    """
+    Route boto3.client() to the fakes and, unless a real memcached is used,
+    replace the pooled memcached client with an in-process store
+    """
+    global AWS_LATENCY
+    AWS_LATENCY = aws_latency_ms / 1000.0
+    clients = {
+        'ssm': FakeSSM(ssm_parameters),
+        'sqs': FakeSQS(),
+        'ses': FakeSES(),
+    }
+
+    def fake_client(service_name, *args, **kwargs):
+        if service_name not in clients:
+            # e.g. CloudWatch Logs: the app logs a warning and carries on without it
+            raise RuntimeError(f"No local stand-in for AWS service {service_name}")
+        return clients[service_name]
+
+    boto3.client = fake_client
+    if fake_memcached:
+        cache_client.PooledClient = FakePooledClient
+    return clients
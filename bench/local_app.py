@@ -0,0 +1,37 @@
+"""
+The app wired to the local stand-ins, for running under a real server:
+
+    DATABASE_URL=sqlite:////tmp/bench.db gunicorn -w 3 bench.local_app:app
+    DATABASE_URL=sqlite:////tmp/bench.db gunicorn -w 3 -k gevent bench.local_app:app
+    DATABASE_URL=sqlite:////tmp/bench.db gunicorn -c gunicorn.conf.py bench.local_app:app  # preloaded
+
+Set BENCH_MEMCACHED=host:port to use a real local memcached instead of the
+in-process store, and BENCH_AWS_LATENCY_MS to simulate AWS round trips.
+
+Every bench thread logs in as the same user, so the rate limits are raised
+far above anything a run reaches: the limiter still runs on every request,
+but never answers 429. Set RATE_LIMIT_* to measure the production limits.
+"""
+from os import environ
+
+from bench.fakes import install_fakes
+
+environ.setdefault('DATABASE_URL', 'sqlite:////tmp/flask-app-bench.db')
+environ.setdefault('FLASK_SECRET_KEY', 'bench-secret-key')
+environ.setdefault('SQS_PAYLOAD_STORE', 'file:///tmp/flask-app-bench-payloads')
+for limit in ('RATE_LIMIT_LOGIN', 'RATE_LIMIT_LOGIN_USERNAME', 'RATE_LIMIT_REGISTER', 'RATE_LIMIT_MESSAGES'):
+    environ.setdefault(limit, '1000000/minute')
+if environ.get('BENCH_MEMCACHED'):
+    environ.setdefault('MEMCACHED_NODES', environ['BENCH_MEMCACHED'])
+else:
+    environ.setdefault('MEMCACHED_NODES', 'localhost:11211')
+
+install_fakes(
+    aws_latency_ms=float(environ.get('BENCH_AWS_LATENCY_MS', 0)),
+    fake_memcached=not environ.get('BENCH_MEMCACHED')
+)
+
+from app import create_app, init_db  # noqa: E402
+
+app = create_app()
+init_db(app)
@@ -0,0 +1,282 @@
+"""
+Drive login, /users, /api/cache and /api/messages at fixed concurrency levels
+and report requests/second and latency percentiles.
+
+    python -m bench.run --concurrency 1,8,32 --duration 10
+    python -m bench.run --url http://127.0.0.1:8000 --scenarios users,cache
+
+Without --url the app is booted in-process (bench.local_app) on a threaded
+werkzeug server; with --url any running instance is targeted, e.g. gunicorn
+serving bench.local_app:app. All threads share one account, so a target with
+the production rate limits answers 429 within seconds; bench.local_app
+raises them.
+"""
+import argparse
+import http.client
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench-password'
+
+
+class Client:
+    """Minimal keep-alive HTTP client that keeps the session cookie"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.cookies = SimpleCookie()
+        self._conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={morsel.value}" for name, morsel in self.cookies.items())
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self._conn.request(method, path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self._conn.close()
+                self._conn = None
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(header)
+        if response.headers.get('Connection', '').lower() == 'close':
+            self._conn.close()
+            self._conn = None
+        return response.status, data
+
+    def form(self, path, fields):
+        return self.request('POST', path, urlencode(fields),
+                            {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def json(self, method, path, payload=None):
+        body = json.dumps(payload) if payload is not None else None
+        return self.request(method, path, body, {'Content-Type': 'application/json'})
+
+    def login(self):
+        status, _ = self.form('/login/', {'username': BENCH_USER, 'password': BENCH_PASSWORD})
+        if status == 429:
+            raise RuntimeError("Login was rate limited; raise RATE_LIMIT_LOGIN* on the target")
+        if status != 302:
+            raise RuntimeError(f"Login failed with HTTP {status}")
+
+
+class Scenario:
+    """setup() runs once per thread, step(i) is the measured request"""
+
+    def __init__(self, client, worker):
+        self.client = client
+        self.worker = worker
+
+    def setup(self):
+        self.client.login()
+
+    def step(self, i):
+        raise NotImplementedError
+
+
+class LoginScenario(Scenario):
+    def setup(self):
+        pass
+
+    def step(self, i):
+        self.client.cookies = SimpleCookie()
+        status, _ = self.client.form('/login/', {'username': BENCH_USER, 'password': BENCH_PASSWORD})
+        return status == 302
+
+
+class UsersScenario(Scenario):
+    def step(self, i):
+        status, _ = self.client.request('GET', '/users')
+        return status == 200
+
+
+class CacheScenario(Scenario):
+    """90% reads, 10% writes over a small per-thread key set"""
+
+    keys = 100
+
+    def setup(self):
+        super().setup()
+        for k in range(self.keys):
+            self.client.json('POST', '/api/cache', {'key': f"bench-{self.worker}-{k}", 'value': f"value-{k}"})
+
+    def step(self, i):
+        key = f"bench-{self.worker}-{random.randrange(self.keys)}"
+        if i % 10 == 0:
+            status, _ = self.client.json('POST', '/api/cache', {'key': key, 'value': uuid.uuid4().hex})
+        else:
+            status, _ = self.client.request('GET', f"/api/cache/{key}")
+        return status == 200
+
+
+class MessagesScenario(Scenario):
+    """Alternate sending one message and receiving up to 10"""
+
+    def step(self, i):
+        if i % 2 == 0:
+            status, _ = self.client.json('POST', '/api/messages', {'message': f"bench {self.worker}-{i}"})
+        else:
+            status, _ = self.client.request('GET', '/api/messages?max_messages=10')
+        return status == 200
+
+
+SCENARIOS = {
+    'login': LoginScenario,
+    'users': UsersScenario,
+    'cache': CacheScenario,
+    'messages': MessagesScenario,
+}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_level(base_url, scenario_class, concurrency, duration, warmup):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    state = {}
+
+    def open_window():
+        # The measured window starts once every thread has finished setup
+        state['start'] = time.monotonic() + warmup
+        state['end'] = state['start'] + duration
+
+    ready = threading.Barrier(concurrency + 1, action=open_window)
+
+    def worker(index):
+        scenario = scenario_class(Client(base_url), index)
+        setup_error = None
+        try:
+            scenario.setup()
+        except Exception as e:
+            setup_error = e
+        ready.wait()
+        if setup_error:
+            with lock:
+                errors[0] += 1
+            return
+        local, local_errors, i = [], 0, 0
+        while time.monotonic() < state['end']:
+            started = time.monotonic()
+            try:
+                ok = scenario.step(i)
+            except Exception:
+                ok = False
+            finished = time.monotonic()
+            if finished >= state['start']:
+                local.append(finished - started)
+                local_errors += 0 if ok else 1
+            i += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'scenario': scenario_class.__name__.replace('Scenario', '').lower(),
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0
+    }
+
+
+def boot_local_server():
+    """Import the app with local stand-ins and serve it on an ephemeral port"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from bench.local_app import app
+
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def prepare(base_url, seed_users):
+    """Create the bench account and, optionally, extra rows for the users listing"""
+    client = Client(base_url)
+    client.form('/register/', {'username': BENCH_USER, 'password': BENCH_PASSWORD,
+                               'email': 'bench@example.com'})
+    client.login()
+    if seed_users:
+        run_id = uuid.uuid4().hex[:8]
+        lines = ''.join(
+            json.dumps({'username': f"seed-{run_id}-{i}", 'email': f"seed-{run_id}-{i}@example.com",
+                        'password': 'seed-password'}) + '\n'
+            for i in range(seed_users)
+        )
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"seed.jsonl\"\r\n"
+            f"Content-Type: application/x-ndjson\r\n\r\n{lines}\r\n--{boundary}--\r\n"
+        )
+        status, data = client.request('POST', '/users/import', body.encode('utf-8'),
+                                      {'Content-Type': f"multipart/form-data; boundary={boundary}"})
+        if status == 200:
+            report = json.loads(data)
+            print(f"Seeded {report['created']} users")
+        else:
+            print(f"Seeding users failed with HTTP {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Flask app against local stand-ins')
+    parser.add_argument('--url', help='Target a running server instead of booting one in-process')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds before each level')
+    parser.add_argument('--seed-users', type=int, default=200)
+    parser.add_argument('--output', help='Append results as JSON lines to this file')
+    args = parser.parse_args()
+
+    base_url = args.url or boot_local_server()
+    prepare(base_url, args.seed_users)
+
+    header = f"{'scenario':<10} {'conc':>5} {'requests':>9} {'errors':>7} {'rps':>9} " \
+             f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print('-' * len(header))
+    output = open(args.output, 'a') if args.output else io.StringIO()
+    with output:
+        for name in args.scenarios.split(','):
+            for concurrency in (int(level) for level in args.concurrency.split(',')):
+                result = run_level(base_url, SCENARIOS[name.strip()], concurrency, args.duration, args.warmup)
+                print(f"{result['scenario']:<10} {concurrency:>5} {result['requests']:>9} {result['errors']:>7} "
+                      f"{result['rps']:>9} {result['p50_ms']:>9} {result['p90_ms']:>9} "
+                      f"{result['p99_ms']:>9} {result['max_ms']:>9}")
+                output.write(json.dumps({**result, 'url': base_url, 'at': time.time()}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import bisect
+import hashlib
+import logging
+import pickle
+
+from pymemcache.client.base import PooledClient
+from pymemcache.exceptions import MemcacheError
+
+from fanout import fan_out
+
+logger = logging.getLogger(__name__)
+
+# Value flags, compatible with python-memcached so existing entries stay readable
+FLAG_BYTES = 0
+FLAG_PICKLE = 1
+FLAG_INTEGER = 2
+FLAG_LONG = 4
+FLAG_TEXT = 16
+
+
+class CacheSerde:
+    """Store str/int as plain memcached values and pickle everything else"""
+
+    def serialize(self, key, value):
+        if isinstance(value, str):
+            return value.encode('utf-8'), FLAG_TEXT
+        if isinstance(value, bytes):
+            return value, FLAG_BYTES
+        if isinstance(value, bool):
+            return pickle.dumps(value, pickle.HIGHEST_PROTOCOL), FLAG_PICKLE
+        if isinstance(value, int):
+            return str(value).encode('ascii'), FLAG_INTEGER
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL), FLAG_PICKLE
+
+    def deserialize(self, key, value, flags):
+        if flags & FLAG_TEXT:
+            return value.decode('utf-8')
+        if flags & (FLAG_INTEGER | FLAG_LONG):
+            return int(value)
+        if flags & FLAG_PICKLE:
+            return pickle.loads(value)
+        return value
+
+
+class HashRing:
+    """
+    Consistent hash ring (ketama-style, md5 with virtual nodes), so adding or
+    removing a node only remaps the keys that lived on it
+    """
+
+    def __init__(self, nodes, replicas=160):
+        self.nodes = list(nodes)
+        self._ring = {}
+        for node in self.nodes:
+            for i in range(replicas // 4):
+                digest = hashlib.md5(f"{node}-{i}".encode('utf-8')).digest()
+                for j in range(4):
+                    point = int.from_bytes(digest[j * 4:j * 4 + 4], 'little')
+                    self._ring[point] = node
+        self._points = sorted(self._ring)
+
+    def get_node(self, key):
+        digest = hashlib.md5(key.encode('utf-8')).digest()
+        point = int.from_bytes(digest[0:4], 'little')
+        index = bisect.bisect(self._points, point) % len(self._points)
+        return self._ring[self._points[index]]
+
+
+def parse_nodes(spec):
+    """Parse 'host1:11211,host2:11211' into [('host1', 11211), ...]"""
+    nodes = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':')
+        if not host:
+            host, port = port, '11211'
+        nodes.append((host, int(port)))
+    return nodes
+
+
+class CacheClient:
+    """
+    Memcached client with a connection pool per node and consistent hashing
+    across nodes. Method names and return values follow python-memcached, so
+    it can be used wherever the old module-level memcache.Client was.
+    """
+
+    def __init__(self, nodes, pool_size=16, pool_idle_timeout=60, connect_timeout=1, timeout=2):
+        if isinstance(nodes, str):
+            nodes = parse_nodes(nodes)
+        if not nodes:
+            raise ValueError("At least one memcached node is required")
+        self.nodes = [f"{host}:{port}" for host, port in nodes]
+        self.ring = HashRing(self.nodes)
+        self._pool_options = {
+            'max_pool_size': pool_size,
+            'pool_idle_timeout': pool_idle_timeout,
+            'connect_timeout': connect_timeout,
+            'timeout': timeout
+        }
+        self.clients = self._connect(nodes)
+
+    def _connect(self, nodes):
+        serde = CacheSerde()
+        return {
+            f"{host}:{port}": PooledClient(
+                (host, port),
+                serde=serde,
+                no_delay=True,
+                default_noreply=False,
+                **self._pool_options
+            )
+            for host, port in nodes
+        }
+
+    def reconnect(self):
+        """
+        Start fresh connection pools, e.g. in a forked worker, so no socket
+        is shared with the parent process
+        """
+        self.clients = self._connect(parse_nodes(','.join(self.nodes)))
+
+    def _client(self, key):
+        return self.clients[self.ring.get_node(key)]
+
+    def _group(self, keys):
+        """Group keys by the node that owns them"""
+        grouped = {}
+        for key in keys:
+            grouped.setdefault(self.ring.get_node(key), []).append(key)
+        return grouped
+
+    def get(self, key):
+        try:
+            return self._client(key).get(key)
+        except (MemcacheError, OSError) as e:
+            logger.error(f"Memcached get failed for {key}: {str(e)}")
+            return None
+
+    def set(self, key, value, time=0):
+        try:
+            return self._client(key).set(key, value, expire=time)
+        except (MemcacheError, OSError) as e:
+            logger.error(f"Memcached set failed for {key}: {str(e)}")
+            return False
+
+    def delete(self, key):
+        try:
+            return self._client(key).delete(key)
+        except (MemcacheError, OSError) as e:
+            logger.error(f"Memcached delete failed for {key}: {str(e)}")
+            return False
+
+    def add(self, key, value, time=0):
+        """Store only if the key does not exist; returns False if it does or on error"""
+        try:
+            return self._client(key).add(key, value, expire=time)
+        except (MemcacheError, OSError) as e:
+            logger.error(f"Memcached add failed for {key}: {str(e)}")
+            return False
+
+    def incr(self, key, delta=1):
+        """Atomically increment an integer value; returns the new value, or None if missing or on error"""
+        try:
+            return self._client(key).incr(key, delta)
+        except (MemcacheError, OSError) as e:
+            logger.error(f"Memcached incr failed for {key}: {str(e)}")
+            return None
+
+    def get_multi(self, keys):
+        """
+        Get many keys with one round trip per node, nodes queried concurrently;
+        returns {key: value} for hits
+        """
+        def get_node(group):
+            node, node_keys = group
+            try:
+                return self.clients[node].get_many(node_keys)
+            except (MemcacheError, OSError) as e:
+                logger.error(f"Memcached get_multi failed on {node}: {str(e)}")
+                return {}
+
+        found = {}
+        for node_found in fan_out(get_node, self._group(keys).items()):
+            found.update(node_found)
+        return found
+
+    def set_multi(self, mapping, time=0):
+        """
+        Set many keys with one round trip per node, nodes written concurrently;
+        returns the keys that failed
+        """
+        def set_node(group):
+            node, node_keys = group
+            values = {key: mapping[key] for key in node_keys}
+            try:
+                return list(self.clients[node].set_many(values, expire=time))
+            except (MemcacheError, OSError) as e:
+                logger.error(f"Memcached set_multi failed on {node}: {str(e)}")
+                return node_keys
+
+        return [key for node_failed in fan_out(set_node, self._group(mapping).items()) for key in node_failed]
+
+    def delete_multi(self, keys):
+        """
+        Delete many keys with one round trip per node, nodes updated concurrently;
+        returns True if every node succeeded
+        """
+        def delete_node(group):
+            node, node_keys = group
+            try:
+                self.clients[node].delete_many(node_keys)
+                return True
+            except (MemcacheError, OSError) as e:
+                logger.error(f"Memcached delete_multi failed on {node}: {str(e)}")
+                return False
+
+        return all(fan_out(delete_node, self._group(keys).items()))
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
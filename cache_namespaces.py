@@ -0,0 +1,120 @@
+import logging
+import re
+import threading
+import time
+
+from local_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+
+def valid_namespace(namespace):
+    return bool(namespace and NAMESPACE_PATTERN.match(namespace))
+
+
+class NamespacedCache:
+    """
+    Cache keys grouped into namespaces that can be invalidated in O(1).
+
+    Each namespace has a generation counter in memcached, and every key is
+    stored as '<prefix><namespace>:<generation>:<key>'. Invalidating a
+    namespace increments the counter, so all of its old keys stop being read
+    and simply age out of memcached by TTL or LRU eviction; nothing is scanned
+    or deleted.
+
+    Generations are cached per worker for generation_ttl seconds, so other
+    workers may keep serving the previous generation for that long after an
+    invalidation. New counters start from the current time in milliseconds
+    rather than 0: if memcached evicts a counter, the namespace moves to a
+    fresh generation instead of resurrecting keys from an old one.
+    """
+
+    def __init__(self, cache, remote, prefix='ns:', generation_ttl=1.0, maxsize=10000):
+        # cache stores the versioned keys (e.g. the near cache), remote holds the counters
+        self.cache = cache
+        self.remote = remote
+        self.prefix = prefix
+        self.generations = LRUCache(maxsize=maxsize, ttl=generation_ttl)
+        self._lock = threading.Lock()
+        self._counters = {'generation_hits': 0, 'generation_misses': 0, 'invalidations': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _generation_key(self, namespace):
+        return f"{self.prefix}{namespace}:generation"
+
+    @staticmethod
+    def _initial_generation():
+        return int(time.time() * 1000)
+
+    def generation(self, namespace):
+        """Current generation of namespace, creating its counter on first use"""
+        generation = self.generations.get(namespace)
+        if generation is not None:
+            self._count('generation_hits')
+            return generation
+
+        self._count('generation_misses')
+        generation_key = self._generation_key(namespace)
+        generation = self.remote.get(generation_key)
+        if generation is None:
+            initial = self._initial_generation()
+            if self.remote.add(generation_key, initial):
+                generation = initial
+            else:
+                # Another worker created it first, or memcached is unavailable
+                generation = self.remote.get(generation_key)
+        if generation is None:
+            # Without a counter, don't cache anything this worker would later mistake for current
+            logger.warning(f"No generation available for cache namespace {namespace}")
+            return None
+        self.generations.set(namespace, int(generation))
+        return int(generation)
+
+    def key(self, namespace, key):
+        """Versioned memcached key, or None if the generation is unavailable"""
+        generation = self.generation(namespace)
+        if generation is None:
+            return None
+        return f"{self.prefix}{namespace}:{generation}:{key}"
+
+    def get(self, namespace, key):
+        versioned = self.key(namespace, key)
+        return self.cache.get(versioned) if versioned else None
+
+    def set(self, namespace, key, value, time=0):
+        versioned = self.key(namespace, key)
+        return self.cache.set(versioned, value, time) if versioned else False
+
+    def delete(self, namespace, key):
+        versioned = self.key(namespace, key)
+        return self.cache.delete(versioned) if versioned else False
+
+    def invalidate(self, namespace):
+        """
+        Retire every key in namespace; returns the new generation, or None if memcached failed
+        """
+        generation_key = self._generation_key(namespace)
+        generation = self.remote.incr(generation_key, 1)
+        if generation is None:
+            # No counter yet (or it was evicted): any fresh generation retires the old keys
+            initial = self._initial_generation()
+            if self.remote.add(generation_key, initial):
+                generation = initial
+            else:
+                generation = self.remote.incr(generation_key, 1)
+        if generation is None:
+            logger.error(f"Failed to invalidate cache namespace {namespace}")
+            return None
+        self.generations.set(namespace, int(generation))
+        self._count('invalidations')
+        logger.info(f"Invalidated cache namespace {namespace}, now at generation {generation}")
+        return int(generation)
+
+    def stats(self):
+        with self._lock:
+            return {'cached_generations': len(self.generations), **self._counters}
@@ -1,32 +1,63 @@
-from flask import Blueprint, render_template, request, flash, jsonify
+from flask import Blueprint, request, flash, jsonify
 from flask_login import login_required
-import memcache
-import boto3
 import logging
+from os import environ
+from cache_client import CacheClient
+from two_tier_cache import TwoTierCache
+from cache_namespaces import NamespacedCache, valid_namespace
+from config_loader import get_config
+from fanout import gevent_active
+from http_caching import render_cached
 
 logger = logging.getLogger(__name__)
 
 cache_bp = Blueprint('cache', __name__)
 
+# Upper bound on keys per bulk request
+MAX_BULK_KEYS = 1000
+
 def get_memcached_config():
-    """Get Memcached configuration from AWS SSM Parameter Store"""
-    try:
-        ssm = boto3.client('ssm', region_name='us-east-1')
-        endpoint = ssm.get_parameter(Name='/flask-app/cache/endpoint')['Parameter']['Value']
-        port = ssm.get_parameter(Name='/flask-app/cache/port')['Parameter']['Value']
-        return f"{endpoint}:{port}"
-    except Exception as e:
-        logger.error(f"Failed to get Memcached config: {str(e)}")
+    """Get Memcached configuration from the shared SSM config snapshot"""
+    config = get_config()
+    endpoint = config.get('cache/endpoint', env='MEMCACHED_ENDPOINT')
+    port = config.get('cache/port', env='MEMCACHED_PORT')
+    if not endpoint or not port:
+        logger.error("Memcached endpoint/port not configured, using localhost")
         return "localhost:11211"  # Default fallback
+    return f"{endpoint}:{port}"
+
+def get_memcached_nodes():
+    """Get the list of Memcached nodes, falling back to the single configured endpoint"""
+    nodes = get_config().get('cache/nodes', env='MEMCACHED_NODES')
+    return nodes or get_memcached_config()
+
+# Initialize Memcached client; gevent workers run many more requests at once than threads
+mc = CacheClient(
+    get_memcached_nodes(),
+    pool_size=int(environ.get('MEMCACHED_POOL_SIZE', 128 if gevent_active() else 16))
+)
 
-# Initialize Memcached client
-mc = memcache.Client([get_memcached_config()])
+# Optional per-worker near cache in front of memcached for GET /api/cache/<key>
+near_cache = TwoTierCache(
+    mc,
+    maxsize=int(environ.get('CACHE_NEAR_SIZE', 10000)),
+    ttl=float(environ.get('CACHE_NEAR_TTL', 5)),
+    stale_ttl=float(environ.get('CACHE_NEAR_STALE_TTL', 5)),
+    enabled=environ.get('CACHE_NEAR_ENABLED', '').lower() in ('1', 'true', 'yes')
+)
+
+# Namespaced keys with per-namespace generation counters, for O(1) invalidation of a whole family of keys
+namespaces = NamespacedCache(
+    near_cache,
+    mc,
+    generation_ttl=float(environ.get('CACHE_GENERATION_TTL', 1))
+)
 
 @cache_bp.route('/cache', methods=['GET'])
 @login_required
 def cache_page():
     """Render the cache management page"""
-    return render_template('cache.html')
+    return render_cached('cache.html', variant='authenticated')
 
 @cache_bp.route('/api/cache', methods=['POST'])
 @login_required
@@ -41,7 +72,7 @@ def set_cache():
         if not key or not value:
             return jsonify({'error': 'Key and value are required'}), 400
 
-        success = mc.set(key, value, expiry)
+        success = near_cache.set(key, value, expiry)
         if success:
             logger.info(f"Successfully set cache key: {key}")
             return jsonify({'message': 'Value cached successfully'})
@@ -58,7 +89,7 @@ def set_cache():
 def get_cache(key):
     """Get a value from cache"""
     try:
-        value = mc.get(key)
+        value = near_cache.get(key)
         if value is not None:
             return jsonify({'key': key, 'value': value})
         return jsonify({'error': 'Key not found'}), 404
@@ -72,11 +103,183 @@ def get_cache(key):
 def delete_cache(key):
     """Delete a value from cache"""
     try:
-        success = mc.delete(key)
+        success = near_cache.delete(key)
         if success:
             return jsonify({'message': 'Cache key deleted successfully'})
         return jsonify({'error': 'Key not found'}), 404
 
     except Exception as e:
         logger.error(f"Error deleting cache: {str(e)}")
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@cache_bp.route('/internal/cache-stats', methods=['GET'])
+@login_required
+def cache_stats():
+    """Near cache hit/miss/coalesce counters"""
+    return jsonify(near_cache.stats())
+
+def _bulk_keys(data):
+    keys = data.get('keys') if isinstance(data, dict) else None
+    if not isinstance(keys, list) or not keys or not all(isinstance(key, str) and key for key in keys):
+        return None, (jsonify({'error': 'A non-empty list of keys is required'}), 400)
+    if len(keys) > MAX_BULK_KEYS:
+        return None, (jsonify({'error': f'At most {MAX_BULK_KEYS} keys per request'}), 400)
+    return keys, None
+
+@cache_bp.route('/api/cache/bulk', methods=['POST'])
+@login_required
+def set_cache_bulk():
+    """Set many values in cache"""
+    try:
+        data = request.get_json()
+        items = data.get('items') if isinstance(data, dict) else None
+        expiry = int(data.get('expiry', 3600)) if isinstance(data, dict) else 3600
+
+        if not isinstance(items, dict) or not items:
+            return jsonify({'error': 'A non-empty items object is required'}), 400
+        if len(items) > MAX_BULK_KEYS:
+            return jsonify({'error': f'At most {MAX_BULK_KEYS} keys per request'}), 400
+
+        near_cache.forget(items)
+        failed = mc.set_multi(items, expiry)
+        logger.info(f"Bulk set {len(items) - len(failed)}/{len(items)} cache keys")
+        if failed:
+            return jsonify({
+                'message': 'Some values could not be cached',
+                'stored': len(items) - len(failed),
+                'failed': failed
+            }), 207 if len(failed) < len(items) else 500
+        return jsonify({'message': 'Values cached successfully', 'stored': len(items)})
+
+    except Exception as e:
+        logger.error(f"Error bulk setting cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@cache_bp.route('/api/cache/bulk/get', methods=['POST'])
+@login_required
+def get_cache_bulk():
+    """Get many values from cache"""
+    try:
+        keys, error = _bulk_keys(request.get_json())
+        if error:
+            return error
+
+        values = mc.get_multi(keys)
+        return jsonify({
+            'values': values,
+            'missing': [key for key in keys if key not in values]
+        })
+
+    except Exception as e:
+        logger.error(f"Error bulk getting cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@cache_bp.route('/api/cache/bulk/delete', methods=['POST'])
+@login_required
+def delete_cache_bulk():
+    """Delete many values from cache"""
+    try:
+        keys, error = _bulk_keys(request.get_json())
+        if error:
+            return error
+
+        near_cache.forget(keys)
+        if mc.delete_multi(keys):
+            return jsonify({'message': 'Cache keys deleted successfully', 'deleted': len(keys)})
+        return jsonify({'error': 'Failed to delete some cache keys'}), 500
+
+    except Exception as e:
+        logger.error(f"Error bulk deleting cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _invalid_namespace(namespace):
+    if valid_namespace(namespace):
+        return None
+    return jsonify({'error': 'Namespaces are 1-64 letters, digits, dots, dashes or underscores'}), 400
+
+@cache_bp.route('/api/cache/namespaces/<namespace>', methods=['GET'])
+@login_required
+def get_namespace(namespace):
+    """Current generation of a namespace"""
+    error = _invalid_namespace(namespace)
+    if error:
+        return error
+    generation = namespaces.generation(namespace)
+    if generation is None:
+        return jsonify({'error': 'Cache unavailable'}), 503
+    return jsonify({'namespace': namespace, 'generation': generation})
+
+@cache_bp.route('/api/cache/namespaces/<namespace>', methods=['POST'])
+@login_required
+def set_namespaced_cache(namespace):
+    """Set a value in a namespace"""
+    try:
+        error = _invalid_namespace(namespace)
+        if error:
+            return error
+        data = request.get_json()
+        key = data.get('key')
+        value = data.get('value')
+        expiry = int(data.get('expiry', 3600))
+
+        if not key or not value:
+            return jsonify({'error': 'Key and value are required'}), 400
+
+        if namespaces.set(namespace, key, value, expiry):
+            logger.info(f"Successfully set cache key {key} in namespace {namespace}")
+            return jsonify({'message': 'Value cached successfully'})
+        logger.error(f"Failed to set cache key {key} in namespace {namespace}")
+        return jsonify({'error': 'Failed to set cache value'}), 500
+
+    except Exception as e:
+        logger.error(f"Error setting namespaced cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@cache_bp.route('/api/cache/namespaces/<namespace>/<key>', methods=['GET'])
+@login_required
+def get_namespaced_cache(namespace, key):
+    """Get a value from a namespace"""
+    try:
+        error = _invalid_namespace(namespace)
+        if error:
+            return error
+        value = namespaces.get(namespace, key)
+        if value is not None:
+            return jsonify({'namespace': namespace, 'key': key, 'value': value})
+        return jsonify({'error': 'Key not found'}), 404
+
+    except Exception as e:
+        logger.error(f"Error getting namespaced cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@cache_bp.route('/api/cache/namespaces/<namespace>/<key>', methods=['DELETE'])
+@login_required
+def delete_namespaced_cache(namespace, key):
+    """Delete a value from a namespace"""
+    try:
+        error = _invalid_namespace(namespace)
+        if error:
+            return error
+        if namespaces.delete(namespace, key):
+            return jsonify({'message': 'Cache key deleted successfully'})
+        return jsonify({'error': 'Key not found'}), 404
+
+    except Exception as e:
+        logger.error(f"Error deleting namespaced cache: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@cache_bp.route('/api/cache/namespaces/<namespace>/invalidate', methods=['POST'])
+@login_required
+def invalidate_namespace(namespace):
+    """Retire every key in a namespace by bumping its generation"""
+    error = _invalid_namespace(namespace)
+    if error:
+        return error
+    generation = namespaces.invalidate(namespace)
+    if generation is None:
+        return jsonify({'error': 'Failed to invalidate namespace'}), 500
+    return jsonify({
+        'message': 'Namespace invalidated',
+        'namespace': namespace,
+        'generation': generation
+    })
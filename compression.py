@@ -0,0 +1,117 @@
+import gzip
+import logging
+from os import environ
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+}
+
+
+def parse_accept_encoding(header):
+    """Parse 'gzip, br;q=0.9, *;q=0' into {coding: q}"""
+    accepted = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header, available):
+    """Pick the client's highest-q coding among available, preferring the earlier one on ties"""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class Compressor:
+    """
+    Compresses buffered text/JSON responses above min_size bytes with brotli
+    (when installed) or gzip, whichever the client prefers.
+
+    Streamed responses and files sent with direct passthrough are left alone.
+    Compressed responses get a weak ETag, which still matches conditional
+    requests but marks the body as a different representation.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def _compressible(self, response):
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        mimetype = response.mimetype or ''
+        return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def __call__(self, response):
+        if not self._compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'), self.encodings)
+        if encoding is None:
+            return response
+
+        response.set_data(self.compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def init_compression(app):
+    """
+    Compress responses per Accept-Encoding. COMPRESS_MIN_SIZE sets the threshold
+    in bytes, 0 disables compression (e.g. when nginx compresses instead).
+    """
+    min_size = int(environ.get('COMPRESS_MIN_SIZE', 1024))
+    if min_size <= 0:
+        return None
+    compressor = Compressor(
+        min_size=min_size,
+        gzip_level=int(environ.get('COMPRESS_GZIP_LEVEL', 6)),
+        brotli_quality=int(environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    )
+    app.after_request(compressor)
+    return compressor
@@ -0,0 +1,214 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from os import environ
+
+from botocore.exceptions import BotoCoreError, ClientError
+from cryptography.fernet import Fernet, InvalidToken
+from dotenv import load_dotenv
+
+from aws_clients import aws_client
+
+logger = logging.getLogger(__name__)
+
+SSM_PREFIX = '/flask-app/'
+
+
+class ConfigLoader:
+    """
+    Loads the whole /flask-app/ SSM parameter tree with one paginated
+    GetParametersByPath call and keeps an encrypted on-disk snapshot of it,
+    so restarted or newly scaled workers can boot from local data.
+    """
+
+    def __init__(self, prefix=SSM_PREFIX, region_name='us-east-1', cache_path=None,
+                 cache_ttl=None, cache_key=None, refresh_interval=None):
+        self.prefix = prefix if prefix.endswith('/') else prefix + '/'
+        self.region_name = region_name
+        self.cache_path = cache_path or environ.get('CONFIG_CACHE_PATH', '/tmp/flask-app-config.cache')
+        self.cache_ttl = int(cache_ttl if cache_ttl is not None else environ.get('CONFIG_CACHE_TTL', 300))
+        self.refresh_interval = int(
+            refresh_interval if refresh_interval is not None else environ.get('CONFIG_REFRESH_INTERVAL', 300)
+        )
+        self._fernet = self._build_fernet(cache_key or environ.get('CONFIG_CACHE_KEY'))
+        self._ssm = None
+        self._params = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _build_fernet(passphrase):
+        """Derive a Fernet key from the configured passphrase"""
+        if not passphrase:
+            return None
+        key = base64.urlsafe_b64encode(hashlib.sha256(passphrase.encode('utf-8')).digest())
+        return Fernet(key)
+
+    @property
+    def ssm(self):
+        if self._ssm is None:
+            self._ssm = aws_client('ssm', region_name=self.region_name)
+        return self._ssm
+
+    def _name(self, param_name):
+        """Strip the tree prefix so '/flask-app/db/host' and 'db/host' are the same key"""
+        if param_name.startswith(self.prefix):
+            return param_name[len(self.prefix):]
+        return param_name.lstrip('/')
+
+    def fetch(self):
+        """
+        Fetch every parameter under the prefix from SSM in one batched call
+        """
+        params = {}
+        paginator = self.ssm.get_paginator('get_parameters_by_path')
+        for page in paginator.paginate(Path=self.prefix, Recursive=True, WithDecryption=True):
+            for param in page.get('Parameters', []):
+                params[self._name(param['Name'])] = param['Value']
+        return params
+
+    def _read_snapshot(self):
+        """
+        Return (params, age_in_seconds) from the encrypted snapshot, or (None, None)
+        """
+        if not self._fernet or not os.path.exists(self.cache_path):
+            return None, None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                token = f.read()
+            params = json.loads(self._fernet.decrypt(token))
+            age = time.time() - self._fernet.extract_timestamp(token)
+            return params, age
+        except (InvalidToken, ValueError, OSError) as e:
+            logger.warning(f"Ignoring unreadable config snapshot {self.cache_path}: {str(e)}")
+            return None, None
+
+    def _write_snapshot(self, params):
+        if not self._fernet:
+            return
+        try:
+            token = self._fernet.encrypt(json.dumps(params).encode('utf-8'))
+            directory = os.path.dirname(self.cache_path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.config-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(token)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to write config snapshot {self.cache_path}: {str(e)}")
+
+    def _set(self, params):
+        self._params = params
+        self._loaded_at = time.time()
+
+    def load(self):
+        """
+        Load parameters, preferring a fresh local snapshot over a network call
+        """
+        snapshot, age = self._read_snapshot()
+        if snapshot is not None and age < self.cache_ttl:
+            logger.info(f"Loaded {len(snapshot)} config parameters from snapshot ({int(age)}s old)")
+            self._set(snapshot)
+            return
+
+        try:
+            params = self.fetch()
+            logger.info(f"Loaded {len(params)} config parameters from SSM")
+            self._set(params)
+            self._write_snapshot(params)
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Failed to load parameters under {self.prefix}: {str(e)}")
+            if snapshot is not None:
+                logger.warning(f"Using stale config snapshot ({int(age)}s old)")
+                self._set(snapshot)
+            else:
+                self._set({})
+
+    def refresh(self):
+        """
+        Re-fetch parameters from SSM, keeping the current values on failure
+        """
+        try:
+            params = self.fetch()
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(f"Background config refresh failed: {str(e)}")
+            return False
+        with self._lock:
+            self._set(params)
+        self._write_snapshot(params)
+        return True
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def start_refresher(self):
+        if self.refresh_interval <= 0 or (self._refresher and self._refresher.is_alive()):
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name='config-refresher', daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self, timeout=2):
+        """
+        Stop the refresher thread, e.g. in the gunicorn master before forking;
+        reconnect() starts it again
+        """
+        self._stop.set()
+        if self._refresher is not None and self._refresher.is_alive():
+            self._refresher.join(timeout)
+
+    def reconnect(self):
+        """
+        In a forked worker: keep the parameters loaded by the parent, but use
+        a new SSM client and restart the refresher thread, which did not survive the fork
+        """
+        self._ssm = None
+        self._lock = threading.Lock()
+        if self._refresher is not None:
+            self._refresher = None
+            self._stop = threading.Event()
+            self.start_refresher()
+
+    def _ensure_loaded(self):
+        if self._params is None:
+            with self._lock:
+                if self._params is None:
+                    self.load()
+            self.start_refresher()
+
+    def get(self, param_name, env=None, default=None):
+        """
+        Get a parameter value, falling back to an environment variable and then a default
+        """
+        self._ensure_loaded()
+        value = self._params.get(self._name(param_name))
+        if value:
+            return value
+        if env:
+            return environ.get(env, default)
+        return default
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_config():
+    """
+    Return the process-wide ConfigLoader, loading .env first so it can be configured from there
+    """
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                load_dotenv()
+                _config = ConfigLoader()
+    return _config
@@ -0,0 +1,280 @@
+"""
+Standalone SQS consumer.
+
+Long-polls the queue, runs handlers on a thread or process pool, acknowledges
+with DeleteMessageBatch and keeps slow messages invisible until they finish.
+
+    python consumer.py --handler message_handlers:process_message --workers 8
+"""
+import argparse
+import importlib
+import json
+import logging
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os import environ
+
+from dotenv import load_dotenv
+
+from payload_store import PayloadError, payload_codec_from_config
+from sqs_service import SQSService, MAX_BATCH_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+def _invoke(handler, message_body):
+    """Run the handler and return how long it took (runs inside the pool)"""
+    started = time.monotonic()
+    handler(message_body)
+    return time.monotonic() - started
+
+
+def load_handler(path):
+    """Resolve a 'module:function' handler path"""
+    module_name, _, function_name = path.partition(':')
+    return getattr(importlib.import_module(module_name), function_name or 'process_message')
+
+
+class SQSConsumer:
+    """
+    Long-polling SQS consumer with a bounded number of in-flight messages.
+    """
+
+    def __init__(self, sqs_service, handler, workers=4, use_processes=False, wait_time=20,
+                 visibility_timeout=30, ack_interval=1.0, stats_interval=60, shutdown_timeout=30):
+        self.sqs_service = sqs_service
+        self.handler = handler
+        self.workers = workers
+        self.use_processes = use_processes
+        self.wait_time = wait_time
+        self.visibility_timeout = visibility_timeout
+        self.ack_interval = ack_interval
+        self.stats_interval = stats_interval
+        self.shutdown_timeout = shutdown_timeout
+        # Keep the pool busy while the next long poll is in flight
+        self.max_in_flight = workers * 2
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._capacity = threading.Semaphore(self.max_in_flight)
+        self._acks = []
+        self._payload_refs = {}
+        self._latencies = deque(maxlen=1000)
+        self._counters = {'received': 0, 'processed': 0, 'failed': 0, 'deleted': 0, 'extended': 0}
+        self._window_started = time.monotonic()
+        self._window_processed = 0
+
+    def stop(self, *_):
+        if not self._stop.is_set():
+            logger.info("Shutdown requested, finishing in-flight messages")
+            self._stop.set()
+
+    def run(self):
+        executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        executor = executor_class(max_workers=self.workers)
+        housekeeper = threading.Thread(target=self._housekeeping, name='sqs-consumer-housekeeping', daemon=True)
+        housekeeper.start()
+        logger.info(f"Consumer started on {self.sqs_service.queue_url} with {self.workers} "
+                    f"{'processes' if self.use_processes else 'threads'}")
+
+        try:
+            while not self._stop.is_set():
+                # Wait for a free slot before asking SQS for more work
+                if not self._capacity.acquire(timeout=1):
+                    continue
+                free = 1
+                while free < MAX_BATCH_ENTRIES and self._capacity.acquire(blocking=False):
+                    free += 1
+
+                success, messages = self.sqs_service.receive_messages(
+                    max_messages=free, wait_time=self.wait_time
+                )
+                if not success:
+                    messages = []
+                    self._stop.wait(1)
+
+                for _ in range(free - len(messages)):
+                    self._capacity.release()
+                self._count('received', len(messages))
+
+                for message in messages:
+                    self._submit(executor, message)
+        finally:
+            self._drain(executor)
+            self._stop.set()
+            housekeeper.join(self.ack_interval * 2)
+            self._flush_acks()
+            self._log_stats()
+
+    def _submit(self, executor, message):
+        try:
+            message_body = json.loads(self.sqs_service.message_body(message))
+        except (ValueError, PayloadError) as e:
+            logger.error(f"Error parsing message {message['MessageId']}: {str(e)}")
+            self._count('failed')
+            self._capacity.release()
+            return
+
+        future = executor.submit(_invoke, self.handler, message_body)
+        with self._lock:
+            self._in_flight[future] = (message, time.monotonic())
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        with self._lock:
+            message, received_at = self._in_flight.pop(future)
+        self._capacity.release()
+
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Error processing message {message['MessageId']}: {str(error)}")
+            self._count('failed')
+            return
+
+        with self._lock:
+            self._latencies.append(future.result())
+            self._counters['processed'] += 1
+            self._window_processed += 1
+            self._acks.append(message['ReceiptHandle'])
+            ref = self.sqs_service.payload_ref(message)
+            if ref:
+                self._payload_refs[message['ReceiptHandle']] = ref
+            flush = len(self._acks) >= MAX_BATCH_ENTRIES
+        if flush:
+            self._flush_acks()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _flush_acks(self):
+        with self._lock:
+            acks, self._acks = self._acks, []
+            payload_refs = {handle: self._payload_refs.pop(handle) for handle in acks if handle in self._payload_refs}
+        if not acks:
+            return
+        _, failed = self.sqs_service.delete_messages(acks, payload_refs)
+        self._count('deleted', len(acks) - len(failed))
+
+    def _extend_visibility(self):
+        """
+        Push back the visibility timeout of messages that have been running for
+        more than half of it, so slow handlers don't cause redelivery
+        """
+        now = time.monotonic()
+        with self._lock:
+            slow = [
+                (future, message) for future, (message, started) in self._in_flight.items()
+                if now - started > self.visibility_timeout / 2
+            ]
+            for future, message in slow:
+                self._in_flight[future] = (message, now)
+        if slow:
+            handles = [message['ReceiptHandle'] for _, message in slow]
+            _, failed = self.sqs_service.change_visibility(handles, self.visibility_timeout)
+            self._count('extended', len(handles) - len(failed))
+
+    def _housekeeping(self):
+        last_stats = time.monotonic()
+        while not self._stop.wait(self.ack_interval):
+            self._flush_acks()
+            self._extend_visibility()
+            if time.monotonic() - last_stats >= self.stats_interval:
+                self._log_stats()
+                last_stats = time.monotonic()
+
+    def _drain(self, executor):
+        """
+        Release messages that never started and wait for running ones to finish
+        """
+        with self._lock:
+            pending = list(self._in_flight.items())
+        not_started = [message['ReceiptHandle'] for future, (message, _) in pending if future.cancel()]
+        if not_started:
+            # Make them visible again right away instead of waiting out the timeout
+            self.sqs_service.change_visibility(not_started, 0)
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._in_flight:
+                    break
+            self._extend_visibility()
+            time.sleep(0.2)
+        # shutdown(cancel_futures=True) needs Python 3.9; the deploy target runs 3.8
+        with self._lock:
+            remaining = list(self._in_flight)
+        for future in remaining:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    def stats(self):
+        """
+        Counters, throughput since the last call and handler latency in milliseconds
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+            elapsed = time.monotonic() - self._window_started
+            throughput = self._window_processed / elapsed if elapsed > 0 else 0.0
+            self._window_started = time.monotonic()
+            self._window_processed = 0
+            in_flight = len(self._in_flight)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        latency = {}
+        if latencies:
+            latency = {'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99)}
+        return {
+            'in_flight': in_flight,
+            'throughput_per_sec': round(throughput, 2),
+            'latency': latency,
+            **counters
+        }
+
+    def _log_stats(self):
+        logger.info(f"Consumer stats: {json.dumps(self.stats())}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Consume messages from the flask-app SQS queue')
+    parser.add_argument('--queue-url', default=environ.get('SQS_QUEUE_URL'))
+    parser.add_argument('--handler', default=environ.get('SQS_HANDLER', 'message_handlers:process_message'))
+    parser.add_argument('--workers', type=int, default=int(environ.get('SQS_CONSUMER_WORKERS', 4)))
+    parser.add_argument('--processes', action='store_true',
+                        default=environ.get('SQS_CONSUMER_PROCESSES', '').lower() in ('1', 'true', 'yes'),
+                        help='Run handlers in a process pool instead of threads')
+    parser.add_argument('--wait-time', type=int, default=20, help='Long-poll wait time in seconds (max 20)')
+    parser.add_argument('--visibility-timeout', type=int, default=30)
+    parser.add_argument('--stats-interval', type=int, default=60)
+    parser.add_argument('--log-level', default=environ.get('LOG_LEVEL', 'INFO'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    consumer = SQSConsumer(
+        SQSService(queue_url=args.queue_url, payload_codec=payload_codec_from_config()),
+        load_handler(args.handler),
+        workers=args.workers,
+        use_processes=args.processes,
+        wait_time=min(args.wait_time, 20),
+        visibility_timeout=args.visibility_timeout,
+        stats_interval=args.stats_interval
+    )
+    signal.signal(signal.SIGTERM, consumer.stop)
+    signal.signal(signal.SIGINT, consumer.stop)
+    consumer.run()
+
+
+if __name__ == '__main__':
+    main()
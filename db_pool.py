@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from collections import deque
+from os import environ
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.wait_stats.record(time.perf_counter() - started, failed=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        # Keep the counters across dispose() so the endpoint doesn't reset on failover
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+class PoolWaitStats:
+    def __init__(self, samples=1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait, failed=False):
+        with self._lock:
+            if failed:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._waits.append(wait)
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            data = {
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3)
+            }
+        if waits:
+            data['p95_wait_ms'] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 3)
+        return data
+
+
+def engine_options(uri):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS from DB_POOL_* settings.
+
+    DB_POOL_MODE=pgbouncer leaves pooling to PgBouncer (transaction mode): no
+    client-side pool and no startup parameters, which PgBouncer rejects.
+    """
+    backend = make_url(uri).get_backend_name()
+    mode = environ.get('DB_POOL_MODE', 'queue').lower()
+    statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    options = {}
+
+    if mode == 'pgbouncer':
+        options['poolclass'] = NullPool
+    else:
+        options.update({
+            'poolclass': TimedQueuePool,
+            'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+            'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 10)),
+            # Recycle before RDS/NAT idle timeouts silently drop connections
+            'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+        })
+
+    if backend == 'postgresql':
+        connect_args = {'connect_timeout': int(environ.get('DB_CONNECT_TIMEOUT', 5))}
+        if mode != 'pgbouncer' and statement_timeout:
+            connect_args['options'] = f"-c statement_timeout={statement_timeout}"
+        options['connect_args'] = connect_args
+    return options
+
+
+def install_pool_events(engine):
+    """
+    Per-transaction statement timeout for PgBouncer mode, where session settings
+    would leak between clients sharing a server connection
+    """
+    if environ.get('DB_POOL_MODE', 'queue').lower() != 'pgbouncer' or engine.dialect.name != 'postgresql':
+        return
+    statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if not statement_timeout:
+        return
+
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(connection):
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {statement_timeout}")
+
+
+def pool_status(engine):
+    """
+    Checked-out/idle connections and checkout wait times for an engine's pool
+    """
+    pool = engine.pool
+    status = {'pool_class': type(pool).__name__, 'dialect': engine.dialect.name}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': pool.overflow()
+        })
+    if isinstance(pool, TimedQueuePool):
+        status.update(pool.wait_stats.snapshot())
+    return status
+
+
+def check_connection(engine):
+    """Round-trip a trivial query to make sure the database is reachable"""
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+def reset_pools_after_fork(engines):
+    """
+    Give a forked worker empty pools. close=False leaves the parent's
+    connections alone instead of closing sockets it still owns.
+    """
+    for engine in engines:
+        engine.dispose(close=False)
@@ -0,0 +1,176 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import g, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+# Cookie-session key holding the time until which this client reads from the primary
+PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+
+class ReplicaRouter:
+    """
+    Tracks read replica engines and which of them are healthy.
+
+    A background thread pings every replica and checks its replay lag; replicas
+    that fail or lag too far behind are skipped until they recover.
+    """
+
+    def __init__(self, engines, check_interval=10, max_lag=30, read_after_write_window=5):
+        self.engines = dict(engines)
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.read_after_write_window = read_after_write_window
+        self.healthy = set(self.engines)
+        self._status = {key: {'healthy': True, 'lag_seconds': None, 'error': None} for key in self.engines}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def choose(self):
+        """Return a healthy replica engine, or None to use the primary"""
+        healthy = list(self.healthy)
+        if not healthy:
+            return None
+        return self.engines[random.choice(healthy)]
+
+    def check(self):
+        for key, engine in self.engines.items():
+            status = {'healthy': False, 'lag_seconds': None, 'error': None}
+            try:
+                with engine.connect() as connection:
+                    if engine.dialect.name == 'postgresql':
+                        lag = connection.execute(text(
+                            "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                        )).scalar()
+                        status['lag_seconds'] = round(float(lag), 3)
+                    else:
+                        connection.execute(text('SELECT 1'))
+                status['healthy'] = status['lag_seconds'] is None or status['lag_seconds'] <= self.max_lag
+            except Exception as e:
+                status['error'] = str(e)
+
+            if status['healthy']:
+                if key not in self.healthy:
+                    logger.info(f"Read replica {key} is healthy again")
+                self.healthy.add(key)
+            else:
+                if key in self.healthy:
+                    logger.warning(f"Read replica {key} marked unhealthy: {status['error'] or status['lag_seconds']}")
+                self.healthy.discard(key)
+            self._status[key] = status
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def start(self):
+        if not self.engines or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='replica-health', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {key: dict(status) for key, status in self._status.items()}
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to a read replica and everything else to
+    the primary.
+
+    Reads stay on the primary once this session has flushed a write, for a short
+    window after a client's last write (read-after-write across redirects), inside
+    use_primary(), and for SELECT ... FOR UPDATE.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._is_replica_read(clause):
+            engine = self._db.replica_router.choose()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _is_replica_read(self, clause):
+        router = getattr(self._db, 'replica_router', None)
+        if router is None or not router.engines:
+            return False
+        if self._flushing or self.info.get('wrote') or self.info.get('use_primary'):
+            return False
+        if not isinstance(clause, sa.Select) or clause._for_update_arg is not None:
+            return False
+        if has_request_context():
+            if g.get('db_use_primary'):
+                return False
+            if flask_session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+                return False
+        return True
+
+
+@contextmanager
+def use_primary(db):
+    """Force every query in the block onto the primary"""
+    session = db.session()
+    previous = session.info.get('use_primary')
+    session.info['use_primary'] = True
+    try:
+        yield
+    finally:
+        session.info['use_primary'] = previous
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(session):
+    if not session.info.pop('wrote', False):
+        return
+    router = getattr(session._db, 'replica_router', None)
+    if router is not None and router.engines and has_request_context():
+        flask_session[PRIMARY_UNTIL_KEY] = time.time() + router.read_after_write_window
+
+
+def init_replicas(app, db, replica_uris, engine_options=None):
+    """
+    Register replica URIs as SQLAlchemy binds and attach a ReplicaRouter to db.
+    Must be called before db.init_app(app).
+    """
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    keys = []
+    for index, uri in enumerate(replica_uris):
+        key = f"replica_{index}"
+        binds[key] = {'url': uri, **(engine_options or {})}
+        keys.append(key)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    db.replica_keys = keys
+    db.replica_router = ReplicaRouter({})
+    return keys
+
+
+def start_replica_router(app, db, check_interval=10, max_lag=30, read_after_write_window=5):
+    """
+    Build the router from the engines created by db.init_app(app) and start health checks
+    """
+    with app.app_context():
+        engines = {key: db.engines[key] for key in getattr(db, 'replica_keys', [])}
+    router = ReplicaRouter(engines, check_interval=check_interval, max_lag=max_lag,
+                           read_after_write_window=read_after_write_window)
+    db.replica_router = router
+    if engines:
+        router.check()
+        router.start()
+        logger.info(f"Routing reads to {len(engines)} replica(s): {sorted(router.healthy)} healthy")
+    return router
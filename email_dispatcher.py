@@ -0,0 +1,295 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from os import environ
+
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+logger = logging.getLogger(__name__)
+
+# SES error codes and per-destination bulk statuses that are worth retrying;
+# anything else is treated as permanent
+RETRYABLE_ERRORS = {
+    'Throttling', 'ThrottlingException', 'TooManyRequestsException',
+    'ServiceUnavailable', 'InternalFailure', 'RequestTimeout',
+    'TransientFailure', 'AccountThrottled', 'CircuitOpen'
+}
+
+# botocore errors raised on the way to SES (timeouts, dropped connections); other
+# BotoCoreErrors such as missing credentials or invalid parameters won't fix themselves
+TRANSPORT_ERRORS = (BotoConnectionError, HTTPClientError)
+
+WELCOME_TEMPLATE = 'flask-app-welcome'
+WELCOME_SUBJECT = "Welcome to Flask App!"
+WELCOME_TEXT = """
+    Hi {{username}},
+
+    Welcome to Flask App! {{#if created_by}}Your account has been created by {{created_by}}.{{else}}Your account has been successfully created.{{/if}}
+
+    Best regards,
+    Flask App Team
+"""
+WELCOME_HTML = """
+    <h2>Welcome to Flask App!</h2>
+    <p>Hi {{username}},</p>
+    <p>Welcome to Flask App! {{#if created_by}}Your account has been created by {{created_by}}.{{else}}Your account has been successfully created.{{/if}}</p>
+    <p>Best regards,<br>Flask App Team</p>
+"""
+
+
+class EmailJob:
+    def __init__(self, recipient, subject, body_text, body_html=None, template=None, template_data=None):
+        self.recipient = recipient
+        self.subject = subject
+        self.body_text = body_text
+        self.body_html = body_html
+        self.template = template
+        self.template_data = template_data
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+
+class EmailDispatcher:
+    """
+    Sends emails from a bounded in-process queue on a small worker pool.
+
+    Jobs that share an SES template are grouped into SendBulkTemplatedEmail calls,
+    everything else goes out one SendEmail at a time. Retryable failures are
+    re-queued with exponential backoff and jitter.
+    """
+
+    def __init__(self, email_service, max_queue_size=None, workers=None, max_batch=50,
+                 max_retries=None, backoff_base=0.5, backoff_max=30):
+        self.email_service = email_service
+        self.max_batch = max_batch
+        self.workers = int(workers or environ.get('EMAIL_WORKERS', 2))
+        self.max_retries = int(max_retries if max_retries is not None else environ.get('EMAIL_MAX_RETRIES', 3))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue = queue.Queue(maxsize=int(max_queue_size or environ.get('EMAIL_QUEUE_SIZE', 1000)))
+        self.templates = {}
+        self._available_templates = set()
+        self._threads = []
+        self._started = False
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        self._latencies = deque(maxlen=500)
+        self._counters = {'enqueued': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'dropped': 0}
+
+    def register_template(self, name, subject, body_text, body_html):
+        """Register an SES template to be created when the workers start"""
+        self.templates[name] = (subject, body_text, body_html)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'email-dispatcher-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._sync_templates, name='email-templates', daemon=True).start()
+        if not self._atexit_registered:
+            # start() runs again in each forked worker, which inherits the registration
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+        logger.info(f"Email dispatcher started with {self.workers} workers")
+
+    def _sync_templates(self):
+        for name, (subject, body_text, body_html) in self.templates.items():
+            try:
+                self.email_service.ensure_template(name, subject, body_text, body_html)
+                self._available_templates.add(name)
+            except (ClientError, BotoCoreError) as e:
+                logger.warning(f"SES template {name} unavailable, sending individually: {str(e)}")
+
+    def enqueue(self, recipient, subject, body_text, body_html=None, template=None, template_data=None):
+        """
+        Queue an email for background delivery. Returns False if the queue is full.
+        """
+        self.start()
+        job = EmailJob(recipient, subject, body_text, body_html, template, template_data)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning(f"Email queue full, dropping email to {recipient}")
+            return False
+        self._count('enqueued')
+        return True
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    next_job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_job is None:
+                    # Put the sentinel back for after this batch
+                    self.queue.task_done()
+                    self.queue.put(None)
+                    break
+                batch.append(next_job)
+            try:
+                self._send_batch(batch)
+            except Exception as e:
+                logger.error(f"Unexpected error sending email batch: {str(e)}", exc_info=True)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _send_batch(self, batch):
+        grouped = {}
+        for job in batch:
+            if job.template in self._available_templates:
+                grouped.setdefault(job.template, []).append(job)
+            else:
+                self._send_single(job)
+        for template, jobs in grouped.items():
+            if len(jobs) == 1:
+                self._send_single(jobs[0])
+            else:
+                self._send_bulk(template, jobs)
+
+    def _send_single(self, job):
+        job.attempts += 1
+        started = time.monotonic()
+        try:
+            self.email_service.deliver(job.recipient, job.subject, job.body_text, job.body_html)
+            self._record_sent(started, 1)
+        except ClientError as e:
+            self._handle_failure(job, e.response['Error']['Code'], str(e), getattr(e, 'retry_after', None))
+        except BotoCoreError as e:
+            self._handle_failure(job, self._botocore_code(e), str(e))
+
+    def _send_bulk(self, template, jobs):
+        for job in jobs:
+            job.attempts += 1
+        started = time.monotonic()
+        try:
+            statuses = self.email_service.send_bulk_templated_email(
+                template, [(job.recipient, job.template_data) for job in jobs]
+            )
+        except ClientError as e:
+            for job in jobs:
+                self._handle_failure(job, e.response['Error']['Code'], str(e), getattr(e, 'retry_after', None))
+            return
+        except BotoCoreError as e:
+            for job in jobs:
+                self._handle_failure(job, self._botocore_code(e), str(e))
+            return
+
+        sent = 0
+        for job, status in zip(jobs, statuses):
+            if status == 'Success':
+                sent += 1
+            else:
+                self._handle_failure(job, status, status)
+        self._record_sent(started, sent)
+
+    @staticmethod
+    def _botocore_code(error):
+        """Transport errors are retried like a timeout; the class name of anything else fails the job"""
+        return 'RequestTimeout' if isinstance(error, TRANSPORT_ERRORS) else type(error).__name__
+
+    def _record_sent(self, started, count):
+        latency = time.monotonic() - started
+        with self._lock:
+            self._counters['sent'] += count
+            self._latencies.append(latency)
+
+    def _handle_failure(self, job, code, error, retry_after=None):
+        if code == 'CircuitOpen':
+            # SES was never called, so this doesn't use up an attempt; wait out the open circuit
+            job.attempts -= 1
+        if code in RETRYABLE_ERRORS and job.attempts <= self.max_retries:
+            if retry_after is not None:
+                # Spread the waiting emails a little so they don't all hit the half-open trial
+                delay = retry_after + random.uniform(0, self.backoff_base * 2)
+            else:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (job.attempts - 1)))
+                delay = random.uniform(delay / 2, delay)
+            self._count('retried')
+            logger.info(f"Retrying email to {job.recipient} in {delay:.1f}s ({code})")
+            timer = threading.Timer(delay, self._requeue, args=(job,))
+            timer.daemon = True
+            timer.start()
+            return
+        self._count('failed')
+        if code == 'MessageRejected':
+            logger.info(f"Email not sent (address not verified): {job.recipient}")
+        else:
+            logger.warning(f"Could not send email to {job.recipient}: {error}")
+
+    def _requeue(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning(f"Email queue full, dropping retry to {job.recipient}")
+
+    def stats(self):
+        """
+        Queue depth, delivery counters and send latency in milliseconds
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+        latency = {}
+        if latencies:
+            latency = {
+                'avg_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+                'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+                'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2)
+            }
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'workers': self.workers,
+            'bulk_templates': sorted(self._available_templates),
+            'latency': latency,
+            **counters
+        }
+
+    def reset_after_fork(self):
+        """
+        Forget the parent's worker threads and queued emails in a forked
+        process; workers start again on the next enqueue
+        """
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started = False
+
+    def shutdown(self, timeout=5):
+        """
+        Give queued emails a chance to go out, then stop the workers
+        """
+        if not self._started:
+            return
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self.queue.put(None, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._started = False
+        self._threads = []
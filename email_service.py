@@ -1,42 +1,103 @@
-import boto3
 from botocore.exceptions import ClientError
+import json
 import logging
 
+from aws_clients import aws_client
+
 logger = logging.getLogger(__name__)
 
+# SES caps SendBulkTemplatedEmail at 50 destinations per call
+MAX_BULK_DESTINATIONS = 50
+
 class EmailService:
     def __init__(self, region_name='us-east-1'):
-        self.ses_client = boto3.client('ses', region_name=region_name)
+        self.region_name = region_name
+        self.ses_client = aws_client('ses', region_name=region_name)
         self.sender = "direselign@gmail.com"  # Update this
 
-    def send_email(self, recipient, subject, body_text, body_html=None):
-        try:
-            message = {
-                'Subject': {
-                    'Data': subject
-                },
-                'Body': {
-                    'Text': {
-                        'Data': body_text
-                    }
+    def reconnect(self):
+        """Re-create the SES client, e.g. in a forked worker"""
+        self.ses_client = aws_client('ses', region_name=self.region_name)
+
+    def deliver(self, recipient, subject, body_text, body_html=None):
+        """
+        Send a single email, raising ClientError on failure
+        """
+        message = {
+            'Subject': {
+                'Data': subject
+            },
+            'Body': {
+                'Text': {
+                    'Data': body_text
                 }
             }
+        }
+
+        if body_html:
+            message['Body']['Html'] = {'Data': body_html}
 
-            if body_html:
-                message['Body']['Html'] = {'Data': body_html}
-
-            response = self.ses_client.send_email(
-                Source=self.sender,
-                Destination={
-                    'ToAddresses': [recipient]
-                },
-                Message=message
-            )
-            logger.info(f"Email sent! Message ID: {response['MessageId']}")
+        response = self.ses_client.send_email(
+            Source=self.sender,
+            Destination={
+                'ToAddresses': [recipient]
+            },
+            Message=message
+        )
+        logger.info(f"Email sent! Message ID: {response['MessageId']}")
+        return response['MessageId']
+
+    def send_email(self, recipient, subject, body_text, body_html=None):
+        try:
+            self.deliver(recipient, subject, body_text, body_html)
             return True
         except ClientError as e:
             if e.response['Error']['Code'] == 'MessageRejected':
                 logger.info(f"Email not sent (address not verified): {recipient}")
             else:
                 logger.warning(f"Could not send email to {recipient}: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+    def ensure_template(self, name, subject, body_text, body_html):
+        """
+        Create or update an SES template so it can be used for bulk sends
+        """
+        template = {
+            'TemplateName': name,
+            'SubjectPart': subject,
+            'TextPart': body_text,
+            'HtmlPart': body_html
+        }
+        try:
+            self.ses_client.create_template(Template=template)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'AlreadyExists':
+                raise
+            self.ses_client.update_template(Template=template)
+
+    def send_bulk_templated_email(self, template_name, destinations):
+        """
+        Send one templated email per destination in a single SendBulkTemplatedEmail call.
+
+        destinations is a list of (recipient, template_data) tuples; returns a list of
+        SES status codes ('Success' or an error code) in the same order.
+        """
+        if len(destinations) > MAX_BULK_DESTINATIONS:
+            raise ValueError(f"At most {MAX_BULK_DESTINATIONS} destinations per bulk send")
+
+        response = self.ses_client.send_bulk_templated_email(
+            Source=self.sender,
+            Template=template_name,
+            DefaultTemplateData='{}',
+            Destinations=[
+                {
+                    'Destination': {'ToAddresses': [recipient]},
+                    'ReplacementTemplateData': json.dumps(template_data or {})
+                }
+                for recipient, template_data in destinations
+            ]
+        )
+        statuses = [status['Status'] for status in response['Status']]
+        logger.info(f"Bulk email sent with template {template_name}: "
+                    f"{statuses.count('Success')}/{len(statuses)} accepted")
+        return statuses
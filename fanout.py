@@ -0,0 +1,91 @@
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os import environ
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent calls made by one fan_out()
+FANOUT_CONCURRENCY = int(environ.get('FANOUT_CONCURRENCY', 10))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def gevent_active():
+    """True when running under a gevent worker (sockets are monkey-patched)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def patch_psycopg():
+    """
+    Make psycopg2 yield to other greenlets while waiting on Postgres.
+    Must run before the first database connection is opened.
+    """
+    if not gevent_active():
+        return False
+    try:
+        from psycogreen.gevent import patch_psycopg as _patch
+    except ImportError:
+        logger.warning("psycogreen is not installed; database calls will block the gevent worker")
+        return False
+    _patch()
+    logger.info("Patched psycopg2 for gevent")
+    return True
+
+
+def _get_executor():
+    """
+    Lazily create the shared fan-out thread pool, re-creating it after a fork
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=int(environ.get('FANOUT_THREADS', 32)),
+                thread_name_prefix='fanout'
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def fan_out(func, items, concurrency=None):
+    """
+    Call func(item) for every item concurrently and return the results in input order.
+
+    Under gevent each call runs in its own greenlet; otherwise a shared thread
+    pool is used (the calls are network-bound, so they overlap despite the GIL).
+    Exceptions propagate to the caller, so func should handle expected errors itself.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    concurrency = min(concurrency or FANOUT_CONCURRENCY, len(items))
+
+    if gevent_active():
+        from gevent.pool import Pool
+        return Pool(concurrency).map(func, items)
+
+    # Nested fan-outs run inline rather than waiting on the pool they occupy
+    if threading.current_thread().name.startswith('fanout'):
+        return [func(item) for item in items]
+
+    executor = _get_executor()
+    futures = {}
+    pending = set()
+    for index, item in enumerate(items):
+        if len(pending) >= concurrency:
+            _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        future = executor.submit(func, item)
+        futures[future] = index
+        pending.add(future)
+    results = [None] * len(items)
+    for future, index in futures.items():
+        results[index] = future.result()
+    return results
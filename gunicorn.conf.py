@@ -0,0 +1,36 @@
+"""
+gunicorn settings: gunicorn -c gunicorn.conf.py
+
+The app is built once in the master (preload_app), so imports, the SSM
+config and compiled templates are shared copy-on-write by the workers.
+Sockets, connection pools and threads must not be shared across fork(), so
+the master releases its resources before forking and every worker
+re-creates them in post_fork (see resources.py).
+"""
+from os import environ
+
+wsgi_app = 'app:create_app()'
+bind = environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(environ.get('GUNICORN_WORKERS', 3))
+worker_class = environ.get('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+preload_app = environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+timeout = int(environ.get('GUNICORN_TIMEOUT', 120))
+
+if preload_app and worker_class == 'gevent':
+    # The gevent worker patches only after fork; with a preloaded app the
+    # master's locks, sockets and the psycopg2 wait callback would be unpatched
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def when_ready(server):
+    """Runs in the master once the app is loaded, before the first fork"""
+    if server.cfg.preload_app:
+        from resources import resources
+        resources.close_all()
+
+
+def post_fork(server, worker):
+    from resources import resources
+    resources.after_fork()
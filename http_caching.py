@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from os import environ
+
+from flask import current_app, make_response, render_template, request, session
+from jinja2 import FileSystemBytecodeCache, TemplateError
+
+from local_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Cache-Control for fingerprinted static URLs: the URL changes whenever the content does
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _last_modified(directory):
+    """Newest mtime of any file under directory, as an aware datetime"""
+    newest = 0.0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+            except OSError:
+                continue
+    return datetime.fromtimestamp(int(newest), timezone.utc)
+
+
+class PageCache:
+    """
+    Rendered output of templates that don't depend on per-request data, with
+    validators so browsers can revalidate with a 304 instead of a full page.
+
+    Pages are keyed by template, variant (e.g. the logged-in user) and context.
+    The ETag is a hash of the body, so it matches across workers and instances
+    running the same templates; Last-Modified is the newest template mtime.
+    Responses carrying flashed messages are never cached.
+    """
+
+    def __init__(self, app, maxsize=256, ttl=300):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.last_modified = _last_modified(os.path.join(app.root_path, app.template_folder))
+
+    def render(self, template_name, variant=None, cache_control='private, no-cache', **context):
+        if session.get('_flashes'):
+            return render_template(template_name, **context)
+
+        key = (template_name, variant, tuple(sorted(context.items())))
+        entry = self.cache.get(key)
+        if entry is None:
+            body = render_template(template_name, **context)
+            entry = (body, hashlib.sha1(body.encode('utf-8')).hexdigest())
+            self.cache.set(key, entry)
+        body, etag = entry
+
+        response = make_response(body)
+        response.set_etag(etag)
+        response.last_modified = self.last_modified
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+
+def init_page_cache(app):
+    """Attach a PageCache to app for render_cached()"""
+    page_cache = PageCache(
+        app,
+        maxsize=int(environ.get('PAGE_CACHE_SIZE', 256)),
+        ttl=float(environ.get('PAGE_CACHE_TTL', 300))
+    )
+    app.extensions['page_cache'] = page_cache
+    return page_cache
+
+
+def render_cached(template_name, variant=None, **context):
+    """render_template() with ETag/Last-Modified and 304 support, see PageCache"""
+    return current_app.extensions['page_cache'].render(template_name, variant=variant, **context)
+
+
+class StaticAssets:
+    """
+    Content-hash fingerprints for files under the static folder.
+
+    url_for('static', filename=...) gains a v=<hash> query parameter, and
+    requests carrying the current hash are served as immutable for a year.
+    """
+
+    def __init__(self, app):
+        self.static_folder = app.static_folder
+        self._hashes = {}
+
+    def fingerprint(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()[:12]
+        self._hashes[filename] = (mtime, fingerprint)
+        return fingerprint
+
+
+def init_static_assets(app):
+    """Fingerprint static URLs and cache fingerprinted responses forever"""
+    assets = StaticAssets(app)
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = assets.fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    @app.after_request
+    def cache_static_assets(response):
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            version = request.args.get('v')
+            filename = (request.view_args or {}).get('filename')
+            if version and filename and version == assets.fingerprint(filename):
+                response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+    return assets
+
+
+def init_template_cache(app):
+    """
+    Persist compiled templates so new workers skip Jinja compilation.
+    JINJA_CACHE_DIR sets the directory; an empty value disables the cache.
+    """
+    directory = environ.get('JINJA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'flask-app-jinja'))
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Jinja bytecode cache disabled: {str(e)}")
+        return None
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    return directory
+
+
+def preload_templates(app):
+    """
+    Compile every template up front. Under gunicorn --preload this runs in the
+    master, so workers inherit the compiled templates instead of each loading
+    them on first use.
+    """
+    loaded = 0
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(name)
+            loaded += 1
+        except TemplateError as e:
+            logger.warning(f"Could not preload template {name}: {str(e)}")
+    return loaded
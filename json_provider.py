@@ -0,0 +1,98 @@
+import json
+import logging
+from os import environ
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    app.json provider backed by orjson; types orjson doesn't know natively
+    fall back to Flask's default conversions (Decimal, dataclasses, __html__)
+    """
+
+    options = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for stdlib options (indent, separators, ...) get stdlib behaviour
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.options).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self.options
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=self.default, option=option) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+PROVIDERS = {
+    'stdlib': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def is_json(text):
+    """True if text is one complete, valid JSON document"""
+    try:
+        if orjson is not None:
+            orjson.loads(text)
+        else:
+            json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def json_text(text):
+    """
+    text itself if it is valid JSON, otherwise text encoded as a JSON string,
+    so it can be spliced into a larger document without corrupting it
+    """
+    return text if is_json(text) else json.dumps(text)
+
+
+def raw_json(text, trusted=False):
+    """
+    Embed an already-serialized JSON document in a response without re-encoding it.
+    Text that is not valid JSON (e.g. plain-text bodies from another producer)
+    is embedded as a string; pass trusted=True for text known to be JSON to skip
+    that check. With any provider other than orjson the document is parsed so
+    it can be re-encoded.
+    """
+    if isinstance(current_app.json, OrjsonProvider) and hasattr(orjson, 'Fragment'):
+        return orjson.Fragment(text if trusted else json_text(text))
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def init_json(app):
+    """
+    Install the JSON provider named by JSON_PROVIDER ('orjson' by default,
+    falling back to 'stdlib' when orjson is not installed)
+    """
+    name = environ.get('JSON_PROVIDER', 'orjson')
+    if name == 'orjson' and orjson is None:
+        logger.warning("orjson is not installed, using the stdlib JSON provider")
+        name = 'stdlib'
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown JSON_PROVIDER {name}, expected one of {sorted(PROVIDERS)}")
+    app.json = PROVIDERS[name](app)
+    return app.json
@@ -0,0 +1,186 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from os import environ
+
+from flask import g, has_request_context, request
+
+# Attributes every LogRecord has; anything else was passed via extra= and is logged as a field
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+# Never written to logs, even when header logging is turned on
+REDACTED_HEADERS = {'authorization', 'cookie', 'x-debug-log'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any extra= fields"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tag records logged during a request with its request id"""
+
+    def filter(self, record):
+        if has_request_context() and 'request_id' in g:
+            record.request_id = g.request_id
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records without blocking the request thread; when the queue is full
+    the record is dropped and counted instead
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, since args/exc_info may not survive the thread hop
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_atexit_registered = False
+
+
+def configure_logging(extra_handlers=()):
+    """
+    Route all logging through a bounded queue drained by a listener thread that
+    writes JSON to stdout and to any extra handlers (e.g. CloudWatch).
+    Returns the QueueListener.
+    """
+    level = environ.get('LOG_LEVEL', 'INFO').upper()
+    log_queue = queue.Queue(maxsize=int(environ.get('LOG_QUEUE_SIZE', 10000)))
+
+    formatter = JsonFormatter()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    handlers = [stream_handler, *[handler for handler in extra_handlers if handler]]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Third-party debug output is rarely useful and very chatty
+    for name in ('botocore', 'boto3', 'urllib3', 's3transfer', 'watchtower'):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+    global _listener, _atexit_registered
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listener = listener
+    if not _atexit_registered:
+        # Called again after fork, so register once and stop whichever listener is current
+        atexit.register(stop_logging)
+        _atexit_registered = True
+    return listener
+
+
+def stop_logging():
+    """Flush and stop the current listener; safe to call more than once"""
+    listener = _listener
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+
+
+def parse_sample_rates(spec):
+    """Parse 'static=0,main.receive_messages=0.1' into {endpoint: rate}"""
+    rates = {}
+    for item in spec.split(','):
+        endpoint, _, rate = item.partition('=')
+        if endpoint.strip() and rate.strip():
+            rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+def init_request_logging(app, logger):
+    """
+    Log one structured line per request, sampled per endpoint.
+
+    LOG_SAMPLE_RATES sets per-endpoint rates ('default' applies to the rest);
+    server errors are always logged. Sending X-Debug-Log with the value of
+    LOG_DEBUG_TOKEN adds headers and body for that one request.
+    """
+    rates = parse_sample_rates(environ.get('LOG_SAMPLE_RATES', ''))
+    default_rate = rates.pop('default', 1.0)
+    debug_token = environ.get('LOG_DEBUG_TOKEN')
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        g.log_debug = bool(debug_token) and request.headers.get('X-Debug-Log') == debug_token
+        rate = rates.get(request.endpoint, default_rate)
+        g.log_sampled = g.log_debug or rate >= 1 or random.random() < rate
+
+    @app.after_request
+    def write_request_log(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        if not (g.get('log_sampled') or response.status_code >= 500):
+            return response
+
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000, 2),
+            'remote_addr': request.remote_addr
+        }
+        if g.get('log_debug'):
+            fields['headers'] = {
+                name: value for name, value in request.headers.items()
+                if name.lower() not in REDACTED_HEADERS
+            }
+            if request.form:
+                fields['body'] = {
+                    name: '***' if 'password' in name.lower() else value
+                    for name, value in request.form.items()
+                }
+            elif request.method in ('POST', 'PUT', 'PATCH'):
+                fields['body'] = request.get_data(as_text=True)[:10000]
+        logger.info('Request handled', extra=fields)
+        return response
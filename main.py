@@ -1,11 +1,19 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, jsonify
+from http_caching import init_page_cache, init_static_assets, init_template_cache, render_cached
+from json_provider import init_json
+from compression import init_compression
 
 app = Flask(__name__)
+init_json(app)
+init_compression(app)
+init_page_cache(app)
+init_static_assets(app)
+init_template_cache(app)
 
 # Home Page (Jinja2 Rendering)
 @app.route("/")
 def home():
-    return render_template("main.html", title="Welcome to Flask")
+    return render_cached("main.html", title="Welcome to Flask")
 
 # JSON API Endpoint
 @app.route("/api/data")
@@ -0,0 +1,13 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Example message processor function
+def process_message(message_body):
+    """
+    Process received messages (customize this based on your needs).
+    Used by POST /api/process-messages and by the standalone consumer (consumer.py),
+    so it must stay a picklable, module-level function.
+    """
+    logger.info(f"Processing message: {message_body}")
+    # Add your message processing logic here
@@ -0,0 +1,229 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from json_provider import json_text
+
+logger = logging.getLogger(__name__)
+
+# Sentinel telling a subscriber's stream to end so the browser reconnects
+_RESET = object()
+
+
+def sse_event(event, data):
+    """Format one server-sent event; multi-line data is split across data: lines"""
+    lines = ''.join(f"data: {line}\n" for line in data.splitlines() or [''])
+    return f"event: {event}\n{lines}\n"
+
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class MessageBroadcaster:
+    """
+    One long-polling SQS fetcher per process, fanned out to every connected
+    browser over server-sent events.
+
+    The fetcher peeks: it receives with VisibilityTimeout=0, so messages stay
+    visible to the consumer, and publishes each message ID only once while it
+    keeps showing up. Peeking still counts as a receive, so a redrive policy
+    on the queue would see it. Polls are at least poll_interval seconds apart,
+    since a non-empty queue answers long polls immediately.
+
+    The fetcher only runs while someone is subscribed, so idle pages cost no
+    SQS calls, and N open pages cost the same as one. Each subscriber has a
+    bounded queue: a client that falls behind is dropped with a 'reset' event
+    and reconnects to a fresh snapshot instead of holding memory. Idle streams
+    get a comment line every heartbeat seconds to keep proxies from timing out.
+
+    Each open stream holds its worker for as long as it is connected, so the
+    endpoint is only served by gevent workers.
+    """
+
+    def __init__(self, sqs_service, wait_time=20, max_messages=10, queue_size=100, heartbeat=15,
+                 max_subscribers=100, recent_size=500, recent_ttl=60, poll_interval=2):
+        self.sqs_service = sqs_service
+        self.wait_time = wait_time
+        self.poll_interval = poll_interval
+        self.max_messages = max_messages
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self.recent_size = recent_size
+        self.recent_ttl = recent_ttl
+        self._subscribers = set()
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._counters = {'polls': 0, 'messages': 0, 'events': 0, 'dropped_subscribers': 0, 'rejected': 0}
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='sqs-message-stream', daemon=True)
+        self._thread.start()
+
+    def subscribe(self):
+        """Register a subscriber, or return None when at max_subscribers"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self._counters['rejected'] += 1
+                return None
+            subscriber = Subscriber(self.queue_size)
+            self._subscribers.add(subscriber)
+            self._ensure_started()
+        self._wakeup.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _format(self, message):
+        """Event payload for one message, embedding the JSON body without re-encoding it"""
+        payload_ref = self.sqs_service.payload_ref(message)
+        fields = {
+            'message_id': message['MessageId'],
+            'receipt_handle': message['ReceiptHandle'],
+            'payload_ref': payload_ref
+        }
+        # Offloaded payloads are fetched by the page on demand; bodies from other producers may not be JSON
+        if payload_ref:
+            body = 'null'
+        elif self.sqs_service.body_is_json(message):
+            body = self.sqs_service.message_body(message)
+        else:
+            body = json_text(self.sqs_service.message_body(message))
+        return f"{json.dumps(fields)[:-1]}, \"body\": {body}}}"
+
+    def publish(self, event, data):
+        """Send an event to every subscriber, dropping those whose queue is full"""
+        encoded = sse_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._counters['events'] += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(encoded)
+            except queue.Full:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber):
+        self.unsubscribe(subscriber)
+        subscriber.dropped = True
+        with self._lock:
+            self._counters['dropped_subscribers'] += 1
+        # Make room for the reset marker so the stream ends promptly
+        try:
+            subscriber.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscriber.queue.put_nowait(_RESET)
+        except queue.Full:
+            pass
+
+    def _remember(self, message_id, receipt_handle, data):
+        """Record a received message; returns False if it was already known"""
+        with self._lock:
+            known = self._recent.get(message_id)
+            if known is not None:
+                # Keep the receipt handle the pages were given, so forget() still matches it
+                receipt_handle, data = known[0], known[1]
+            self._recent[message_id] = (receipt_handle, data, time.monotonic())
+            self._recent.move_to_end(message_id)
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+        return known is None
+
+    def snapshot(self):
+        """Recently received messages, for newly connected subscribers"""
+        cutoff = time.monotonic() - self.recent_ttl
+        with self._lock:
+            for message_id in [key for key, (_, _, seen) in self._recent.items() if seen < cutoff]:
+                del self._recent[message_id]
+            return [data for _, data, _ in self._recent.values()]
+
+    def forget(self, receipt_handles):
+        """Drop deleted messages from the snapshot and tell connected pages to remove them"""
+        handles = set(receipt_handles)
+        with self._lock:
+            removed = [message_id for message_id, (handle, _, _) in self._recent.items() if handle in handles]
+            for message_id in removed:
+                del self._recent[message_id]
+        for message_id in removed:
+            self.publish('deleted', json.dumps({'message_id': message_id}))
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._lock:
+                active = bool(self._subscribers)
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            success, messages = self.sqs_service.receive_messages(
+                max_messages=self.max_messages, wait_time=self.wait_time, visibility_timeout=0
+            )
+            with self._lock:
+                self._counters['polls'] += 1
+            if not success:
+                failures += 1
+                time.sleep(min(30, 2 ** failures))
+                continue
+            failures = 0
+
+            published = 0
+            for message in messages:
+                with self._lock:
+                    known = message['MessageId'] in self._recent
+                if known:
+                    self._remember(message['MessageId'], message['ReceiptHandle'], None)
+                    continue
+                try:
+                    data = self._format(message)
+                except Exception as e:
+                    logger.error(f"Error formatting message {message['MessageId']} for streaming: {str(e)}")
+                    continue
+                if self._remember(message['MessageId'], message['ReceiptHandle'], data):
+                    self.publish('message', data)
+                    published += 1
+            with self._lock:
+                self._counters['messages'] += published
+            if messages:
+                time.sleep(self.poll_interval)
+
+    def stream(self, subscriber):
+        """Generator of server-sent events for one subscriber; unsubscribes when the client goes away"""
+        try:
+            yield 'retry: 3000\n\n'
+            yield sse_event('snapshot', f"[{', '.join(self.snapshot())}]")
+            while True:
+                try:
+                    event = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is _RESET:
+                    yield sse_event('reset', '{}')
+                    return
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'recent': len(self._recent),
+                **self._counters
+            }
@@ -0,0 +1,374 @@
+import atexit
+import fcntl
+import functools
+import glob
+import ipaddress
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from os import environ
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'flask_app_request_duration_seconds': 'Request latency by Flask endpoint',
+    'flask_app_requests_total': 'Requests by Flask endpoint and status code',
+    'flask_app_dependency_duration_seconds': 'Time spent calling Postgres, SQS, SES and memcached',
+}
+
+
+# Counters and histograms of processes that have exited
+RETIRED_SNAPSHOT = 'retired.json'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_loopback(address):
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+class MetricsRegistry:
+    """
+    In-process histograms and counters.
+
+    Each process periodically writes a snapshot to METRICS_DIR/<pid>.json; the
+    /metrics endpoint merges every snapshot so any gunicorn worker can answer
+    for the whole box. Snapshots of processes that have exited are folded into
+    retired.json, keeping their counters and histograms (so totals never go
+    backwards) but dropping their per-pid gauges.
+    """
+
+    def __init__(self, directory=None, flush_interval=5):
+        self.directory = directory or environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'flask-app-metrics'))
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = []
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._atexit_registered = False
+
+    @staticmethod
+    def _key(name, labels):
+        return json.dumps([name, sorted(labels.items())])
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_gauges(self, name, collect):
+        """
+        collect() returns {metric_suffix: number}; reported per process as <name>_<suffix>{pid=...}
+        """
+        self._gauges.append((name, collect))
+
+    def _snapshot(self):
+        gauges = {}
+        for name, collect in self._gauges:
+            try:
+                for suffix, value in collect().items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        gauges[self._key(f"{name}_{suffix}", {'pid': str(os.getpid())})] = value
+            except Exception as e:
+                logger.debug(f"Gauge collector {name} failed: {str(e)}")
+        with self._lock:
+            return {
+                'histograms': json.loads(json.dumps(self._histograms)),
+                'counters': dict(self._counters),
+                'gauges': gauges
+            }
+
+    def flush(self):
+        """Write this process's snapshot where the other workers can read it"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+
+    def _run(self, stop):
+        while not stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Start this process's periodic snapshot writer, if it isn't running yet"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name='metrics-flush', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            if not self._atexit_registered:
+                atexit.register(self._flush_at_exit)
+                self._atexit_registered = True
+
+    def after_fork(self):
+        """
+        In a forked worker: replace the locks, which the parent's writer may
+        have held at fork time, and start this process's writer
+        """
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.start()
+
+    def stop(self, timeout=2):
+        """
+        Stop the writer and remove this process's snapshot, e.g. in the
+        gunicorn master before it forks the workers
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self._thread = None
+        self._pid = None
+        try:
+            os.unlink(os.path.join(self.directory, f"{os.getpid()}.json"))
+        except OSError:
+            pass
+
+    def _flush_at_exit(self):
+        # Only processes that ran a writer have anything worth keeping
+        if self._pid == os.getpid():
+            self.flush()
+
+    @staticmethod
+    def _merge(histograms, counters, snapshot):
+        for key, histogram in snapshot['histograms'].items():
+            merged = histograms.setdefault(key, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+            merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+        for key, value in snapshot['counters'].items():
+            counters[key] = counters.get(key, 0) + value
+
+    def _retire(self, path):
+        """Fold the snapshot of an exited process into retired.json and remove it"""
+        claimed = f"{path}.retiring"
+        try:
+            # Only one worker wins the rename, so a snapshot is never folded in twice
+            os.rename(path, claimed)
+        except OSError:
+            return
+        retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+        try:
+            with open(os.path.join(self.directory, '.retired.lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                histograms, counters = {}, {}
+                for source in (retired_path, claimed):
+                    try:
+                        with open(source) as f:
+                            self._merge(histograms, counters, json.load(f))
+                    except (OSError, ValueError):
+                        continue
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'histograms': histograms, 'counters': counters, 'gauges': {}}, f)
+                os.replace(tmp_path, retired_path)
+            os.unlink(claimed)
+        except OSError as e:
+            logger.warning(f"Failed to retire metrics snapshot {path}: {str(e)}")
+
+    def collect(self):
+        """Merge the snapshots of every live process, plus those retired from exited ones"""
+        self.flush()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            name = os.path.basename(path)[:-len('.json')]
+            if name.isdigit() and not _pid_alive(int(name)):
+                self._retire(path)
+
+        histograms, counters, gauges = {}, {}, {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._merge(histograms, counters, snapshot)
+            gauges.update(snapshot.get('gauges', {}))
+        return histograms, counters, gauges
+
+    def render(self):
+        """Prometheus text exposition format"""
+        histograms, counters, gauges = self.collect()
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        def fmt(labels):
+            if not labels:
+                return ''
+            parts = []
+            for name, value in labels:
+                value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                parts.append(f'{name}="{value}"')
+            return '{' + ','.join(parts) + '}'
+
+        for key in sorted(histograms):
+            name, labels = json.loads(key)
+            histogram = histograms[key]
+            header(name, 'histogram')
+            for bound, count in zip(BUCKETS, histogram['buckets']):
+                lines.append(f"{name}_bucket{fmt(labels + [['le', str(bound)]])} {count}")
+            lines.append(f"{name}_bucket{fmt(labels + [['le', '+Inf']])} {histogram['count']}")
+            lines.append(f"{name}_sum{fmt(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{fmt(labels)} {histogram['count']}")
+        for key in sorted(counters):
+            name, labels = json.loads(key)
+            header(name, 'counter')
+            lines.append(f"{name}{fmt(labels)} {counters[key]}")
+        for key in sorted(gauges):
+            name, labels = json.loads(key)
+            header(name, 'gauge')
+            lines.append(f"{name}{fmt(labels)} {gauges[key]}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def _record_request_timing(dependency, elapsed):
+    if has_request_context():
+        timings = g.setdefault('dependency_timings', {})
+        timings[dependency] = timings.get(dependency, 0.0) + elapsed
+
+
+@contextmanager
+def track_dependency(dependency, operation):
+    """Time a call into an external dependency"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe('flask_app_dependency_duration_seconds', elapsed,
+                         dependency=dependency, operation=operation)
+        _record_request_timing(dependency, elapsed)
+
+
+def instrument(obj, dependency, methods):
+    """Wrap the given methods of obj so each call is timed as dependency"""
+    for name in methods:
+        original = getattr(obj, name)
+
+        @functools.wraps(original)
+        def wrapper(*args, _original=original, _operation=name, **kwargs):
+            with track_dependency(dependency, _operation):
+                return _original(*args, **kwargs)
+
+        setattr(obj, name, wrapper)
+    return obj
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+    registry.observe('flask_app_dependency_duration_seconds', elapsed, dependency='db', operation=operation)
+    _record_request_timing('db', elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def init_metrics(app):
+    """
+    Record latency per endpoint, add Server-Timing headers and serve /metrics.
+
+    Set METRICS_TOKEN to require 'Authorization: Bearer <token>' on /metrics;
+    without it, /metrics only answers requests from loopback addresses.
+    """
+    token = environ.get('METRICS_TOKEN')
+
+    @app.before_request
+    def start_request_timer():
+        # Started lazily: the gunicorn master loads the app but serves no requests
+        registry.start()
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_timing(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        registry.observe('flask_app_request_duration_seconds', elapsed, endpoint=endpoint, method=request.method)
+        registry.inc('flask_app_requests_total', endpoint=endpoint, method=request.method,
+                     status=str(response.status_code))
+
+        timings = g.get('dependency_timings', {})
+        server_timing = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in sorted(timings.items())]
+        app_time = max(0.0, elapsed - sum(timings.values()))
+        server_timing.append(f"app;dur={app_time * 1000:.1f}")
+        server_timing.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(server_timing)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        if not token and not _is_loopback(request.remote_addr):
+            return Response('Forbidden\n', status=403, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
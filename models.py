@@ -1,7 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+# Read-only queries are routed to replicas when any are configured (see db_routing)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -9,5 +11,13 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=True)
 
+    # Case-insensitive prefix search on the users listing
+    __table_args__ = (
+        db.Index('ix_user_username_lower', db.func.lower(username).label('username_lower'),
+                 postgresql_ops={'username_lower': 'text_pattern_ops'}),
+        db.Index('ix_user_email_lower', db.func.lower(email).label('email_lower'),
+                 postgresql_ops={'email_lower': 'text_pattern_ops'}),
+    )
+
     def __repr__(self):
         return f'<User {self.username}>' 
\ No newline at end of file
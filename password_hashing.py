@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from os import environ
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from fanout import gevent_active
+
+logger = logging.getLogger(__name__)
+
+# Werkzeug method string for new hashes, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+HASH_METHOD = environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+
+_pool = None
+_pool_pid = None
+_pool_workers = 1
+_pool_lock = threading.Lock()
+# Bulk hashing jobs (user imports) allowed to run at once in each worker
+_batch_slots = threading.BoundedSemaphore(int(environ.get('HASH_MAX_BATCHES', 1)))
+
+
+def _default_processes():
+    # Every gunicorn worker has its own pool; together they should not exceed the CPUs.
+    # GUNICORN_WORKERS defaults to 3, as in gunicorn.conf.py
+    return max(1, (os.cpu_count() or 1) // int(environ.get('GUNICORN_WORKERS', 3)))
+
+
+def _get_pool():
+    """
+    Lazily create the hashing process pool, re-creating it after a fork.
+
+    The pool processes are spawned rather than forked: a request worker has
+    gevent-patched state and background threads whose held locks a forked
+    child would inherit.
+    """
+    global _pool, _pool_pid, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool_workers = int(environ.get('HASH_PROCESSES', _default_processes()))
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=get_context('spawn'))
+            _pool_pid = os.getpid()
+            logger.info(f"Started password hashing pool with {_pool_workers} processes")
+        return _pool
+
+
+def hash_passwords(passwords):
+    """
+    Hash many passwords in parallel across the process pool, preserving order.
+    Raises HashingOverloaded when HASH_MAX_BATCHES batches are already running
+    in this worker.
+    """
+    passwords = list(passwords)
+    if not passwords:
+        return []
+    if not _batch_slots.acquire(blocking=False):
+        raise HashingOverloaded(retry_after=30)
+    try:
+        pool = _get_pool()
+        chunksize = max(1, len(passwords) // (_pool_workers * 4))
+        return list(pool.map(partial(generate_password_hash, method=HASH_METHOD), passwords, chunksize=chunksize))
+    finally:
+        _batch_slots.release()
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing executor is saturated; retry_after is in seconds"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Password hashing is overloaded')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a small dedicated thread pool.
+
+    At most max_concurrency hashes run at once and at most max_queue more may wait;
+    beyond that, or when a queued job has waited longer than queue_timeout,
+    HashingOverloaded is raised so the request can fail fast instead of tying
+    up the worker. hashlib's scrypt/pbkdf2 release the GIL, so the pool threads
+    hash in parallel with the request threads.
+
+    Under gevent the pool uses native threads (gevent's ThreadPoolExecutor):
+    patched threads would be greenlets, and a CPU-bound hash running on the
+    hub would stall every other request the worker is serving.
+    """
+
+    def __init__(self, max_concurrency=None, max_queue=None, queue_timeout=None, method=HASH_METHOD):
+        self.max_concurrency = int(max_concurrency or environ.get('HASH_MAX_CONCURRENCY', 2))
+        self.max_queue = int(max_queue if max_queue is not None else environ.get('HASH_MAX_QUEUE', 8))
+        self.queue_timeout = float(queue_timeout or environ.get('HASH_QUEUE_TIMEOUT', 2))
+        self.method = method
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(self.max_concurrency + self.max_queue)
+        self._method_prefix = None
+        self._lock = threading.Lock()
+        self._counters = {'completed': 0, 'rejected': 0, 'timed_out': 0, 'rehashed': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _get_executor(self):
+        """Lazily create the hashing pool, re-creating it after a fork"""
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                if gevent_active():
+                    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+                    self._executor = NativeThreadPoolExecutor(max_workers=self.max_concurrency)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                        thread_name_prefix='password-hash')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HashingOverloaded(retry_after=max(1, int(self.queue_timeout)))
+
+        enqueued = time.monotonic()
+
+        def task():
+            if time.monotonic() - enqueued > self.queue_timeout:
+                raise HashingOverloaded(retry_after=max(1, int(self.queue_timeout)))
+            return func(*args)
+
+        try:
+            result = self._get_executor().submit(task).result()
+        except HashingOverloaded:
+            self._count('timed_out')
+            raise
+        finally:
+            self._slots.release()
+        self._count('completed')
+        return result
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """
+        True if pwhash was made with different method or cost parameters than the current ones
+        """
+        if self._method_prefix is None:
+            # Let werkzeug expand defaults ('scrypt' -> 'scrypt:32768:8:1') once
+            self._method_prefix = generate_password_hash('', method=self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+    def upgrade(self, pwhash, password):
+        """
+        Return a fresh hash if pwhash uses outdated parameters, otherwise None.
+        Skipped (None) under overload; the upgrade happens on a later login instead.
+        """
+        if not self.needs_rehash(pwhash):
+            return None
+        try:
+            new_hash = self.generate(password)
+        except HashingOverloaded:
+            return None
+        self._count('rehashed')
+        return new_hash
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            'method': self.method,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            **counters
+        }
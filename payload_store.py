@@ -0,0 +1,275 @@
+import base64
+import gzip
+import json
+import logging
+import os
+import uuid
+from os import environ
+from urllib.parse import urlsplit
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from aws_clients import aws_client
+from config_loader import get_config
+
+logger = logging.getLogger(__name__)
+
+# Message attributes describing how the body was encoded
+ENCODING_ATTRIBUTE = 'PayloadEncoding'
+REF_ATTRIBUTE = 'PayloadRef'
+# Set by SQSService on bodies it serialized itself, so readers can skip validating them
+FORMAT_ATTRIBUTE = 'PayloadFormat'
+
+# SQS message size limit (body plus attributes)
+MAX_MESSAGE_BYTES = 262144
+
+# JSON text never starts with these bytes, so stored payloads can be sniffed
+GZIP_MAGIC = b'\x1f\x8b'
+
+# S3 DeleteObjects accepts up to 1000 keys per call
+MAX_DELETE_KEYS = 1000
+
+
+class PayloadError(Exception):
+    """Raised when an offloaded payload cannot be stored or fetched"""
+
+
+def message_size(body, message_attributes=None):
+    """Size of a message as SQS counts it against the 256 KB limit"""
+    size = len(body.encode('utf-8'))
+    for name, attribute in (message_attributes or {}).items():
+        size += len(name.encode('utf-8')) + len(attribute.get('DataType', '').encode('utf-8'))
+        value = attribute.get('StringValue') or attribute.get('BinaryValue') or ''
+        size += len(value) if isinstance(value, bytes) else len(value.encode('utf-8'))
+    return size
+
+
+class S3PayloadStore:
+    """Stores offloaded payloads as objects under s3://bucket/prefix"""
+
+    def __init__(self, bucket, prefix='sqs-payloads/', region_name='us-east-1'):
+        self.region_name = region_name
+        self.s3 = aws_client('s3', region_name=region_name)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def reconnect(self):
+        self.s3 = aws_client('s3', region_name=self.region_name)
+
+    def _key(self, ref):
+        parts = urlsplit(ref)
+        key = parts.path.lstrip('/')
+        if parts.scheme != 's3' or parts.netloc != self.bucket or not key.startswith(self.prefix):
+            raise PayloadError(f"Payload reference {ref} does not belong to this store")
+        return key
+
+    def put(self, data):
+        key = f"{self.prefix}{uuid.uuid4().hex}"
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=data)
+        except (ClientError, BotoCoreError) as e:
+            raise PayloadError(f"Error storing payload in S3: {str(e)}") from e
+        return f"s3://{self.bucket}/{key}"
+
+    def get(self, ref):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=self._key(ref))['Body'].read()
+        except (ClientError, BotoCoreError) as e:
+            raise PayloadError(f"Error fetching payload {ref}: {str(e)}") from e
+
+    def delete_many(self, refs):
+        """Delete payloads; returns the refs that could not be deleted"""
+        failed = []
+        keys = []
+        for ref in refs:
+            try:
+                keys.append((ref, self._key(ref)))
+            except PayloadError as e:
+                logger.error(str(e))
+                failed.append(ref)
+        for start in range(0, len(keys), MAX_DELETE_KEYS):
+            chunk = keys[start:start + MAX_DELETE_KEYS]
+            try:
+                response = self.s3.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for _, key in chunk], 'Quiet': True}
+                )
+            except (ClientError, BotoCoreError) as e:
+                logger.error(f"Error deleting payloads from S3: {str(e)}")
+                failed.extend(ref for ref, _ in chunk)
+                continue
+            errored = {error['Key'] for error in response.get('Errors', [])}
+            failed.extend(ref for ref, key in chunk if key in errored)
+        return failed
+
+
+class LocalPayloadStore:
+    """Filesystem stand-in for S3, for local development and benchmarks"""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def reconnect(self):
+        pass
+
+    def _path(self, ref):
+        parts = urlsplit(ref)
+        path = os.path.abspath(parts.path)
+        if parts.scheme != 'file' or os.path.dirname(path) != self.directory:
+            raise PayloadError(f"Payload reference {ref} does not belong to this store")
+        return path
+
+    def put(self, data):
+        path = os.path.join(self.directory, uuid.uuid4().hex)
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            raise PayloadError(f"Error storing payload in {self.directory}: {str(e)}") from e
+        return f"file://{path}"
+
+    def get(self, ref):
+        try:
+            with open(self._path(ref), 'rb') as f:
+                return f.read()
+        except OSError as e:
+            raise PayloadError(f"Error fetching payload {ref}: {str(e)}") from e
+
+    def delete_many(self, refs):
+        failed = []
+        for ref in refs:
+            try:
+                os.remove(self._path(ref))
+            except FileNotFoundError:
+                continue
+            except (OSError, PayloadError) as e:
+                logger.error(f"Error deleting payload {ref}: {str(e)}")
+                failed.append(ref)
+        return failed
+
+
+def payload_store_from_spec(spec, region_name='us-east-1'):
+    """
+    Build a store from 's3://bucket/prefix/' or 'file:///path'; returns None when spec is empty
+    """
+    if not spec:
+        return None
+    parts = urlsplit(spec)
+    if parts.scheme == 's3':
+        prefix = parts.path.lstrip('/')
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        return S3PayloadStore(parts.netloc, prefix=prefix or 'sqs-payloads/', region_name=region_name)
+    if parts.scheme == 'file':
+        return LocalPayloadStore(parts.path)
+    raise ValueError(f"Unsupported payload store {spec}, expected s3:// or file://")
+
+
+class PayloadCodec:
+    """
+    Encodes SQS message bodies for the wire and back.
+
+    Bodies of at least compress_threshold bytes are gzipped and base64-encoded
+    when that makes them smaller. Messages still larger than offload_threshold
+    are written to the payload store and replaced with a small pointer
+    (claim check). Both steps are recorded in message attributes, so plain
+    messages from other producers decode unchanged.
+    """
+
+    def __init__(self, store=None, compress_threshold=8192, offload_threshold=MAX_MESSAGE_BYTES - 4096):
+        self.store = store
+        self.compress_threshold = compress_threshold
+        self.offload_threshold = offload_threshold
+
+    def reconnect(self):
+        """Re-create the payload store's client, e.g. in a forked worker"""
+        if self.store is not None:
+            self.store.reconnect()
+
+    def encode(self, body, message_attributes=None):
+        """Return (body, message_attributes) ready to send"""
+        attributes = dict(message_attributes or {})
+        data = body.encode('utf-8')
+        encoding = None
+        if self.compress_threshold and len(data) >= self.compress_threshold:
+            compressed = gzip.compress(data, compresslevel=6)
+            # base64 adds a third, so only compress when the result is still smaller
+            if len(compressed) * 4 // 3 + 4 < len(data):
+                data, encoding = compressed, 'gzip'
+
+        if encoding:
+            attributes[ENCODING_ATTRIBUTE] = {'DataType': 'String', 'StringValue': encoding}
+            body = base64.b64encode(data).decode('ascii')
+
+        if self.store is not None and message_size(body, attributes) > self.offload_threshold:
+            ref = self.store.put(data)
+            attributes[REF_ATTRIBUTE] = {'DataType': 'String', 'StringValue': ref}
+            body = json.dumps({'payload_ref': ref})
+        return body, attributes
+
+    @staticmethod
+    def payload_ref(message):
+        """The claim-check reference of a received message, or None if the body is inline"""
+        attribute = (message.get('MessageAttributes') or {}).get(REF_ATTRIBUTE)
+        return attribute.get('StringValue') if attribute else None
+
+    @staticmethod
+    def is_json(message):
+        """True if the message's decoded body is known to be JSON (see FORMAT_ATTRIBUTE)"""
+        attribute = (message.get('MessageAttributes') or {}).get(FORMAT_ATTRIBUTE)
+        return bool(attribute) and attribute.get('StringValue') == 'json'
+
+    def decode(self, message):
+        """Return the original JSON text of a received message, fetching offloaded payloads"""
+        attributes = message.get('MessageAttributes') or {}
+        encoding = attributes.get(ENCODING_ATTRIBUTE, {}).get('StringValue')
+        ref = self.payload_ref(message)
+        if ref:
+            data = self.fetch(ref)
+        elif encoding:
+            data = base64.b64decode(message['Body'])
+        else:
+            return message['Body']
+        if encoding == 'gzip':
+            data = gzip.decompress(data)
+        return data.decode('utf-8')
+
+    def fetch(self, ref):
+        if self.store is None:
+            raise PayloadError(f"No payload store configured to fetch {ref}")
+        return self.store.get(ref)
+
+    def fetch_text(self, ref):
+        """Fetch an offloaded payload by reference alone and return its JSON text"""
+        data = self.fetch(ref)
+        if data[:2] == GZIP_MAGIC:
+            data = gzip.decompress(data)
+        return data.decode('utf-8')
+
+    def delete(self, refs):
+        """Remove offloaded payloads whose messages are gone; returns the refs that failed"""
+        refs = [ref for ref in refs if ref]
+        if not refs or self.store is None:
+            return []
+        failed = self.store.delete_many(refs)
+        if failed:
+            logger.warning(f"Failed to delete {len(failed)} offloaded payload(s); the bucket lifecycle will expire them")
+        return failed
+
+
+def payload_codec_from_config():
+    """
+    Codec configured from SSM (sqs/payload-store) or the environment:
+    SQS_PAYLOAD_STORE, SQS_COMPRESS_THRESHOLD (0 disables compression) and SQS_OFFLOAD_THRESHOLD
+    """
+    config = get_config()
+    store = payload_store_from_spec(
+        config.get('sqs/payload-store', env='SQS_PAYLOAD_STORE'),
+        region_name=environ.get('AWS_REGION', 'us-east-1')
+    )
+    return PayloadCodec(
+        store=store,
+        compress_threshold=int(environ.get('SQS_COMPRESS_THRESHOLD', 8192)),
+        offload_threshold=int(environ.get('SQS_OFFLOAD_THRESHOLD', MAX_MESSAGE_BYTES - 4096))
+    )
@@ -0,0 +1,275 @@
+import functools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from os import environ
+
+from flask import g, jsonify, request
+from flask_login import current_user
+
+from local_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(spec):
+    """Parse '10/minute' or '100/10 seconds' into (count, window_seconds)"""
+    count, _, period = spec.partition('/')
+    amount, _, unit = period.strip().rpartition(' ')
+    if unit not in PERIODS and unit.endswith('s'):
+        unit = unit[:-1]
+    if unit not in PERIODS:
+        raise ValueError(f"Invalid rate limit {spec}, expected e.g. '10/minute'")
+    return int(count), PERIODS[unit] * (int(amount) if amount else 1)
+
+
+class SlidingWindowCounter:
+    """
+    Sliding-window rate counter shared through memcached.
+
+    Each window has its own memcached counter; the current rate is the current
+    window's count plus the previous window's count weighted by how much of it
+    still overlaps the sliding window.
+
+    Hot keys take a local fast path: while a key is well under its limit
+    (below local_fraction of it), hits are counted in-process and pushed to
+    memcached in one incr at most every sync_interval seconds. Once a key is
+    over its limit it is blocked locally until it may pass again, so abusive
+    clients cost no memcached round trips. If memcached is unavailable the
+    counter falls back to per-process counting.
+    """
+
+    def __init__(self, cache, prefix='rl:', local_fraction=0.25, sync_interval=0.5, maxsize=10000):
+        self.cache = cache
+        self.prefix = prefix
+        self.local_fraction = local_fraction
+        self.sync_interval = sync_interval
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # key -> [window index, pending hits, last known total, last sync time, previous window count]
+        self._local = OrderedDict()
+        self._blocked = LRUCache(maxsize=maxsize)
+        self._counters = {'local_hits': 0, 'remote_syncs': 0, 'blocked_locally': 0, 'remote_errors': 0}
+
+    def _remote_add(self, key, delta, ttl):
+        """incr, creating the counter on first use; returns the new count or None if memcached failed"""
+        count = self.cache.incr(key, delta)
+        if count is None:
+            if self.cache.add(key, delta, ttl):
+                return delta
+            count = self.cache.incr(key, delta)
+        return count
+
+    def hit(self, key, limit, window):
+        """
+        Count one hit against key; returns (allowed, remaining, retry_after_seconds)
+        """
+        now = time.time()
+        index = int(now // window)
+        elapsed = (now % window) / window
+
+        blocked_until = self._blocked.get(key)
+        if blocked_until and blocked_until > now:
+            with self._lock:
+                self._counters['blocked_locally'] += 1
+            return False, 0, max(1, math.ceil(blocked_until - now))
+
+        with self._lock:
+            state = self._local.get(key)
+            if state is None or state[0] != index:
+                # The previous window's final count is read from memcached on the first sync
+                state = self._local[key] = [index, 0, 0, 0.0, None]
+                while len(self._local) > self.maxsize:
+                    self._local.popitem(last=False)
+            self._local.move_to_end(key)
+            estimate = (state[4] or 0) * (1 - elapsed) + state[2] + state[1] + 1
+            if estimate < limit * self.local_fraction and now - state[3] < self.sync_interval:
+                state[1] += 1
+                self._counters['local_hits'] += 1
+                return True, int(limit - estimate), 0
+            delta = state[1] + 1
+            state[1] = 0
+            state[3] = now
+            previous = state[4]
+
+        window_key = f"{self.prefix}{key}:{window}:{index}"
+        current = self._remote_add(window_key, delta, window * 2)
+        if previous is None:
+            previous = self.cache.get(f"{self.prefix}{key}:{window}:{index - 1}") or 0
+
+        with self._lock:
+            self._counters['remote_syncs'] += 1
+            state = self._local.get(key)
+            if current is None:
+                self._counters['remote_errors'] += 1
+                # memcached is unavailable: keep limiting with this process's own count
+                current = (state[2] if state else 0) + delta
+            if state is not None and state[0] == index:
+                state[2] = current
+                state[4] = previous
+
+        rate = previous * (1 - elapsed) + current
+        if rate > limit:
+            # Block until one more hit fits. The weighted previous window decays linearly; a
+            # full current window becomes the next window's previous count and decays from there
+            if previous and current < limit:
+                wait = (rate + 1 - limit) / previous * window
+            else:
+                wait = (1 - elapsed + max(0.0, 1 - (limit - 1) / current)) * window
+            retry_after = max(1, math.ceil(wait))
+            self._blocked.set(key, now + retry_after, ttl=retry_after)
+            return False, 0, retry_after
+        return True, max(0, int(limit - rate)), 0
+
+    def stats(self):
+        with self._lock:
+            return {'tracked_keys': len(self._local), 'blocked_keys': len(self._blocked), **self._counters}
+
+
+def key_ip():
+    return request.remote_addr or 'unknown'
+
+
+def key_user():
+    if current_user and current_user.is_authenticated:
+        return f"user:{current_user.get_id()}"
+    return f"ip:{key_ip()}"
+
+
+def key_endpoint():
+    return 'all'
+
+
+KEY_FUNCS = {'ip': key_ip, 'user': key_user, 'endpoint': key_endpoint}
+
+
+class RateLimiter:
+    """
+    Flask extension for per-route rate limits and per-worker load shedding.
+
+        limiter = RateLimiter(app, cache=mc)
+
+        @app.route('/login/', methods=['POST'])
+        @limiter.limit('10/minute', key='ip')
+        def login(): ...
+
+    key is 'ip', 'user' (falls back to the IP when anonymous), 'endpoint'
+    (one budget shared by every client) or a callable returning a string.
+    Limited requests get a 429 with Retry-After.
+
+    When more than max_in_flight requests are running in this worker, new
+    requests are shed with a 503 before any work is done. Endpoints in
+    shed_exempt (e.g. long-lived streams), /metrics and /internal/ are neither
+    counted nor shed.
+    """
+
+    def __init__(self, app=None, cache=None, enabled=True, max_in_flight=0, shed_exempt=()):
+        self.counter = SlidingWindowCounter(cache) if cache is not None else None
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self.shed_exempt = set(shed_exempt) | {'static', 'metrics'}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._counters = {'allowed': 0, 'limited': 0, 'shed': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['rate_limiter'] = self
+
+        @app.before_request
+        def shed_load():
+            if not self.max_in_flight or request.endpoint in self.shed_exempt or request.path.startswith('/internal/'):
+                return None
+            with self._lock:
+                if self._in_flight >= self.max_in_flight:
+                    self._counters['shed'] += 1
+                    shed = True
+                else:
+                    self._in_flight += 1
+                    shed = False
+            if shed:
+                logger.warning(f"Shedding {request.method} {request.path}: {self.max_in_flight} requests in flight")
+                return self._error_response(503, 'Server is busy, please retry shortly', 1)
+            g.rate_limit_in_flight = True
+            return None
+
+        @app.teardown_request
+        def release_in_flight(exc=None):
+            if g.pop('rate_limit_in_flight', False):
+                with self._lock:
+                    self._in_flight -= 1
+
+        @app.after_request
+        def add_rate_limit_headers(response):
+            info = g.get('rate_limit')
+            if info:
+                response.headers['X-RateLimit-Limit'] = str(info[0])
+                response.headers['X-RateLimit-Remaining'] = str(info[1])
+            return response
+
+    @staticmethod
+    def _error_response(status, message, retry_after):
+        headers = {'Retry-After': str(retry_after)}
+        if request.path.startswith('/api/') or request.accept_mimetypes.best == 'application/json':
+            return jsonify({'error': message, 'retry_after': retry_after}), status, headers
+        return f"{message}\n", status, {**headers, 'Content-Type': 'text/plain; charset=utf-8'}
+
+    def limit(self, spec, key='user', scope=None, methods=None, on_limit=None):
+        """
+        Decorator applying spec (e.g. '10/minute') per key. methods restricts the
+        limit to some HTTP methods; on_limit(retry_after) may build a custom response.
+        """
+        count, window = parse_limit(spec)
+        key_func = KEY_FUNCS[key] if isinstance(key, str) else key
+
+        def decorator(view):
+            limit_scope = scope or view.__name__
+
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or self.counter is None or (methods and request.method not in methods):
+                    return view(*args, **kwargs)
+                ident = key_func() or 'anonymous'
+                allowed, remaining, retry_after = self.counter.hit(f"{limit_scope}:{ident}", count, window)
+                if not allowed:
+                    with self._lock:
+                        self._counters['limited'] += 1
+                    logger.warning(f"Rate limit {spec} exceeded for {limit_scope} by {ident}")
+                    if on_limit is not None:
+                        return on_limit(retry_after)
+                    return self._error_response(429, 'Too many requests', retry_after)
+                with self._lock:
+                    self._counters['allowed'] += 1
+                previous = g.get('rate_limit')
+                if previous is None or remaining < previous[1]:
+                    g.rate_limit = (count, remaining)
+                return view(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            stats = {'in_flight': self._in_flight, 'max_in_flight': self.max_in_flight, **self._counters}
+        if self.counter is not None:
+            stats.update(self.counter.stats())
+        return stats
+
+
+def limiter_from_env(cache, app=None, shed_exempt=()):
+    """
+    RateLimiter configured from RATE_LIMIT_ENABLED and SHED_MAX_IN_FLIGHT (0 disables shedding)
+    """
+    return RateLimiter(
+        app,
+        cache=cache,
+        enabled=environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        max_in_flight=int(environ.get('SHED_MAX_IN_FLIGHT', 0)),
+        shed_exempt=shed_exempt
+    )
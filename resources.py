@@ -0,0 +1,68 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """
+    Process-local resources that must not be shared across fork(): network
+    clients, connection pools and background threads.
+
+    Each resource is registered with reopen(), which re-creates it in place,
+    and optionally close(), which releases it. With gunicorn --preload the app
+    is built once in the master; gunicorn.conf.py closes the master's
+    resources before the workers are forked and calls after_fork() in each
+    worker, which reopens them in registration order.
+    """
+
+    def __init__(self):
+        self._resources = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._reopen_seconds = {}
+
+    def register(self, name, reopen, close=None):
+        """Register a resource; registering a name again replaces it"""
+        with self._lock:
+            self._resources = [resource for resource in self._resources if resource[0] != name]
+            self._resources.append((name, reopen, close))
+
+    def after_fork(self):
+        """Re-create every resource in a newly forked process"""
+        # The parent may have held the lock at fork time
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        started = time.perf_counter()
+        timings = {}
+        for name, reopen, _ in list(self._resources):
+            resource_started = time.perf_counter()
+            reopen()
+            timings[name] = round(time.perf_counter() - resource_started, 4)
+        self._reopen_seconds = timings
+        logger.info(f"Re-created {len(timings)} resources in worker {self._pid} "
+                    f"in {time.perf_counter() - started:.3f}s")
+        return timings
+
+    def close_all(self):
+        """Release every resource, most recently registered first; errors are logged, not raised"""
+        with self._lock:
+            resources = list(reversed(self._resources))
+        for name, _, close in resources:
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f"Error closing resource {name}: {str(e)}")
+
+    def status(self):
+        with self._lock:
+            names = [name for name, _, _ in self._resources]
+        return {'pid': self._pid, 'resources': names, 'reopen_seconds': dict(self._reopen_seconds)}
+
+
+# Process-wide registry shared by the app factory and the gunicorn hooks
+resources = ResourceRegistry()
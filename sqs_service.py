@@ -1,14 +1,35 @@
-import boto3
 import json
 import logging
-from botocore.exceptions import ClientError
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from botocore.exceptions import BotoCoreError, ClientError
+
+from aws_clients import aws_client
+from fanout import fan_out
+from payload_store import FORMAT_ATTRIBUTE, PayloadCodec, PayloadError, message_size
 
 logger = logging.getLogger(__name__)
 
+# SendMessageBatch limits: 10 entries and 256 KB of payload per call
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 262144
+
+
+def json_attributes(message_attributes=None):
+    """message_attributes plus the marker for a body serialized with json.dumps"""
+    attributes = dict(message_attributes or {})
+    attributes[FORMAT_ATTRIBUTE] = {'DataType': 'String', 'StringValue': 'json'}
+    return attributes
+
 class SQSService:
-    def __init__(self, queue_url=None, region_name='us-east-1'):
-        self.sqs = boto3.client('sqs', region_name=region_name)
+    def __init__(self, queue_url=None, region_name='us-east-1', payload_codec=None):
+        self.region_name = region_name
+        self.sqs = aws_client('sqs', region_name=region_name)
         self.queue_url = queue_url
+        # Compresses large bodies and offloads oversized ones to the payload store
+        self.payload_codec = payload_codec or PayloadCodec()
         
         if not queue_url:
             try:
@@ -19,14 +40,22 @@ class SQSService:
                 logger.error(f"Error getting queue URL: {str(e)}")
                 raise
 
+    def reconnect(self):
+        """Re-create the SQS and payload store clients, e.g. in a forked worker"""
+        self.sqs = aws_client('sqs', region_name=self.region_name)
+        self.payload_codec.reconnect()
+
     def send_message(self, message_body, message_attributes=None):
         """
         Send a message to the SQS queue
         """
         try:
+            body, message_attributes = self.payload_codec.encode(
+                json.dumps(message_body), json_attributes(message_attributes)
+            )
             message_params = {
                 'QueueUrl': self.queue_url,
-                'MessageBody': json.dumps(message_body)
+                'MessageBody': body
             }
             
             if message_attributes:
@@ -36,45 +65,260 @@ class SQSService:
             logger.info(f"Message sent. MessageId: {response['MessageId']}")
             return True, response['MessageId']
             
-        except ClientError as e:
+        except (ClientError, BotoCoreError, PayloadError) as e:
             logger.error(f"Error sending message to SQS: {str(e)}")
             return False, str(e)
 
-    def receive_messages(self, max_messages=1, wait_time=0):
+    def _chunk_entries(self, entries):
         """
-        Receive messages from the SQS queue
+        Split (index, body, attributes, size) entries into batches that respect
+        the SendMessageBatch entry count and payload size limits
         """
+        batch, batch_bytes = [], 0
+        for entry in entries:
+            size = entry[3]
+            if batch and (len(batch) == MAX_BATCH_ENTRIES or batch_bytes + size > MAX_BATCH_BYTES):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(entry)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _batch_error(batch, code, error):
+        """The same error result for every entry of a batch that could not be sent"""
+        return [{
+            'index': index,
+            'status': 'error',
+            'code': code,
+            'error': str(error),
+            'sender_fault': False
+        } for index, *_ in batch]
+
+    def _send_batch(self, batch):
+        """Send one SendMessageBatch call; returns a result dict per entry"""
+        batch_entries = []
+        for index, body, message_attributes, _ in batch:
+            entry = {'Id': str(index), 'MessageBody': body}
+            if message_attributes:
+                entry['MessageAttributes'] = message_attributes
+            batch_entries.append(entry)
+
         try:
-            response = self.sqs.receive_message(
-                QueueUrl=self.queue_url,
-                MaxNumberOfMessages=max_messages,
-                WaitTimeSeconds=wait_time,
-                AttributeNames=['All'],
-                MessageAttributeNames=['All']
-            )
-            
-            messages = response.get('Messages', [])
-            return True, messages
-            
+            response = self.sqs.send_message_batch(QueueUrl=self.queue_url, Entries=batch_entries)
         except ClientError as e:
+            logger.error(f"Error sending message batch to SQS: {str(e)}")
+            return self._batch_error(batch, e.response['Error']['Code'], e)
+        except BotoCoreError as e:
+            # Transport errors (timeouts, connection failures) carry no error response
+            logger.error(f"Error sending message batch to SQS: {str(e)}")
+            return self._batch_error(batch, type(e).__name__, e)
+
+        results = []
+        for success in response.get('Successful', []):
+            results.append({'index': int(success['Id']), 'status': 'success', 'message_id': success['MessageId']})
+        for failure in response.get('Failed', []):
+            results.append({
+                'index': int(failure['Id']),
+                'status': 'error',
+                'code': failure['Code'],
+                'error': failure.get('Message', failure['Code']),
+                'sender_fault': failure['SenderFault']
+            })
+        return results
+
+    def send_entries(self, entries):
+        """
+        Send (body, message_attributes) entries whose bodies are JSON text with
+        SendMessageBatch, issuing the batches concurrently. Bodies are marked as
+        JSON and go through the payload codec first.
+
+        Returns one result dict per entry, in input order, with 'status' set to
+        'success' (plus 'message_id') or 'error' (plus 'code', 'error' and 'sender_fault').
+        """
+        results = [None] * len(entries)
+        sendable = []
+        for index, (body, message_attributes) in enumerate(entries):
+            try:
+                body, message_attributes = self.payload_codec.encode(body, json_attributes(message_attributes))
+            except PayloadError as e:
+                logger.error(f"Error offloading message payload: {str(e)}")
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'code': 'PayloadStoreError',
+                    'error': str(e),
+                    'sender_fault': False
+                }
+                continue
+            size = message_size(body, message_attributes)
+            if size > MAX_BATCH_BYTES:
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'code': 'MessageTooLong',
+                    'error': f"Message is {size} bytes, the SQS limit is {MAX_BATCH_BYTES}",
+                    'sender_fault': True
+                }
+            else:
+                sendable.append((index, body, message_attributes, size))
+
+        for batch_results in fan_out(self._send_batch, list(self._chunk_entries(sendable))):
+            for result in batch_results:
+                results[result['index']] = result
+
+        sent = sum(1 for result in results if result['status'] == 'success')
+        logger.info(f"Batch sent {sent}/{len(entries)} messages")
+        return results
+
+    def send_messages(self, message_bodies, message_attributes=None):
+        """
+        Send many messages to the SQS queue, 10 per SendMessageBatch call
+        """
+        entries = [(json.dumps(body), message_attributes) for body in message_bodies]
+        return self.send_entries(entries)
+
+    def _receive(self, max_messages, wait_time=0, visibility_timeout=None):
+        params = {
+            'QueueUrl': self.queue_url,
+            'MaxNumberOfMessages': max_messages,
+            'WaitTimeSeconds': wait_time,
+            'AttributeNames': ['All'],
+            'MessageAttributeNames': ['All']
+        }
+        if visibility_timeout is not None:
+            params['VisibilityTimeout'] = visibility_timeout
+        response = self.sqs.receive_message(**params)
+        return response.get('Messages', [])
+
+    def receive_messages(self, max_messages=1, wait_time=0, visibility_timeout=None):
+        """
+        Receive messages from the SQS queue. More than 10 messages are fetched
+        with concurrent ReceiveMessage calls of up to 10 each. visibility_timeout
+        overrides the queue's default; 0 peeks without hiding the messages.
+        """
+        try:
+            if max_messages <= MAX_BATCH_ENTRIES:
+                return True, self._receive(max_messages, wait_time, visibility_timeout)
+
+            sizes = [MAX_BATCH_ENTRIES] * (max_messages // MAX_BATCH_ENTRIES)
+            if max_messages % MAX_BATCH_ENTRIES:
+                sizes.append(max_messages % MAX_BATCH_ENTRIES)
+            messages = []
+            for received in fan_out(lambda size: self._receive(size, wait_time, visibility_timeout), sizes):
+                messages.extend(received)
+            return True, messages
+
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error receiving messages from SQS: {str(e)}")
             return False, str(e)
 
-    def delete_message(self, receipt_handle):
+    def message_body(self, message):
+        """
+        Original JSON text of a received message; offloaded payloads are fetched
+        from the payload store, so only call this when the body is needed
+        """
+        return self.payload_codec.decode(message)
+
+    def payload_ref(self, message):
+        """Claim-check reference of a received message, or None if its body is inline"""
+        return self.payload_codec.payload_ref(message)
+
+    def body_is_json(self, message):
+        """True if SQSService wrote the message, so its body needs no JSON validation"""
+        return self.payload_codec.is_json(message)
+
+    def delete_message(self, receipt_handle, payload_ref=None):
         """
-        Delete a message from the queue after processing
+        Delete a message from the queue after processing, along with its offloaded payload
         """
         try:
             self.sqs.delete_message(
                 QueueUrl=self.queue_url,
                 ReceiptHandle=receipt_handle
             )
+            if payload_ref:
+                self.payload_codec.delete([payload_ref])
             return True, "Message deleted successfully"
             
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error deleting message from SQS: {str(e)}")
             return False, str(e)
 
+    def _chunks(self, receipt_handles):
+        return [
+            receipt_handles[start:start + MAX_BATCH_ENTRIES]
+            for start in range(0, len(receipt_handles), MAX_BATCH_ENTRIES)
+        ]
+
+    def _delete_batch(self, chunk):
+        try:
+            response = self.sqs.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {'Id': str(i), 'ReceiptHandle': handle}
+                    for i, handle in enumerate(chunk)
+                ]
+            )
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Error deleting message batch from SQS: {str(e)}")
+            return list(chunk)
+        failed = []
+        for failure in response.get('Failed', []):
+            logger.error(f"Error deleting message from SQS: {failure.get('Message', failure['Code'])}")
+            failed.append(chunk[int(failure['Id'])])
+        return failed
+
+    def delete_messages(self, receipt_handles, payload_refs=None):
+        """
+        Delete many messages with concurrent DeleteMessageBatch calls, 10 per call.
+        payload_refs maps receipt handles to offloaded payloads to remove once
+        their message is deleted. Returns (success, failed_receipt_handles).
+        """
+        failed = [
+            handle
+            for chunk_failed in fan_out(self._delete_batch, self._chunks(receipt_handles))
+            for handle in chunk_failed
+        ]
+        if payload_refs:
+            failed_set = set(failed)
+            self.payload_codec.delete([
+                ref for handle, ref in payload_refs.items() if handle not in failed_set
+            ])
+        return not failed, failed
+
+    def _change_visibility_batch(self, chunk, visibility_timeout):
+        try:
+            response = self.sqs.change_message_visibility_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {'Id': str(i), 'ReceiptHandle': handle, 'VisibilityTimeout': visibility_timeout}
+                    for i, handle in enumerate(chunk)
+                ]
+            )
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Error changing message visibility batch: {str(e)}")
+            return list(chunk)
+        failed = []
+        for failure in response.get('Failed', []):
+            logger.error(f"Error changing message visibility: {failure.get('Message', failure['Code'])}")
+            failed.append(chunk[int(failure['Id'])])
+        return failed
+
+    def change_visibility(self, receipt_handles, visibility_timeout):
+        """
+        Change the visibility timeout of many in-flight messages with concurrent
+        batch calls, 10 per call. Returns (success, failed_receipt_handles).
+        """
+        failed = [
+            handle
+            for chunk_failed in fan_out(lambda chunk: self._change_visibility_batch(chunk, visibility_timeout),
+                                        self._chunks(receipt_handles))
+            for handle in chunk_failed
+        ]
+        return not failed, failed
+
     def process_messages(self, handler_function, max_messages=10):
         """
         Process messages using a handler function
@@ -84,19 +328,88 @@ class SQSService:
         if not success:
             return False, f"Error receiving messages: {messages}"
             
+        processed = []
+        payload_refs = {}
         for message in messages:
             try:
-                # Parse message body
-                message_body = json.loads(message['Body'])
+                # Parse message body, fetching it from the payload store if it was offloaded
+                message_body = json.loads(self.message_body(message))
                 
                 # Process message using handler function
                 handler_function(message_body)
-                
-                # Delete message after successful processing
-                self.delete_message(message['ReceiptHandle'])
+                processed.append(message['ReceiptHandle'])
+                ref = self.payload_ref(message)
+                if ref:
+                    payload_refs[message['ReceiptHandle']] = ref
                 
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}")
                 continue
+
+        # Delete successfully processed messages (and their payloads) in batches
+        if processed:
+            self.delete_messages(processed, payload_refs)
                 
-        return True, f"Processed {len(messages)} messages" 
\ No newline at end of file
+        return True, f"Processed {len(messages)} messages"
+
+
+class SQSSendAggregator:
+    """
+    Coalesces concurrent single sends into SendMessageBatch calls.
+
+    Callers block until their message has been sent; a flusher thread waits up to
+    linger_ms for more messages to arrive before sending a (partial) batch.
+    """
+
+    def __init__(self, sqs_service, linger_ms=20, timeout=10):
+        self.sqs_service = sqs_service
+        self.linger = linger_ms / 1000.0
+        self.timeout = timeout
+        self._pending = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='sqs-send-aggregator', daemon=True)
+                self._thread.start()
+
+    def send_message(self, message_body, message_attributes=None):
+        """
+        Same contract as SQSService.send_message: returns (success, message_id or error)
+        """
+        self._ensure_started()
+        future = Future()
+        self._pending.put(((json.dumps(message_body), message_attributes), future))
+        try:
+            result = future.result(timeout=self.timeout)
+        except Exception as e:
+            logger.error(f"Error sending aggregated message to SQS: {str(e)}")
+            return False, str(e)
+        if result['status'] == 'success':
+            return True, result['message_id']
+        return False, result['error']
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < MAX_BATCH_ENTRIES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = self.sqs_service.send_entries([entry for entry, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
@@ -196,6 +196,7 @@ resource "aws_instance" "flask_server" {
     ssh_public_key = tls_private_key.flask_key.public_key_openssh
     aws_region     = var.aws_region
     deployment_time = timestamp()
+    sqs_payload_bucket = aws_s3_bucket.sqs_payloads.bucket
   })
 
   tags = merge(local.common_tags, {
@@ -389,9 +390,11 @@ resource "aws_iam_role_policy" "flask_ssm_policy" {
         Effect = "Allow"
         Action = [
           "ssm:GetParameter",
-          "ssm:GetParameters"
+          "ssm:GetParameters",
+          "ssm:GetParametersByPath"
         ]
         Resource = [
+          "arn:aws:ssm:${var.aws_region}:${data.aws_caller_identity.current.account_id}:parameter/flask-app",
           "arn:aws:ssm:${var.aws_region}:${data.aws_caller_identity.current.account_id}:parameter/flask-app/*"
         ]
       }
@@ -435,7 +438,10 @@ resource "aws_iam_role_policy" "flask_ses_policy" {
         Effect = "Allow"
         Action = [
           "ses:SendEmail",
-          "ses:SendRawEmail"
+          "ses:SendRawEmail",
+          "ses:SendBulkTemplatedEmail",
+          "ses:CreateTemplate",
+          "ses:UpdateTemplate"
         ]
         Resource = "*"
       }
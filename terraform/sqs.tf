@@ -29,6 +29,7 @@ resource "aws_sqs_queue_policy" "flask_app_queue_policy" {
           "sqs:SendMessage",
           "sqs:ReceiveMessage",
           "sqs:DeleteMessage",
+          "sqs:ChangeMessageVisibility",
           "sqs:GetQueueAttributes"
         ]
         Resource = aws_sqs_queue.flask_app_queue.arn
@@ -57,6 +58,7 @@ resource "aws_iam_policy" "sqs_policy" {
           "sqs:SendMessage",
           "sqs:ReceiveMessage",
           "sqs:DeleteMessage",
+          "sqs:ChangeMessageVisibility",
           "sqs:GetQueueAttributes",
           "sqs:GetQueueUrl"
         ]
@@ -66,6 +68,64 @@ resource "aws_iam_policy" "sqs_policy" {
   })
 }
 
+# Claim-check store for message payloads too large to send inline
+resource "aws_s3_bucket" "sqs_payloads" {
+  bucket_prefix = "flask-app-sqs-payloads-"
+  force_destroy = true
+
+  tags = {
+    Environment = var.environment
+    Project     = "flask-app"
+  }
+}
+
+resource "aws_s3_bucket_public_access_block" "sqs_payloads" {
+  bucket = aws_s3_bucket.sqs_payloads.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+# Payloads are deleted with their message; expire any left behind once the message itself has expired
+resource "aws_s3_bucket_lifecycle_configuration" "sqs_payloads" {
+  bucket = aws_s3_bucket.sqs_payloads.id
+
+  rule {
+    id     = "expire-orphaned-payloads"
+    status = "Enabled"
+
+    filter {
+      prefix = "sqs-payloads/"
+    }
+
+    expiration {
+      days = 5 # queue retention is 4 days
+    }
+  }
+}
+
+resource "aws_iam_role_policy" "sqs_payloads_policy" {
+  name = "flask-app-sqs-payloads-policy"
+  role = aws_iam_role.flask_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:GetObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "${aws_s3_bucket.sqs_payloads.arn}/sqs-payloads/*"
+      }
+    ]
+  })
+}
+
 # Output the queue URL and ARN
 output "sqs_queue_url" {
   value = aws_sqs_queue.flask_app_queue.url
@@ -73,4 +133,8 @@ output "sqs_queue_url" {
 
 output "sqs_queue_arn" {
   value = aws_sqs_queue.flask_app_queue.arn
+}
+
+output "sqs_payload_bucket" {
+  value = aws_s3_bucket.sqs_payloads.bucket
 }
\ No newline at end of file
@@ -104,6 +104,17 @@ rm /etc/nginx/sites-enabled/default
 systemctl enable nginx
 systemctl restart nginx
 
+# Per-instance key for the encrypted SSM config snapshot shared by gunicorn workers
+if [ ! -f /etc/flask-app.env ]; then
+    echo "CONFIG_CACHE_KEY=$(head -c 32 /dev/urandom | base64)" > /etc/flask-app.env
+    echo "CONFIG_CACHE_PATH=/home/ubuntu/flask_test/.config-cache" >> /etc/flask-app.env
+    # gevent: one greenlet per request, so SQS/memcached waits don't pin a worker
+    echo "GUNICORN_WORKER_CLASS=gevent" >> /etc/flask-app.env
+    echo "GUNICORN_WORKER_CONNECTIONS=1000" >> /etc/flask-app.env
+    chown ubuntu:ubuntu /etc/flask-app.env
+    chmod 600 /etc/flask-app.env
+fi
+
 # Create systemd service for Flask app
 cat > /etc/systemd/system/flask.service <<EOL
 [Unit]
@@ -117,15 +128,52 @@ Environment="PATH=/home/ubuntu/flask_test/venv/bin:/usr/local/bin:/usr/bin:/bin"
 Environment="PYTHONPATH=/home/ubuntu/flask_test"
 Environment="AWS_DEFAULT_REGION=${aws_region}"
 Environment="AWS_REGION=${aws_region}"
+Environment="SQS_PAYLOAD_STORE=s3://${sqs_payload_bucket}/sqs-payloads/"
+EnvironmentFile=/etc/flask-app.env
+Environment="METRICS_DIR=/run/flask-app/metrics"
+Environment="JINJA_CACHE_DIR=/home/ubuntu/flask_test/.jinja-cache"
+# nginx sets X-Forwarded-For; shed load before the gevent worker runs out of connections
+Environment="TRUSTED_PROXIES=1"
+Environment="SHED_MAX_IN_FLIGHT=500"
+RuntimeDirectory=flask-app
 Type=simple
 Restart=always
 RestartSec=1
-ExecStart=/home/ubuntu/flask_test/venv/bin/gunicorn --workers 3 --bind 0.0.0.0:8000 app:app \
+ExecStartPre=/bin/rm -rf /run/flask-app/metrics
+# Tables and indexes added since the last deploy (e.g. the lower() lookup indexes); a no-op once they exist
+ExecStartPre=/home/ubuntu/flask_test/venv/bin/flask --app app:create_app init-db
+# Workers, bind address, worker class and --preload come from gunicorn.conf.py and /etc/flask-app.env
+ExecStart=/home/ubuntu/flask_test/venv/bin/gunicorn --config /home/ubuntu/flask_test/gunicorn.conf.py \
     --log-level debug \
     --error-logfile /home/ubuntu/flask_test/gunicorn_error.log \
     --access-logfile /home/ubuntu/flask_test/gunicorn_access.log \
-    --capture-output \
-    --timeout 120
+    --capture-output
+
+[Install]
+WantedBy=multi-user.target
+EOL
+
+# Create systemd service for the SQS consumer
+cat > /etc/systemd/system/flask-consumer.service <<EOL
+[Unit]
+Description=SQS consumer for Flask application
+After=network.target
+
+[Service]
+User=ubuntu
+WorkingDirectory=/home/ubuntu/flask_test
+Environment="PATH=/home/ubuntu/flask_test/venv/bin:/usr/local/bin:/usr/bin:/bin"
+Environment="PYTHONPATH=/home/ubuntu/flask_test"
+Environment="AWS_DEFAULT_REGION=${aws_region}"
+Environment="AWS_REGION=${aws_region}"
+Environment="SQS_PAYLOAD_STORE=s3://${sqs_payload_bucket}/sqs-payloads/"
+EnvironmentFile=/etc/flask-app.env
+Type=simple
+Restart=always
+RestartSec=1
+KillSignal=SIGTERM
+TimeoutStopSec=60
+ExecStart=/home/ubuntu/flask_test/venv/bin/python consumer.py --workers 4
 
 [Install]
 WantedBy=multi-user.target
@@ -135,4 +183,8 @@ EOL
 systemctl enable flask
 systemctl start flask
 
+# Start SQS consumer
+systemctl enable flask-consumer
+systemctl start flask-consumer
+
 echo "Setup completed - $(date)"
\ No newline at end of file
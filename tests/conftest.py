@@ -0,0 +1,20 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def memcached(monkeypatch):
+    """CacheClient backed by the benchmark's in-process memcached stand-in"""
+    import cache_client
+    from bench.fakes import FakePooledClient
+
+    monkeypatch.setattr(cache_client, 'PooledClient', FakePooledClient)
+    server = f"memcached-{uuid.uuid4().hex[:8]}:11211"
+    yield cache_client.CacheClient(server)
+    FakePooledClient._stores.pop(server, None)
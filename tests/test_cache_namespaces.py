@@ -0,0 +1,103 @@
+import pytest
+from flask import Flask
+
+import cache_namespaces
+import cache_routes
+from cache_namespaces import NamespacedCache
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1700000000.0)
+    monkeypatch.setattr(cache_namespaces, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def namespaces(memcached, clock):
+    # generation_ttl=0 reads the counter from memcached every time, as another worker would
+    return NamespacedCache(memcached, memcached, generation_ttl=0)
+
+
+def test_invalidate_bumps_generation_and_hides_old_keys(namespaces):
+    namespaces.set('users', 'page:1', 'cached')
+    generation = namespaces.generation('users')
+    assert generation == 1700000000000
+
+    assert namespaces.invalidate('users') == generation + 1
+    assert namespaces.generation('users') == generation + 1
+    assert namespaces.get('users', 'page:1') is None
+    assert namespaces.stats()['invalidations'] == 1
+
+
+def test_namespaces_are_independent(namespaces):
+    namespaces.set('users', 'k', 'u')
+    namespaces.set('orders', 'k', 'o')
+
+    namespaces.invalidate('users')
+
+    assert namespaces.get('users', 'k') is None
+    assert namespaces.get('orders', 'k') == 'o'
+
+
+def test_evicted_counter_moves_to_a_fresh_generation(namespaces, memcached, clock):
+    namespaces.set('users', 'k', 'old')
+    old = namespaces.generation('users')
+
+    memcached.delete(namespaces._generation_key('users'))
+    clock.now += 5
+
+    assert namespaces.generation('users') == old + 5000
+    assert namespaces.get('users', 'k') is None
+
+
+def test_invalidate_after_eviction_starts_a_fresh_counter(namespaces, memcached, clock):
+    old = namespaces.generation('users')
+
+    memcached.delete(namespaces._generation_key('users'))
+    clock.now += 1
+
+    assert namespaces.invalidate('users') == old + 1000
+    assert namespaces.invalidate('users') == old + 1001
+
+
+@pytest.fixture
+def client(namespaces, monkeypatch):
+    monkeypatch.setattr(cache_routes, 'namespaces', namespaces)
+    app = Flask(__name__)
+    app.config['LOGIN_DISABLED'] = True
+    app.register_blueprint(cache_routes.cache_bp)
+    return app.test_client()
+
+
+def test_namespace_routes(client):
+    assert client.post('/api/cache/namespaces/users', json={'key': 'k', 'value': 'v'}).status_code == 200
+    assert client.get('/api/cache/namespaces/users/k').get_json()['value'] == 'v'
+    generation = client.get('/api/cache/namespaces/users').get_json()['generation']
+
+    response = client.post('/api/cache/namespaces/users/invalidate')
+    assert response.status_code == 200
+    assert response.get_json()['generation'] == generation + 1
+    assert client.get('/api/cache/namespaces/users/k').status_code == 404
+
+
+def test_key_named_invalidate_uses_the_key_rule(client):
+    client.post('/api/cache/namespaces/users', json={'key': 'invalidate', 'value': 'v'})
+    generation = client.get('/api/cache/namespaces/users').get_json()['generation']
+
+    assert client.get('/api/cache/namespaces/users/invalidate').get_json()['value'] == 'v'
+    assert client.delete('/api/cache/namespaces/users/invalidate').status_code == 200
+    assert client.get('/api/cache/namespaces/users').get_json()['generation'] == generation
+
+
+def test_invalid_namespace_is_rejected(client):
+    assert client.get('/api/cache/namespaces/bad%20name').status_code == 400
+    assert client.post('/api/cache/namespaces/bad%20name/invalidate').status_code == 400
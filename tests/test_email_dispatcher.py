@@ -0,0 +1,127 @@
+from unittest import mock
+
+import pytest
+from botocore.exceptions import (
+    EndpointConnectionError, NoCredentialsError, NoRegionError, ParamValidationError, ReadTimeoutError
+)
+
+import email_dispatcher
+from aws_clients import CircuitOpenError
+from email_dispatcher import EmailDispatcher, EmailJob
+
+TEMPLATE = 'flask-app-welcome'
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = EmailDispatcher(mock.Mock(), workers=1, max_retries=3, backoff_base=0.5)
+    dispatcher._available_templates.add(TEMPLATE)
+    return dispatcher
+
+
+def job(recipient):
+    return EmailJob(recipient, 'Welcome', 'Hi', template=TEMPLATE, template_data={'username': recipient})
+
+
+@pytest.mark.parametrize('status', ['TransientFailure', 'AccountThrottled'])
+def test_transient_bulk_status_is_requeued_with_backoff(dispatcher, status):
+    sent, failed = job('sent@example.com'), job('retry@example.com')
+    dispatcher.email_service.send_bulk_templated_email.return_value = ['Success', status]
+
+    with mock.patch.object(email_dispatcher.threading, 'Timer') as timer:
+        dispatcher._send_bulk(TEMPLATE, [sent, failed])
+
+    timer.assert_called_once()
+    delay = timer.call_args.args[0]
+    assert 0.25 <= delay <= 0.5
+    assert timer.call_args.kwargs['args'] == (failed,)
+    timer.return_value.start.assert_called_once()
+
+    # Fire the timer: the job goes back on the queue
+    timer.call_args.args[1](*timer.call_args.kwargs['args'])
+    assert dispatcher.queue.get_nowait() is failed
+    stats = dispatcher.stats()
+    assert stats['sent'] == 1
+    assert stats['retried'] == 1
+    assert stats['failed'] == 0
+
+
+def test_permanent_bulk_status_is_not_retried(dispatcher):
+    dispatcher.email_service.send_bulk_templated_email.return_value = ['MessageRejected', 'Success']
+
+    with mock.patch.object(email_dispatcher.threading, 'Timer') as timer:
+        dispatcher._send_bulk(TEMPLATE, [job('a@example.com'), job('b@example.com')])
+
+    timer.assert_not_called()
+    assert dispatcher.stats()['failed'] == 1
+
+
+def test_transient_bulk_status_gives_up_after_max_retries(dispatcher):
+    retried = job('retry@example.com')
+    retried.attempts = dispatcher.max_retries
+    dispatcher.email_service.send_bulk_templated_email.return_value = ['TransientFailure', 'Success']
+
+    with mock.patch.object(email_dispatcher.threading, 'Timer') as timer:
+        dispatcher._send_bulk(TEMPLATE, [retried, job('b@example.com')])
+
+    timer.assert_not_called()
+    assert dispatcher.stats()['failed'] == 1
+
+
+def test_open_circuit_retries_after_the_breaker_reopens(dispatcher):
+    waiting = EmailJob('a@example.com', 'Welcome', 'Hi')
+    dispatcher.email_service.deliver.side_effect = CircuitOpenError('ses', 'SendEmail', 12.0)
+
+    with mock.patch.object(email_dispatcher.threading, 'Timer') as timer:
+        dispatcher._send_single(waiting)
+
+    timer.assert_called_once()
+    delay = timer.call_args.args[0]
+    assert 12.0 <= delay <= 12.0 + dispatcher.backoff_base * 2
+    # The call never reached SES, so it doesn't count against max_retries
+    assert waiting.attempts == 0
+    assert dispatcher.stats()['retried'] == 1
+    assert dispatcher.stats()['failed'] == 0
+
+
+def test_open_circuit_retries_every_job_of_a_bulk_send(dispatcher):
+    jobs = [job('a@example.com'), job('b@example.com')]
+    dispatcher.email_service.send_bulk_templated_email.side_effect = CircuitOpenError(
+        'ses', 'SendBulkTemplatedEmail', 5.0
+    )
+
+    with mock.patch.object(email_dispatcher.threading, 'Timer') as timer:
+        dispatcher._send_bulk(TEMPLATE, jobs)
+
+    assert timer.call_count == 2
+    assert all(call.args[0] >= 5.0 for call in timer.call_args_list)
+    assert [j.attempts for j in jobs] == [0, 0]
+
+
+@pytest.mark.parametrize('error, retried', [
+    (ReadTimeoutError(endpoint_url='https://email.us-east-1.amazonaws.com'), True),
+    (EndpointConnectionError(endpoint_url='https://email.us-east-1.amazonaws.com'), True),
+    (NoCredentialsError(), False),
+    (NoRegionError(), False),
+    (ParamValidationError(report='Invalid type for parameter Destination'), False),
+])
+def test_only_transport_errors_are_retried(dispatcher, error, retried):
+    dispatcher.email_service.deliver.side_effect = error
+
+    with mock.patch.object(email_dispatcher.threading, 'Timer') as timer:
+        dispatcher._send_single(EmailJob('a@example.com', 'Welcome', 'Hi'))
+
+    assert timer.called is retried
+    assert dispatcher.stats()['failed'] == (0 if retried else 1)
+
+
+def test_exit_handler_is_registered_once():
+    dispatcher = EmailDispatcher(mock.Mock(), workers=1)
+    with mock.patch.object(email_dispatcher.atexit, 'register') as register:
+        dispatcher.start()
+        dispatcher.shutdown(timeout=1)
+        dispatcher.reset_after_fork()
+        dispatcher.start()
+        dispatcher.shutdown(timeout=1)
+
+    register.assert_called_once_with(dispatcher.shutdown)
@@ -0,0 +1,66 @@
+import json
+import os
+import signal
+import subprocess
+
+import pytest
+
+from metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0.05)
+    yield registry
+    registry.stop()
+
+
+def test_collect_retires_snapshots_of_exited_processes(registry, tmp_path):
+    registry.inc('requests_total', 3)
+    registry.register_gauges('queue', lambda: {'depth': 1})
+    exited = subprocess.Popen(['true'])
+    exited.wait()
+    (tmp_path / f"{exited.pid}.json").write_text(json.dumps({
+        'histograms': {},
+        'counters': {registry._key('requests_total', {}): 5},
+        'gauges': {registry._key('queue_depth', {'pid': str(exited.pid)}): 7}
+    }))
+
+    _, counters, gauges = registry.collect()
+
+    assert counters[registry._key('requests_total', {})] == 8
+    assert list(gauges) == [registry._key('queue_depth', {'pid': str(os.getpid())})]
+    assert not (tmp_path / f"{exited.pid}.json").exists()
+    # Retired totals are kept, and counted only once
+    _, counters, _ = registry.collect()
+    assert counters[registry._key('requests_total', {})] == 8
+
+
+def test_stop_ends_the_writer_and_removes_the_snapshot(registry, tmp_path):
+    registry.start()
+    registry.flush()
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+    registry.stop()
+
+    assert registry._thread is None
+    assert not (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_after_fork_replaces_a_lock_held_by_the_parent(registry):
+    registry.start()
+    registry._lock.acquire()
+    pid = os.fork()
+    if pid == 0:
+        # A deadlock in the child is reported by the alarm instead of hanging the suite
+        signal.alarm(5)
+        try:
+            registry.after_fork()
+            registry.observe('latency_seconds', 0.1)
+            registry.inc('requests_total')
+            os._exit(0 if registry._thread.is_alive() else 1)
+        except BaseException:
+            os._exit(1)
+    registry._lock.release()
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
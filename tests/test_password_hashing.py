@@ -0,0 +1,70 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from password_hashing import HashingOverloaded, PasswordHasher
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_generate_and_check():
+    hasher = PasswordHasher(max_concurrency=1, max_queue=0, method='pbkdf2:sha256:1000')
+    pwhash = hasher.generate('secret')
+    assert hasher.check(pwhash, 'secret')
+    assert not hasher.check(pwhash, 'wrong')
+    assert hasher.stats()['completed'] == 3
+
+
+def test_rejects_when_every_slot_is_taken():
+    hasher = PasswordHasher(max_concurrency=1, max_queue=0, method='pbkdf2:sha256:1000')
+    assert hasher._slots.acquire(blocking=False)
+    with pytest.raises(HashingOverloaded):
+        hasher.generate('secret')
+    assert hasher.stats()['rejected'] == 1
+
+
+def test_hashing_does_not_stall_other_greenlets():
+    # Monkey-patching is process-wide, so run the gevent side in a fresh interpreter
+    script = textwrap.dedent("""
+        from gevent import monkey
+        monkey.patch_all()
+        import time
+        import gevent
+        from password_hashing import PasswordHasher
+
+        hasher = PasswordHasher(max_concurrency=2, max_queue=4, method='pbkdf2:sha256:600000')
+        gaps = []
+
+        def ticker():
+            last = time.perf_counter()
+            while True:
+                gevent.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        tick = gevent.spawn(ticker)
+        started = time.perf_counter()
+        gevent.joinall([gevent.spawn(hasher.generate, 'secret') for _ in range(2)], raise_error=True)
+        elapsed = time.perf_counter() - started
+        tick.kill()
+        print(f"{elapsed:.3f} {max(gaps, default=elapsed):.3f}")
+    """)
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    elapsed, max_gap = map(float, result.stdout.split())
+    # The hashes take a while, yet the ticker keeps running the whole time
+    assert elapsed > 0.1
+    assert max_gap < elapsed / 2
+
+
+def test_concurrent_batches_are_rejected(monkeypatch):
+    import threading
+    import password_hashing
+    monkeypatch.setattr(password_hashing, '_batch_slots', threading.BoundedSemaphore(1))
+    password_hashing._batch_slots.acquire()
+    with pytest.raises(HashingOverloaded):
+        password_hashing.hash_passwords(['secret'])
@@ -0,0 +1,160 @@
+import threading
+
+import pytest
+from flask import Flask
+
+import rate_limit
+from rate_limit import RateLimiter, SlidingWindowCounter
+
+WINDOW = 60
+# Start of a window, so the clock's offset is also the elapsed fraction of it
+T0 = 1000 * WINDOW
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(T0)
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    return clock
+
+
+def window_key(key, now):
+    return f"rl:{key}:{WINDOW}:{int(now // WINDOW)}"
+
+
+def test_hits_under_the_local_fraction_skip_memcached(memcached, clock):
+    counter = SlidingWindowCounter(memcached, local_fraction=0.25, sync_interval=0.5)
+
+    for _ in range(5):
+        assert counter.hit('k', 100, WINDOW)[0]
+    # The first hit syncs, the next four are counted in-process
+    assert memcached.get(window_key('k', clock.now)) == 1
+    assert counter.stats()['local_hits'] == 4
+
+    clock.now += 0.5
+    allowed, remaining, _ = counter.hit('k', 100, WINDOW)
+    assert allowed
+    assert memcached.get(window_key('k', clock.now)) == 6
+    assert remaining == 94
+    assert counter.stats()['remote_syncs'] == 2
+
+
+def test_previous_window_is_weighted_after_rollover(memcached, clock):
+    counter = SlidingWindowCounter(memcached, local_fraction=0)
+
+    clock.now = T0 + 54
+    assert all(counter.hit('k', 10, WINDOW)[0] for _ in range(10))
+    assert counter.hit('k', 10, WINDOW) == (False, 0, 17)
+
+    # Halfway through the next window the 11 hits above still weigh 5.5
+    clock.now = T0 + WINDOW + 30
+    assert counter.hit('k', 10, WINDOW) == (True, 3, 0)
+
+
+def test_retry_after_waits_until_the_next_hit_fits(memcached, clock):
+    counter = SlidingWindowCounter(memcached, local_fraction=0)
+    memcached.add(window_key('k', T0 - WINDOW), 11, 2 * WINDOW)
+
+    clock.now = T0 + 30
+    assert all(counter.hit('k', 10, WINDOW)[0] for _ in range(4))
+    # 11 * 0.5 + 5 = 10.5; one more hit fits once the previous window's weight drops by 1.5
+    allowed, _, retry_after = counter.hit('k', 10, WINDOW)
+    assert not allowed
+    assert retry_after == 9
+
+    clock.now += 8
+    assert counter.hit('k', 10, WINDOW) == (False, 0, 1)
+    assert counter.stats()['blocked_locally'] == 1
+
+    clock.now += 1
+    assert counter.hit('k', 10, WINDOW)[0]
+
+
+def test_full_window_blocks_until_the_next_window_has_room(memcached, clock):
+    counter = SlidingWindowCounter(memcached, local_fraction=0)
+
+    clock.now = T0 + 45
+    assert all(counter.hit('k', 4, WINDOW)[0] for _ in range(4))
+    # 5 hits carry over with full weight: wait out this window plus 2/5 of the next
+    assert counter.hit('k', 4, WINDOW) == (False, 0, 39)
+
+    clock.now += 39
+    assert counter.hit('k', 4, WINDOW)[0]
+
+
+def test_memcached_failure_falls_back_to_local_counting(memcached, clock, monkeypatch):
+    def down(*args, **kwargs):
+        raise OSError('connection refused')
+
+    for client in memcached.clients.values():
+        for method in ('get', 'add', 'incr'):
+            monkeypatch.setattr(client, method, down)
+    counter = SlidingWindowCounter(memcached, local_fraction=0)
+
+    assert [counter.hit('k', 3, WINDOW)[0] for _ in range(4)] == [True, True, True, False]
+    assert counter.stats()['remote_errors'] == 4
+
+
+@pytest.fixture
+def app(memcached):
+    app = Flask(__name__)
+    limiter = RateLimiter(app, cache=memcached, max_in_flight=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    @app.route('/api/slow')
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    @app.route('/api/fast')
+    @limiter.limit('2/minute', key='ip')
+    def fast():
+        return 'fast'
+
+    app.limiter, app.started, app.release = limiter, started, release
+    return app
+
+
+def test_requests_over_max_in_flight_are_shed(app):
+    client = app.test_client()
+    slow = threading.Thread(target=client.get, args=('/api/slow',))
+    slow.start()
+    try:
+        assert app.started.wait(5)
+        response = client.get('/api/fast')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert response.get_json()['retry_after'] == 1
+    finally:
+        app.release.set()
+        slow.join(5)
+
+    assert client.get('/api/fast').status_code == 200
+    stats = app.limiter.stats()
+    assert stats['shed'] == 1
+    assert stats['in_flight'] == 0
+
+
+def test_limited_route_answers_429_with_headers(app, clock):
+    client = app.test_client()
+
+    first = client.get('/api/fast')
+    assert first.headers['X-RateLimit-Limit'] == '2'
+    assert first.headers['X-RateLimit-Remaining'] == '1'
+    assert client.get('/api/fast').status_code == 200
+
+    limited = client.get('/api/fast')
+    assert limited.status_code == 429
+    # 3 hits carry into the next window, where 2/3 of them must decay before one more fits
+    assert limited.headers['Retry-After'] == '100'
+    assert app.limiter.stats()['limited'] == 1
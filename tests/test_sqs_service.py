@@ -0,0 +1,81 @@
+from unittest import mock
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+import sqs_service
+from sqs_service import SQSService
+
+QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/123456789012/flask-app-queue'
+
+
+@pytest.fixture
+def sqs_client():
+    client = mock.Mock()
+    with mock.patch.object(sqs_service, 'aws_client', return_value=client):
+        yield client
+
+
+@pytest.mark.parametrize('error', [
+    ReadTimeoutError(endpoint_url=QUEUE_URL),
+    EndpointConnectionError(endpoint_url=QUEUE_URL),
+])
+def test_send_messages_reports_transport_errors_per_entry(sqs_client, error):
+    sqs_client.send_message_batch.side_effect = error
+    service = SQSService(queue_url=QUEUE_URL)
+
+    results = service.send_messages([{'n': n} for n in range(12)])
+
+    assert len(results) == 12
+    assert [result['index'] for result in results] == list(range(12))
+    for result in results:
+        assert result['status'] == 'error'
+        assert result['code'] == type(error).__name__
+        assert result['sender_fault'] is False
+
+
+def test_send_messages_reports_client_error_code(sqs_client):
+    sqs_client.send_message_batch.side_effect = ClientError(
+        {'Error': {'Code': 'AWS.SimpleQueueService.NonExistentQueue', 'Message': 'no queue'}},
+        'SendMessageBatch'
+    )
+    service = SQSService(queue_url=QUEUE_URL)
+
+    results = service.send_messages([{'n': 1}])
+
+    assert results[0]['status'] == 'error'
+    assert results[0]['code'] == 'AWS.SimpleQueueService.NonExistentQueue'
+
+
+def test_aggregator_delivers_transport_errors_to_callers(sqs_client):
+    sqs_client.send_message_batch.side_effect = ReadTimeoutError(endpoint_url=QUEUE_URL)
+    aggregator = sqs_service.SQSSendAggregator(SQSService(queue_url=QUEUE_URL), linger_ms=1, timeout=5)
+
+    success, error = aggregator.send_message({'n': 1})
+
+    assert success is False
+    assert 'Read timeout' in error
+
+
+def test_sent_bodies_are_marked_as_json(sqs_client):
+    sqs_client.send_message.return_value = {'MessageId': 'single'}
+    sqs_client.send_message_batch.return_value = {'Successful': [{'Id': '0', 'MessageId': 'batch'}], 'Failed': []}
+    service = SQSService(queue_url=QUEUE_URL)
+
+    service.send_message({'n': 1}, {'Kind': {'DataType': 'String', 'StringValue': 'test'}})
+    service.send_messages([{'n': 2}])
+
+    single = sqs_client.send_message.call_args.kwargs
+    batch_entry = sqs_client.send_message_batch.call_args.kwargs['Entries'][0]
+    for attributes in (single['MessageAttributes'], batch_entry['MessageAttributes']):
+        assert service.body_is_json({'MessageAttributes': attributes})
+    assert single['MessageAttributes']['Kind']['StringValue'] == 'test'
+
+
+def test_foreign_bodies_are_not_trusted(sqs_client):
+    service = SQSService(queue_url=QUEUE_URL)
+
+    assert not service.body_is_json({'Body': 'plain text'})
+    assert not service.body_is_json({'Body': '{}', 'MessageAttributes': {
+        'PayloadFormat': {'DataType': 'String', 'StringValue': 'xml'}
+    }})
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from local_cache import LRUCache
+from user_cache import UserCache
+
+
+def row(user_id):
+    return SimpleNamespace(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com")
+
+
+@pytest.fixture
+def cache(memcached):
+    return UserCache(LRUCache(maxsize=16, ttl=60), memcached, remote_ttl=300, tombstone_ttl=60)
+
+
+def test_tombstone_hides_deleted_user(cache):
+    cache.get(1, row)
+    cache.tombstone(1)
+
+    loader_calls = []
+    assert cache.get(1, lambda uid: loader_calls.append(uid) or row(uid)) is None
+    assert loader_calls == []
+
+
+def test_stale_load_does_not_overwrite_tombstone(cache, memcached):
+    def load_then_delete(uid):
+        # The row was read just before a concurrent delete committed
+        user = row(uid)
+        cache.tombstone(uid)
+        return user
+
+    cache.get(1, load_then_delete)
+
+    assert memcached.get(cache._key(1)) == {'deleted': True}
+    # A fresh worker-local tier falls through to memcached and sees the tombstone
+    other_worker = UserCache(LRUCache(maxsize=16, ttl=60), memcached)
+    assert other_worker.get(1, row) is None
+
+
+def test_invalidate_clears_tombstone_for_reused_id(cache):
+    cache.get(1, row)
+    cache.tombstone(1)
+    cache.invalidate(1)
+
+    user = cache.get(1, lambda uid: SimpleNamespace(id=uid, username='newowner', email='new@example.com'))
+    assert user.username == 'newowner'
+    assert cache.get(1, row).username == 'newowner'
@@ -0,0 +1,67 @@
+import io
+import json
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+import user_import
+from models import db, User
+from user_import import import_users, parse_upload
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    # Hashing is covered elsewhere; keep these tests fast
+    monkeypatch.setattr(user_import, 'hash_passwords', lambda passwords: [f"hashed:{p}" for p in passwords])
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def upload(rows, filename='users.jsonl'):
+    data = ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def test_non_string_fields_are_reported_per_row(app):
+    report, created = import_users(parse_upload(upload([
+        {'username': 5, 'password': 'x'},
+        {'username': 'bob', 'password': ['x']},
+        {'username': 'carol', 'password': 'x', 'email': {'a': 1}},
+        {'username': 'dave', 'password': 'x', 'email': 'dave@example.com'},
+    ])))
+
+    assert report['created'] == 1
+    assert [error['line'] for error in report['errors']] == [1, 2, 3]
+    assert report['errors'][0]['error'] == 'username must be a string'
+    assert report['errors'][1]['error'] == 'password must be a string'
+    assert report['errors'][2]['error'] == 'email must be a string'
+    assert created == [{'username': 'dave', 'email': 'dave@example.com'}]
+    assert User.query.filter_by(username='dave').one().password == 'hashed:x'
+
+
+def test_rows_beyond_the_limit_are_rejected(app, monkeypatch):
+    monkeypatch.setattr(user_import, 'MAX_IMPORT_ROWS', 2)
+    report, _ = import_users(parse_upload(upload([
+        {'username': f"user{i}", 'password': 'x'} for i in range(3)
+    ])))
+
+    assert report['created'] == 2
+    assert report['errors'] == [{'line': 3, 'error': 'Import is limited to 2 rows'}]
+
+
+def test_csv_with_duplicates_and_existing_users(app):
+    db.session.add(User(username='taken', password='x'))
+    db.session.commit()
+    data = b'\xef\xbb\xbfusername,password,email\nnew,x,new@example.com\ntaken,x,\nnew,y,\n'
+
+    report, created = import_users(parse_upload(FileStorage(stream=io.BytesIO(data), filename='users.csv')))
+
+    assert report['created'] == 1
+    assert {error['line'] for error in report['errors']} == {3, 4}
+    assert created == [{'username': 'new', 'email': 'new@example.com'}]
@@ -0,0 +1,175 @@
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from local_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """A fetch in progress that concurrent callers for the same key can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class TwoTierCache:
+    """
+    Per-process near cache (bounded LRU with per-key TTL) in front of memcached.
+
+    - Concurrent misses for the same key are coalesced: one caller fetches from
+      memcached, the others wait for its result.
+    - Entries are refreshed early with probability rising as they approach expiry
+      (XFetch), and the old value is served while the refresh runs, so a hot key
+      expiring doesn't send every worker thread to memcached at once.
+    - Entries stay readable for stale_ttl past expiry while a refresh is in flight.
+    - Background refreshes run on at most refresh_workers threads, so a burst of
+      keys nearing expiry queues up instead of starting a thread per key.
+
+    Other workers can see a value that was overwritten elsewhere for up to ttl seconds.
+    """
+
+    def __init__(self, remote, maxsize=10000, ttl=5, stale_ttl=5, beta=1.0, wait_timeout=2, enabled=True,
+                 refresh_workers=4):
+        self.remote = remote
+        self.refresh_workers = refresh_workers
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.beta = beta
+        self.wait_timeout = wait_timeout
+        self.enabled = enabled
+        self.near = LRUCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._counters = {
+            'near_hits': 0, 'stale_hits': 0, 'misses': 0, 'remote_hits': 0,
+            'remote_misses': 0, 'coalesced': 0, 'early_refreshes': 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _should_refresh_early(self, expires_at, delta):
+        # XFetch: -delta * beta * log(rand) grows as rand -> 0, so the chance of
+        # an early refresh rises as we get closer to expiry
+        now = time.monotonic()
+        return now - delta * self.beta * math.log(random.random() or 1e-12) >= expires_at
+
+    def get(self, key):
+        if not self.enabled:
+            value = self.remote.get(key)
+            self._count('remote_hits' if value is not None else 'remote_misses')
+            return value
+
+        entry = self.near.get(key)
+        if entry is not None:
+            value, expires_at, delta = entry
+            if time.monotonic() < expires_at:
+                if self._should_refresh_early(expires_at, delta) and self._start_flight(key, background=True):
+                    self._count('early_refreshes')
+                self._count('near_hits')
+                return value
+            # Expired but still within the stale window: serve it while one caller refreshes
+            self._start_flight(key, background=True)
+            self._count('stale_hits')
+            return value
+
+        self._count('misses')
+        return self._fetch_coalesced(key)
+
+    def _start_flight(self, key, background):
+        """
+        Register a fetch for key. Returns False if one is already running.
+        """
+        with self._lock:
+            if key in self._flights:
+                return False
+            flight = _Flight()
+            self._flights[key] = flight
+        if background:
+            self._get_executor().submit(self._fetch, key, flight)
+        return True
+
+    def _get_executor(self):
+        """Lazily create the refresh pool, re-creating it after a fork"""
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                    thread_name_prefix='near-cache-refresh')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _fetch_coalesced(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if leader:
+            return self._fetch(key, flight)
+
+        self._count('coalesced')
+        if flight.event.wait(self.wait_timeout):
+            return flight.value
+        # The leader is taking too long; go to memcached ourselves
+        return self.remote.get(key)
+
+    def _fetch(self, key, flight):
+        started = time.monotonic()
+        try:
+            value = self.remote.get(key)
+            if value is not None:
+                self._count('remote_hits')
+                delta = time.monotonic() - started
+                self.near.set(key, (value, time.monotonic() + self.ttl, delta))
+            else:
+                self._count('remote_misses')
+                self.near.delete(key)
+            flight.value = value
+            return value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def set(self, key, value, expire=0):
+        success = self.remote.set(key, value, expire)
+        if self.enabled:
+            if success:
+                self.near.set(key, (value, time.monotonic() + min(self.ttl, expire or self.ttl), 0.0))
+            else:
+                self.near.delete(key)
+        return success
+
+    def delete(self, key):
+        self.near.delete(key)
+        return self.remote.delete(key)
+
+    def forget(self, keys):
+        """Drop keys from this worker's near cache only"""
+        for key in keys:
+            self.near.delete(key)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['near_hits'] + counters['stale_hits'] + counters['misses']
+        return {
+            'near_enabled': self.enabled,
+            'near_size': len(self.near),
+            'near_capacity': self.near.maxsize,
+            'near_hit_ratio': round((counters['near_hits'] + counters['stale_hits']) / lookups, 4) if lookups else None,
+            'in_flight': len(self._flights),
+            **counters
+        }
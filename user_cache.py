@@ -0,0 +1,79 @@
+import logging
+
+from models import User
+
+logger = logging.getLogger(__name__)
+
+# Columns kept in the cache; the password hash never leaves the database
+CACHED_FIELDS = ('id', 'username', 'email')
+
+# Stored in memcached in place of a deleted user
+TOMBSTONE = {'deleted': True}
+
+
+class UserCache:
+    """
+    Read-through identity cache for User rows used by Flask-Login: a short-TTL
+    in-process LRU in front of memcached, in front of Postgres.
+
+    The local tier TTL bounds how long another worker can keep serving a user
+    after it has been invalidated, so keep it to a few seconds.
+
+    Loaded users are written to memcached with add(), never set(), and a
+    deleted user is replaced by a tombstone for tombstone_ttl seconds. A
+    worker that read the row just before the delete committed therefore
+    can't put it back in memcached afterwards.
+    """
+
+    def __init__(self, local_cache, remote_cache, remote_ttl=300, prefix='user:', tombstone_ttl=60):
+        self.local = local_cache
+        self.remote = remote_cache
+        self.remote_ttl = remote_ttl
+        self.prefix = prefix
+        self.tombstone_ttl = tombstone_ttl
+
+    def _key(self, user_id):
+        return f"{self.prefix}{user_id}"
+
+    @staticmethod
+    def _to_user(data):
+        # Detached instance: enough for current_user, never added to a session
+        return User(**data)
+
+    def get(self, user_id, loader):
+        """
+        Return the User for user_id, calling loader(user_id) only on a full miss
+        """
+        key = self._key(user_id)
+        data = self.local.get(key)
+        if data is not None:
+            return self._to_user(data)
+
+        data = self.remote.get(key)
+        if data == TOMBSTONE:
+            return None
+        if data is not None:
+            self.local.set(key, data)
+            return self._to_user(data)
+
+        user = loader(user_id)
+        if user is None:
+            return None
+        data = {field: getattr(user, field) for field in CACHED_FIELDS}
+        self.local.set(key, data)
+        # add(), so a tombstone written meanwhile by a delete is not overwritten
+        self.remote.add(key, data, self.remote_ttl)
+        return user
+
+    def invalidate(self, user_id):
+        key = self._key(user_id)
+        self.local.delete(key)
+        self.remote.delete(key)
+        logger.debug(f"Invalidated cached user {user_id}")
+
+    def tombstone(self, user_id):
+        """Mark a deleted user so no worker serves or re-caches it"""
+        key = self._key(user_id)
+        self.local.delete(key)
+        self.remote.set(key, TOMBSTONE, self.tombstone_ttl)
+        logger.debug(f"Tombstoned cached user {user_id}")
@@ -0,0 +1,153 @@
+import codecs
+import csv
+import json
+import logging
+from os import environ
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User
+from password_hashing import hash_passwords
+
+logger = logging.getLogger(__name__)
+
+# Every row is hashed within the request, so keep imports well inside gunicorn's timeout
+# (scrypt takes ~0.1s per password per process)
+MAX_IMPORT_ROWS = int(environ.get('USER_IMPORT_MAX_ROWS', 500))
+INSERT_BATCH_SIZE = 1000
+LOOKUP_BATCH_SIZE = 1000
+
+
+def parse_upload(file_storage):
+    """
+    Yield (line_number, row_dict) from a CSV (with header) or JSONL upload
+    """
+    filename = (file_storage.filename or '').lower()
+    # Large uploads are spooled to a SpooledTemporaryFile, which TextIOWrapper rejects before Python 3.11
+    text = codecs.getreader('utf-8-sig')(file_storage.stream)
+    if filename.endswith(('.jsonl', '.ndjson', '.json')) or file_storage.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        for line_number, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, {'_error': f"Invalid JSON: {str(e)}"}
+                continue
+            yield line_number, row if isinstance(row, dict) else {'_error': 'Expected a JSON object'}
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _existing(column, values):
+    """Return the subset of values already present in column, a few IN queries at a time"""
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        chunk = values[start:start + LOOKUP_BATCH_SIZE]
+        found.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+def _insert_batch(rows, report):
+    try:
+        db.session.execute(insert(User), [row['values'] for row in rows])
+        db.session.commit()
+        report['created'] += len(rows)
+        return rows
+    except IntegrityError:
+        # Someone created a conflicting user meanwhile; retry row by row to find it
+        db.session.rollback()
+
+    created = []
+    for row in rows:
+        try:
+            db.session.execute(insert(User), [row['values']])
+            db.session.commit()
+            report['created'] += 1
+            created.append(row)
+        except IntegrityError:
+            db.session.rollback()
+            report['errors'].append({'line': row['line'], 'error': 'Username or email already exists'})
+    return created
+
+
+def import_users(rows):
+    """
+    Validate, dedupe, hash and insert users from (line_number, row_dict) pairs.
+
+    Returns (report, created_users) where report has total/created/failed counts and
+    per-row errors, and created_users is a list of {'username', 'email'} dicts.
+    """
+    report = {'total': 0, 'created': 0, 'failed': 0, 'errors': []}
+    candidates = []
+    seen_usernames, seen_emails = set(), set()
+
+    for line_number, row in rows:
+        report['total'] += 1
+        if report['total'] > MAX_IMPORT_ROWS:
+            report['errors'].append({'line': line_number, 'error': f'Import is limited to {MAX_IMPORT_ROWS} rows'})
+            break
+        if '_error' in row:
+            report['errors'].append({'line': line_number, 'error': row['_error']})
+            continue
+
+        invalid = [
+            field for field in ('username', 'password', 'email')
+            if row.get(field) is not None and not isinstance(row[field], str)
+        ]
+        if invalid:
+            report['errors'].append({'line': line_number, 'error': f"{', '.join(invalid)} must be a string"})
+            continue
+
+        username = (row.get('username') or '').strip()
+        password = row.get('password') or ''
+        email = (row.get('email') or '').strip() or None
+        if not username or not password:
+            report['errors'].append({'line': line_number, 'error': 'username and password are required'})
+            continue
+        if username in seen_usernames:
+            report['errors'].append({'line': line_number, 'error': f'Duplicate username {username} in file'})
+            continue
+        if email and email in seen_emails:
+            report['errors'].append({'line': line_number, 'error': f'Duplicate email {email} in file'})
+            continue
+        seen_usernames.add(username)
+        if email:
+            seen_emails.add(email)
+        candidates.append({'line': line_number, 'username': username, 'email': email, 'password': password})
+
+    existing_usernames = _existing(User.username, seen_usernames)
+    existing_emails = _existing(User.email, seen_emails)
+    valid = []
+    for candidate in candidates:
+        if candidate['username'] in existing_usernames:
+            report['errors'].append({'line': candidate['line'], 'error': f"Username {candidate['username']} already exists"})
+        elif candidate['email'] and candidate['email'] in existing_emails:
+            report['errors'].append({'line': candidate['line'], 'error': f"Email {candidate['email']} already exists"})
+        else:
+            valid.append(candidate)
+
+    hashes = hash_passwords(candidate['password'] for candidate in valid)
+    prepared = [
+        {
+            'line': candidate['line'],
+            'values': {'username': candidate['username'], 'email': candidate['email'], 'password': hashed}
+        }
+        for candidate, hashed in zip(valid, hashes)
+    ]
+
+    created = []
+    for start in range(0, len(prepared), INSERT_BATCH_SIZE):
+        created.extend(_insert_batch(prepared[start:start + INSERT_BATCH_SIZE], report))
+
+    report['errors'].sort(key=lambda error: error['line'])
+    report['failed'] = len(report['errors'])
+    logger.info(f"User import: {report['created']} created, {report['failed']} failed of {report['total']}")
+    return report, [
+        {'username': row['values']['username'], 'email': row['values']['email']} for row in created
+    ]
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+
+from sqlalchemy import func, select, text
+
+from models import db, User
+
+# Filtered counts stop here; anything above is reported as "at least"
+COUNT_CAP = 1000
+
+# Columns included in exports; the password hash is never selected
+EXPORT_COLUMNS = ('id', 'username', 'email')
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_filter(q):
+    """
+    Case-insensitive username/email prefix match, served by the lower() text_pattern_ops indexes
+    """
+    if not q:
+        return None
+    pattern = _escape_like(q.strip().lower()) + '%'
+    return db.or_(
+        func.lower(User.username).like(pattern, escape='\\'),
+        func.lower(User.email).like(pattern, escape='\\')
+    )
+
+
+def page_users(per_page, after_id=None, before_id=None, q=None):
+    """
+    Keyset-paginate users by id.
+
+    Returns (users, next_after_id, prev_before_id); the cursors are None when
+    there is no page in that direction.
+    """
+    query = User.query
+    condition = search_filter(q)
+    if condition is not None:
+        query = query.filter(condition)
+
+    if before_id is not None:
+        rows = (query.filter(User.id < before_id)
+                .order_by(User.id.desc())
+                .limit(per_page + 1)
+                .all())
+        has_more = len(rows) > per_page
+        users = list(reversed(rows[:per_page]))
+        next_after = users[-1].id if users else None
+        prev_before = users[0].id if users and has_more else None
+        return users, next_after, prev_before
+
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    rows = query.order_by(User.id).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    users = rows[:per_page]
+    next_after = users[-1].id if users and has_more else None
+    prev_before = users[0].id if users and after_id is not None else None
+    return users, next_after, prev_before
+
+
+def approximate_user_count(q=None):
+    """
+    Return (count, is_estimate) without scanning the whole table.
+
+    Unfiltered counts come from the planner's row estimate in pg_class;
+    filtered counts are exact up to COUNT_CAP.
+    """
+    condition = search_filter(q)
+    if condition is None and db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+            {'table': db.engine.dialect.identifier_preparer.quote(User.__table__.name)}
+        ).scalar()
+        # -1 / NULL means the table has never been analyzed; it is small enough to count
+        if estimate is not None and estimate >= 0:
+            return int(estimate), True
+
+    capped = select(User.id)
+    if condition is not None:
+        capped = capped.where(condition)
+    capped = capped.limit(COUNT_CAP + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(capped)).scalar()
+    if count > COUNT_CAP:
+        return COUNT_CAP, True
+    return count, False
+
+
+def iter_user_rows(q=None, yield_per=1000):
+    """
+    Stream (id, username, email) rows through a server-side cursor
+    """
+    query = select(*(getattr(User, column) for column in EXPORT_COLUMNS)).order_by(User.id)
+    condition = search_filter(q)
+    if condition is not None:
+        query = query.where(condition)
+    result = db.session.execute(query.execution_options(yield_per=yield_per))
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+
+def _chunked(lines, chunk_size):
+    """Group small strings into chunks of roughly chunk_size characters"""
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_users_ndjson(q=None, chunk_size=65536):
+    lines = (json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in iter_user_rows(q))
+    return _chunked(lines, chunk_size)
+
+
+def export_users_csv(q=None, chunk_size=65536):
+    def lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in iter_user_rows(q):
+            writer.writerow(row)
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return lines()